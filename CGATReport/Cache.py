@@ -1,15 +1,202 @@
 import os
-import shelve
+import time
+import glob
+import inspect
+import json
+import hashlib
 import pickle
 import six
+import sys
+import copy
+import tempfile
+import threading
+import uuid
+import contextlib
+import collections
+
+import numpy
+import pandas
 
 from CGATReport.Component import Component
 from CGATReport import Utils
 from CGATReport.Types import force_encode
 
+try:
+    import pyarrow
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+try:
+    import fcntl
+except ImportError:
+    # no locking on systems without fcntl
+    fcntl = None
+
+
+# suffix of the file describing a cached entry
+META_SUFFIX = ".meta"
+
+# suffix of the file used to lock an entry
+LOCK_SUFFIX = ".lock"
+
+# prefix of temporary files
+TMP_PREFIX = ".tmp-"
+
+# suffixes of the files holding the data of a cached entry
+FORMAT_SUFFIXES = {"parquet": ".parquet",
+                   "npy": ".npy",
+                   "pickle": ".pickle"}
+
+# arrays within nested data larger than this are stored in
+# separate files and memory mapped when loaded
+MIN_MAPPED_BYTES = 64 * 1024
+
+# suffixes of files created by the shelve based cache
+LEGACY_SUFFIXES = ("", ".db", ".dat", ".dir", ".bak")
+
+
+# default size of the in-memory cache in megabytes
+DEFAULT_MEMORY_MB = 512
+
+# the process-wide in-memory cache, see get_memory_cache()
+MEMORY_CACHE = None
+
+
+def estimate_size(data):
+    '''return an estimate of the memory used by *data* in bytes.'''
+    if isinstance(data, pandas.DataFrame):
+        return int(data.memory_usage(index=True, deep=True).sum())
+    elif isinstance(data, pandas.Series):
+        return int(data.memory_usage(index=True, deep=True))
+    elif isinstance(data, numpy.memmap):
+        # mapped data do not occupy process memory
+        return sys.getsizeof(data)
+    elif isinstance(data, numpy.ndarray):
+        return data.nbytes
+    elif isinstance(data, dict):
+        return sys.getsizeof(data) + sum(
+            [estimate_size(x) + estimate_size(y) for x, y in data.items()])
+    elif isinstance(data, (list, tuple, set)):
+        return sys.getsizeof(data) + sum([estimate_size(x) for x in data])
+    return sys.getsizeof(data)
+
+
+def copy_data(data):
+    '''return a copy of *data* that can be modified by the caller.
+
+    Read-only arrays are not copied.
+    '''
+    if isinstance(data, (pandas.DataFrame, pandas.Series)):
+        return data.copy()
+    elif isinstance(data, numpy.ndarray):
+        if data.flags.writeable:
+            return data.copy()
+        return data
+    elif isinstance(data, dict):
+        try:
+            return data.__class__(
+                [(x, copy_data(y)) for x, y in data.items()])
+        except TypeError:
+            return copy.deepcopy(data)
+    elif isinstance(data, (list, tuple)) and \
+            type(data) in (list, tuple):
+        return type(data)([copy_data(x) for x in data])
+    elif isinstance(data, six.string_types + six.integer_types +
+                    (float, bool, bytes, numpy.generic, type(None))):
+        return data
+    return copy.deepcopy(data)
+
 
-# Python 3 - bsddb.db not available
-# import bsddb.db
+class MemoryCache(object):
+
+    '''in-memory cache of data shared by all caches within a process.
+
+    Items are evicted in least-recently-used order once the
+    estimated size of all items exceeds *max_bytes*. Items
+    are copied when they are stored and retrieved.
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, fingerprint=None):
+        '''return a tuple (found, data) for *key*.
+
+        If *fingerprint* is given, items with a different fingerprint
+        are treated as missing.
+        '''
+        with self._lock:
+            try:
+                item_fingerprint, data, size = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return False, None
+            if fingerprint is not None and item_fingerprint != fingerprint:
+                self.misses += 1
+                return False, None
+            # move to end - most recently used
+            del self._data[key]
+            self._data[key] = (item_fingerprint, data, size)
+            self.hits += 1
+        return True, copy_data(data)
+
+    def put(self, key, data, fingerprint=None):
+        '''store *data* under *key*.'''
+        size = estimate_size(data)
+        if size > self.max_bytes:
+            self.remove(key)
+            return
+        data = copy_data(data)
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[2]
+            self._data[key] = (fingerprint, data, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                k, item = self._data.popitem(last=False)
+                self.nbytes -= item[2]
+
+    def remove(self, key):
+        '''remove *key* from cache.'''
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[2]
+
+    def clear(self):
+        '''remove all items from cache.'''
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def getStatistics(self):
+        '''return a dictionary with cache statistics.'''
+        return {"items": len(self._data),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses}
+
+
+def get_memory_cache():
+    '''return the process-wide in-memory cache.
+
+    The size of the cache is set by the configuration
+    variable ``report_cache_memory_mb``.
+    '''
+    global MEMORY_CACHE
+    if MEMORY_CACHE is None:
+        size = Utils.PARAMS.get("report_cache_memory_mb", DEFAULT_MEMORY_MB)
+        MEMORY_CACHE = MemoryCache(int(float(size) * 1024 * 1024))
+    return MEMORY_CACHE
 
 
 def tracker2key(tracker):
@@ -26,16 +213,188 @@ def tracker2key(tracker):
     return Utils.quote_filename(".".join((modulename, name)))
 
 
+def tracker2fingerprint(tracker, options=None):
+    '''return a fingerprint of a tracker.
+
+    The fingerprint is derived from the tracker's source code, the
+    options the tracker has been called with and the state of the
+    data sources the tracker reports through its
+    :meth:`getDataSources` method.
+    '''
+    # import here to avoid loading all plugins
+    from CGATReport.Capabilities import get_code
+
+    if inspect.isfunction(tracker):
+        cls = tracker
+    else:
+        cls = tracker.__class__
+
+    try:
+        code = "".join(get_code(cls.__name__, inspect.getsourcefile(cls)))
+    except (TypeError, IOError, OSError):
+        code = ""
+
+    try:
+        sources = tracker.getDataSources()
+    except AttributeError:
+        sources = []
+
+    if options is None:
+        options = {}
+
+    fingerprint = hashlib.md5()
+    fingerprint.update(code.encode("utf-8"))
+    fingerprint.update(repr(sorted(
+        [(str(x), repr(y)) for x, y in options.items()])).encode("utf-8"))
+    fingerprint.update(repr(sources).encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+def key2filename(key):
+    '''return basename of the files storing *key*.'''
+    if not isinstance(key, bytes):
+        key = key.encode("utf-8")
+    return hashlib.md5(key).hexdigest()
+
+
+class ArrayReference(object):
+
+    '''placeholder for an array stored in a separate file.'''
+
+    def __init__(self, index):
+        self.index = index
+
+
+def is_plain_array(data):
+    '''return True if *data* is an array that can be saved without
+    pickling.'''
+    return isinstance(data, numpy.ndarray) and \
+        not isinstance(data, numpy.matrix) and \
+        not data.dtype.hasobject
+
+
+def extract_arrays(data, arrays):
+    '''replace large arrays in nested *data* by placeholders.
+
+    The arrays are appended to *arrays*. Dictionaries, lists and
+    tuples are traversed.
+
+    Returns the data with placeholders.
+    '''
+    if is_plain_array(data) and data.nbytes >= MIN_MAPPED_BYTES:
+        arrays.append(data)
+        return ArrayReference(len(arrays) - 1)
+    elif isinstance(data, dict):
+        try:
+            return data.__class__(
+                [(x, extract_arrays(y, arrays)) for x, y in data.items()])
+        except TypeError:
+            return data
+    elif type(data) in (list, tuple):
+        return type(data)([extract_arrays(x, arrays) for x in data])
+    return data
+
+
+def restore_arrays(data, arrays):
+    '''replace placeholders in *data* by arrays.'''
+    if isinstance(data, ArrayReference):
+        return arrays[data.index]
+    elif isinstance(data, dict):
+        try:
+            return data.__class__(
+                [(x, restore_arrays(y, arrays)) for x, y in data.items()])
+        except TypeError:
+            return data
+    elif type(data) in (list, tuple):
+        return type(data)([restore_arrays(x, arrays) for x in data])
+    return data
+
+
+def get_array_filename(filename, index):
+    '''return filename of array *index* of an entry.'''
+    return "%s.%i%s" % (filename, index, FORMAT_SUFFIXES["npy"])
+
+
+def load_array(filename):
+    '''load array from *filename*.
+
+    Large arrays are memory mapped and read-only.
+    '''
+    if os.path.getsize(filename) >= MIN_MAPPED_BYTES:
+        return numpy.load(filename, mmap_mode="r", allow_pickle=False)
+    return numpy.load(filename, allow_pickle=False)
+
+
+def save_data(outfile, data):
+    '''save *data* to the file object *outfile*.
+
+    DataFrames are stored in Parquet format if it is available and
+    numpy arrays in ``.npy`` format. All other objects are pickled.
+
+    Returns the format that has been used.
+    '''
+    if HAS_PARQUET and isinstance(data, pandas.DataFrame):
+        try:
+            data.to_parquet(outfile)
+            return "parquet"
+        except Exception:
+            # not all dataframes can be represented in parquet,
+            # for example those with non-string column names.
+            outfile.seek(0)
+            outfile.truncate()
+
+    if is_plain_array(data):
+        numpy.save(outfile, data, allow_pickle=False)
+        return "npy"
+
+    pickle.dump(data, outfile, pickle.HIGHEST_PROTOCOL)
+    return "pickle"
+
+
+def load_data(filename, fmt):
+    '''load data saved by :func:`save_data` in format *fmt*.'''
+    fn = filename + FORMAT_SUFFIXES[fmt]
+    if fmt == "parquet":
+        return pandas.read_parquet(fn)
+    elif fmt == "npy":
+        return load_array(fn)
+    elif fmt == "pickle":
+        with open(fn, "rb") as inf:
+            return pickle.load(inf)
+    raise ValueError("unknown cache format '%s'" % fmt)
+
+
 class Cache(Component):
 
-    '''persistent storage for tracker results.'''
+    '''persistent storage for tracker results.
+
+    Each cache is a directory within ``report_cachedir``. Every key
+    is stored in separate files, a data file and a small file with
+    meta information. All files are written to a temporary file first
+    and then renamed, thus readers never see partially written files.
+
+    The data of each write are saved under a new versioned name and
+    the meta information, which refers to this version, is written
+    last. Renaming the meta file is the only step that changes an
+    entry, thus readers either see the previous or the new data, but
+    never a mix of both. Data of the superseded version are removed
+    afterwards.
+
+    Reading requires no locking. Writers that want to avoid computing
+    the same data in several processes can hold a lock on a key with
+    :meth:`lock`.
+
+    If *fingerprint* is given, it is stored with each entry. Entries
+    with a different fingerprint are treated as missing.
+    '''
 
-    def __init__(self, cache_name, mode="a"):
+    def __init__(self, cache_name, mode="a", fingerprint=None):
 
         Component.__init__(self)
 
+        self.fingerprint = fingerprint
+
         self.cache_filename = None
-        self._cache = None
         self.cache_name = cache_name
         if "report_cachedir" in Utils.PARAMS:
             self.cache_dir = Utils.PARAMS["report_cachedir"]
@@ -44,94 +403,162 @@ class Cache(Component):
 
         if self.cache_dir:
 
-            try:
-                os.mkdir(self.cache_dir)
-            except OSError as msg:
-                pass
-
-            if not os.path.exists(self.cache_dir):
-                raise OSError("could not create directory %s: %s" %
-                              (self.cache_dir, msg))
-
             self.cache_filename = os.path.join(self.cache_dir,
                                                cache_name)
 
             if mode == "r":
-                if not os.path.exists(self.cache_filename):
+                if not os.path.isdir(self.cache_filename):
                     raise ValueError("cache %s does not exist at %s" %
                                      (self.cache_name,
                                       self.cache_filename))
+            else:
+                self.removeLegacyCache()
+                try:
+                    os.makedirs(self.cache_filename)
+                except OSError:
+                    pass
 
-            # on Windows XP, the shelve does not work, work without cache
-            try:
-                self._cache = shelve.open(
-                    self.cache_filename, "c", writeback=False)
-                self.debug("disp%s: using cache %s" %
-                           (id(self), self.cache_filename))
-                self.debug("disp%s: keys in cache: %s" %
-                           (id(self,), str(list(self._cache.keys()))))
-            # except bsddb.db.DBFileExistsError as msg:
-            except OSError as msg:
-                self.warn(
-                    "disp%s: could not open cache %s - continuing without. Error = %s" %
-                    (id(self), self.cache_filename, msg))
-                self.cache_filename = None
-                self._cache = None
+                if not os.path.isdir(self.cache_filename):
+                    self.warn(
+                        "disp%s: could not create cache %s - continuing "
+                        "without" % (id(self), self.cache_filename))
+                    self.cache_filename = None
+                    return
+
+            self.debug("disp%s: using cache %s" %
+                       (id(self), self.cache_filename))
         else:
             self.debug("disp%s: not using cache" % (id(self),))
 
-    def __del__(self):
+    def removeLegacyCache(self):
+        '''remove a shelve based cache of the same name.'''
+        for suffix in LEGACY_SUFFIXES:
+            fn = self.cache_filename + suffix
+            if os.path.isfile(fn):
+                self.warn("removing outdated cache file %s" % fn)
+                os.unlink(fn)
 
-        if self._cache is None:
-            return
-        self._cache.close()
-        self._cache = None
+    def getFilename(self, key):
+        '''return filename without suffix for *key*.'''
+        return os.path.join(self.cache_filename, key2filename(key))
+
+    def getDataFilename(self, key, meta):
+        '''return filename without suffix of the data of *key*
+        described by *meta*.
+
+        Entries written before data were versioned do not record
+        their data file and use the name of the key.
+        '''
+        if meta.get("data"):
+            return os.path.join(self.cache_filename, meta["data"])
+        return self.getFilename(key)
+
+    def getMeta(self, key):
+        '''return meta information for *key*.
+
+        Returns None if key is not in cache.
+        '''
+        fn = self.getFilename(key) + META_SUFFIX
+        try:
+            with open(fn) as inf:
+                return json.load(inf)
+        except (IOError, OSError):
+            return None
+        except ValueError as msg:
+            self.warn("could not read meta information for key '%s' "
+                      "from '%s': msg=%s" % (key, fn, msg))
+            return None
 
     def keys(self):
         '''return keys in cache.'''
-        if self._cache is not None:
-            return sorted(self._cache.keys())
-        else:
+        if self.cache_filename is None:
             return []
 
+        keys = []
+        for fn in glob.glob(os.path.join(self.cache_filename,
+                                         "*" + META_SUFFIX)):
+            try:
+                with open(fn) as inf:
+                    keys.append(json.load(inf)["key"])
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+        return sorted(keys)
+
+    def __contains__(self, key):
+        if self.cache_filename is None:
+            return False
+        return os.path.exists(self.getFilename(key) + META_SUFFIX)
+
     def __getitem__(self, key):
         '''return data in cache.
+
+        Data are taken from the in-memory cache if present.
         '''
 
-        if self._cache is None:
+        if self.cache_filename is None:
             raise KeyError("no cache - key `%s` does not exist" % str(key))
 
         if six.PY2:
             key = force_encode(key)
 
-        try:
-            if key in self._cache:
-                result = self._cache[key]
-                if result is not None:
-                    self.debug(
-                        "retrieved data for key '%s' from cache" % (key))
-                else:
-                    self.warn(
-                        "retrieved None data for key '%s' from cache" % (key))
-            else:
-                self.debug("key '%s' not found in cache" % key)
-                raise KeyError("cache does not contain %s" % str(key))
+        memory_cache = get_memory_cache()
+        found, result = memory_cache.get((self.cache_filename, key),
+                                         self.fingerprint)
+        if found:
+            self.debug("retrieved data for key '%s' from memory" % key)
+            return result
+
+        meta = self.getMeta(key)
+        if meta is None or meta.get("key") != key:
+            self.debug("key '%s' not found in cache" % key)
+            raise KeyError("cache does not contain %s" % str(key))
 
-        # except (bsddb.db.DBPageNotFoundError, bsddb.db.DBAccessError,
-        # pickle.UnpicklingError, ValueError, EOFError) as msg:
-        except (pickle.UnpicklingError, ValueError, EOFError) as msg:
+        if self.fingerprint is not None and \
+           meta.get("fingerprint") != self.fingerprint:
+            self.debug("key '%s' in cache is outdated" % key)
+            raise KeyError("cache contains outdated %s" % str(key))
+
+        try:
+            try:
+                result = self.loadEntry(key, meta)
+            except (IOError, OSError):
+                # the data might have been superseded by a concurrent
+                # write after the meta information has been read.
+                new_meta = self.getMeta(key)
+                if new_meta is None or new_meta == meta:
+                    raise
+                meta = new_meta
+                result = self.loadEntry(key, meta)
+        except (pickle.UnpicklingError, ValueError, EOFError,
+                KeyError, IOError, OSError) as msg:
             self.warn("could not get key '%s' or value for key in '%s': msg=%s" %
                       (key,
                        self.cache_filename,
                        msg))
             raise KeyError("cache could not retrieve %s" % str(key))
 
+        memory_cache.put((self.cache_filename, key), result,
+                         meta.get("fingerprint"))
+
+        # record time of last access for garbage collection
+        try:
+            os.utime(self.getFilename(key) + META_SUFFIX, None)
+        except OSError:
+            pass
+
+        if result is not None:
+            self.debug(
+                "retrieved data for key '%s' from cache" % (key))
+        else:
+            self.warn(
+                "retrieved None data for key '%s' from cache" % (key))
+
         return result
 
     def __setitem__(self, key, data):
         '''save data in cache.
         '''
-        if self._cache is None:
+        if self.cache_filename is None:
             return
 
         if six.PY2:
@@ -140,21 +567,200 @@ class Cache(Component):
             if isinstance(key, bytes):
                 raise ValueError("key '{}' is a byte string".format(key))
 
-        # do not store data frames in cache until
-        # best method is clear
+        filename = self.getFilename(key)
+        previous = self.getMeta(key)
+        # data are saved under a new name, the entry is only replaced
+        # once the meta information refers to it.
+        data_filename = "%s.%s" % (filename, uuid.uuid4().hex)
         try:
-            self._cache[key] = data
+            # large arrays within nested data are saved separately
+            arrays = []
+            if isinstance(data, (dict, list, tuple)):
+                nested = extract_arrays(data, arrays)
+            else:
+                nested = data
+            for x, array in enumerate(arrays):
+                self.writeAtomic(
+                    get_array_filename(data_filename, x),
+                    lambda outf: numpy.save(outf, array, allow_pickle=False),
+                    add_suffix=False)
+            fmt = self.writeAtomic(
+                data_filename, lambda outf: save_data(outf, nested))
+            self.writeAtomic(
+                filename + META_SUFFIX,
+                lambda outf: outf.write(json.dumps(
+                    {"key": key,
+                     "format": fmt,
+                     "data": os.path.basename(data_filename),
+                     "arrays": len(arrays),
+                     "fingerprint": self.fingerprint}).encode("utf-8")),
+                add_suffix=False)
+            get_memory_cache().put((self.cache_filename, key), data,
+                                   self.fingerprint)
             self.debug("saved data for key '%s' in cache" % key)
-        # except (bsddb.db.DBPageNotFoundError,bsddb.db.DBAccessError) as
-        # msg:
-        except (OSError) as msg:
+        except (OSError, IOError, TypeError, pickle.PicklingError) as msg:
             self.warn("could not save key '%s' from '%s': msg=%s" %
                       (key,
                        self.cache_filename,
                        msg))
-        # The following sync call is absolutely necessary when
-        # using the multiprocessing library (python
-        # 2.6.1). Otherwise the cache is emptied somewhere before
-        # the final call to close(). Even necessary, if writeback
-        # = False
-        self._cache.sync()
+            self.removeData(data_filename)
+            get_memory_cache().remove((self.cache_filename, key))
+            return
+
+        # remove data of the superseded version
+        if previous is not None:
+            self.removeData(self.getDataFilename(key, previous))
+
+    def writeAtomic(self, filename, write_f, add_suffix=True):
+        '''write to *filename* using the function *write_f*.
+
+        *write_f* is called with a file object of a temporary file
+        in the cache directory. Once the function has finished, the
+        temporary file is renamed. If *add_suffix* is True, the
+        return value of *write_f* is the format of the data and the
+        matching suffix is added to *filename*.
+
+        Returns the return value of *write_f*.
+        '''
+        fd, tmpfile = tempfile.mkstemp(dir=self.cache_filename,
+                                       prefix=TMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as outf:
+                result = write_f(outf)
+            if add_suffix:
+                filename += FORMAT_SUFFIXES[result]
+            os.replace(tmpfile, filename)
+        except:
+            if os.path.exists(tmpfile):
+                os.unlink(tmpfile)
+            raise
+        return result
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        '''lock *key* for computing and writing its data.
+
+        The lock is exclusive across processes. It is only advisory,
+        reading does not require it.
+        '''
+        if self.cache_filename is None or fcntl is None:
+            yield
+            return
+
+        with open(self.getFilename(key) + LOCK_SUFFIX, "a") as outf:
+            fcntl.flock(outf.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(outf.fileno(), fcntl.LOCK_UN)
+
+    def loadEntry(self, key, meta):
+        '''load data of *key* described by *meta*.'''
+        filename = self.getDataFilename(key, meta)
+        result = load_data(filename, meta["format"])
+        if meta.get("arrays"):
+            result = restore_arrays(
+                result,
+                [load_array(get_array_filename(filename, x))
+                 for x in range(meta["arrays"])])
+        return result
+
+    def removeData(self, filename):
+        '''remove data and array files of a version of an entry.'''
+        for suffix in FORMAT_SUFFIXES.values():
+            try:
+                os.unlink(filename + suffix)
+            except OSError:
+                pass
+        self.removeArrays(filename)
+
+    def removeArrays(self, filename, start=0):
+        '''remove array files of an entry starting from *start*.'''
+        index = start
+        while os.path.exists(get_array_filename(filename, index)):
+            os.unlink(get_array_filename(filename, index))
+            index += 1
+
+
+def get_entries(cache_dir):
+    '''return a list of all entries in *cache_dir*.
+
+    Each entry is a tuple of (last access time, size in bytes,
+    tracker, list of filenames). The time of last access is the
+    modification time of the meta file, which is updated whenever an
+    entry is read. Data files without meta information and temporary
+    files left behind by interrupted processes are returned as
+    entries as well. Lock files are not part of any entry, as
+    removing a lock that is held would let other processes take it.
+    '''
+    entries = []
+    for root, dirs, files in os.walk(cache_dir):
+        relpath = os.path.relpath(root, cache_dir)
+        if relpath == ".":
+            # files at the top level are not part of the cache
+            continue
+        tracker = relpath.split(os.sep)[0]
+        groups = collections.defaultdict(list)
+        for f in files:
+            if f.endswith(LOCK_SUFFIX):
+                continue
+            elif f.startswith(TMP_PREFIX):
+                groups[f].append(f)
+            else:
+                groups[f.split(".")[0]].append(f)
+
+        for base, filenames in groups.items():
+            filenames = [os.path.join(root, x) for x in filenames]
+            meta = os.path.join(root, base) + META_SUFFIX
+            size, last_access = 0, 0
+            for filename in filenames:
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                size += st.st_size
+                last_access = max(last_access, st.st_mtime)
+            if meta in filenames:
+                try:
+                    last_access = os.stat(meta).st_mtime
+                except OSError:
+                    pass
+            entries.append((last_access, size, tracker, filenames))
+
+    return entries
+
+
+def collect_garbage(cache_dir, max_size=None, max_age=None,
+                    dry_run=False):
+    '''remove entries from *cache_dir*.
+
+    Entries that have not been accessed for *max_age* seconds are
+    removed first. Then, least recently used entries are removed
+    until the total size of the cache is below *max_size* bytes.
+
+    Returns a dictionary mapping each tracker to the number of bytes
+    that have been reclaimed.
+    '''
+    entries = sorted(get_entries(cache_dir))
+    total_size = sum([x[1] for x in entries])
+    now = time.time()
+    reclaimed = collections.defaultdict(int)
+
+    for last_access, size, tracker, filenames in entries:
+        if max_age is not None and now - last_access > max_age:
+            pass
+        elif max_size is not None and total_size > max_size:
+            pass
+        else:
+            continue
+
+        if not dry_run:
+            for filename in filenames:
+                try:
+                    os.unlink(filename)
+                except OSError:
+                    pass
+        total_size -= size
+        reclaimed[tracker] += size
+
+    return reclaimed
@@ -1,5 +1,7 @@
 import imp
 import io
+import ast
+import importlib
 import os
 import re
 import six
@@ -10,194 +12,284 @@ from logging import debug, warning, critical
 from CGATReport.Utils import memoized
 from CGATReport.Types import get_encoding
 
-import CGATReport.Plugins
-import CGATReport.Plugins.BokehPlotter
-import CGATReport.Plugins.BokehPlugin
-import CGATReport.Plugins.GGPlotter
-import CGATReport.Plugins.HTMLPlugin
-import CGATReport.Plugins.MatplotlibPlugin
-import CGATReport.Plugins.PandasPlotter
-import CGATReport.Plugins.Plotter
-import CGATReport.Plugins.RPlotPlugin
-import CGATReport.Plugins.RPlotter
-import CGATReport.Plugins.RSTPlugin
-import CGATReport.Plugins.Renderer
-import CGATReport.Plugins.HoloviewsPlotter
-import CGATReport.Plugins.HoloviewsPlugin
-import CGATReport.Plugins.Seaborn
-import CGATReport.Plugins.SlideShow
-import CGATReport.Plugins.Transformer
-import CGATReport.Plugins.TransformersGeneLists
-import CGATReport.Plugins.XLSPlugin
-import CGATReport.Plugins.SVGPlugin
+import CGATReport
 
+# plugins for each capability. Plugins are given as the dotted path
+# to their class and are imported when they are first used.
 CapabilityMap = {
     "collect":
     {
         "matplotlib":
-        CGATReport.Plugins.MatplotlibPlugin.MatplotlibPlugin,
+        "CGATReport.Plugins.MatplotlibPlugin.MatplotlibPlugin",
         "rplot":
-        CGATReport.Plugins.RPlotPlugin.RPlotPlugin,
+        "CGATReport.Plugins.RPlotPlugin.RPlotPlugin",
         "html":
-        CGATReport.Plugins.HTMLPlugin.HTMLPlugin,
+        "CGATReport.Plugins.HTMLPlugin.HTMLPlugin",
         "rst":
-        CGATReport.Plugins.RSTPlugin.RSTPlugin,
+        "CGATReport.Plugins.RSTPlugin.RSTPlugin",
         "xls":
-        CGATReport.Plugins.XLSPlugin.XLSPlugin,
+        "CGATReport.Plugins.XLSPlugin.XLSPlugin",
         "bokeh":
-        CGATReport.Plugins.BokehPlugin.BokehPlugin,
+        "CGATReport.Plugins.BokehPlugin.BokehPlugin",
         "svg":
-        CGATReport.Plugins.SVGPlugin.SVGPlugin,
+        "CGATReport.Plugins.SVGPlugin.SVGPlugin",
         "hv":
-        CGATReport.Plugins.HoloviewsPlugin.HoloviewsPlugin,
+        "CGATReport.Plugins.HoloviewsPlugin.HoloviewsPlugin",
 
     },
     "transform":
     {
         "stats":
-        CGATReport.Plugins.Transformer.TransformerStats,
+        "CGATReport.Plugins.Transformer.TransformerStats",
         "correlation":
-        CGATReport.Plugins.Transformer.TransformerCorrelationPearson,
+        "CGATReport.Plugins.Transformer.TransformerCorrelationPearson",
         "pearson":
-        CGATReport.Plugins.Transformer.TransformerCorrelationPearson,
+        "CGATReport.Plugins.Transformer.TransformerCorrelationPearson",
         "contingency":
-        CGATReport.Plugins.Transformer.TransformerContingency,
+        "CGATReport.Plugins.Transformer.TransformerContingency",
         "spearman":
-        CGATReport.Plugins.Transformer.TransformerCorrelationSpearman,
+        "CGATReport.Plugins.Transformer.TransformerCorrelationSpearman",
         "test-mwu":
-        CGATReport.Plugins.Transformer.TransformerMannWhitneyU,
+        "CGATReport.Plugins.Transformer.TransformerMannWhitneyU",
         "aggregate":
-        CGATReport.Plugins.Transformer.TransformerAggregate,
+        "CGATReport.Plugins.Transformer.TransformerAggregate",
         "histogram":
-        CGATReport.Plugins.Transformer.TransformerHistogram,
+        "CGATReport.Plugins.Transformer.TransformerHistogram",
         "histogram-stats":
-        CGATReport.Plugins.Transformer.TransformerHistogramStats,
+        "CGATReport.Plugins.Transformer.TransformerHistogramStats",
         "filter":
-        CGATReport.Plugins.Transformer.TransformerFilter,
+        "CGATReport.Plugins.Transformer.TransformerFilter",
         "pandas":
-        CGATReport.Plugins.Transformer.TransformerPandas,
+        "CGATReport.Plugins.Transformer.TransformerPandas",
         "melt":
-        CGATReport.Plugins.Transformer.TransformerMelt,
+        "CGATReport.Plugins.Transformer.TransformerMelt",
         "pivot":
-        CGATReport.Plugins.Transformer.TransformerPivot,
+        "CGATReport.Plugins.Transformer.TransformerPivot",
         "hypergeometric":
-        CGATReport.Plugins.TransformersGeneLists.TransformerHypergeometric,
+        "CGATReport.Plugins.TransformersGeneLists.TransformerHypergeometric",
         "venn":
-        CGATReport.Plugins.TransformersGeneLists.TransformerVenn,
+        "CGATReport.Plugins.TransformersGeneLists.TransformerVenn",
         "p-adjust":
-        CGATReport.Plugins.TransformersGeneLists.TransformerMultiTest,
+        "CGATReport.Plugins.TransformersGeneLists.TransformerMultiTest",
         "odds-ratio":
-        CGATReport.Plugins.TransformersGeneLists.TransformerOddsRatio,
+        "CGATReport.Plugins.TransformersGeneLists.TransformerOddsRatio",
         },
     "render":
     {
         "user":
-        CGATReport.Plugins.Renderer.User,
+        "CGATReport.Plugins.Renderer.User",
         "debug":
-        CGATReport.Plugins.Renderer.Debug,
+        "CGATReport.Plugins.Renderer.Debug",
         "dataframe":
-        CGATReport.Plugins.Renderer.DataFrame,
+        "CGATReport.Plugins.Renderer.DataFrame",
         "table":
-        CGATReport.Plugins.Renderer.Table,
+        "CGATReport.Plugins.Renderer.Table",
         "rst-table":
-        CGATReport.Plugins.Renderer.RstTable,
+        "CGATReport.Plugins.Renderer.RstTable",
         "xls-table":
-        CGATReport.Plugins.Renderer.XlsTable,
+        "CGATReport.Plugins.Renderer.XlsTable",
         "html-table":
-        CGATReport.Plugins.Renderer.HTMLTable,
+        "CGATReport.Plugins.Renderer.HTMLTable",
         "glossary-table":
-        CGATReport.Plugins.Renderer.GlossaryTable,
+        "CGATReport.Plugins.Renderer.GlossaryTable",
         "matrix":
-        CGATReport.Plugins.Renderer.TableMatrix,
+        "CGATReport.Plugins.Renderer.TableMatrix",
         "matrixNP":
-        CGATReport.Plugins.Renderer.NumpyMatrix,
+        "CGATReport.Plugins.Renderer.NumpyMatrix",
         "status":
-        CGATReport.Plugins.Renderer.Status,
+        "CGATReport.Plugins.Renderer.Status",
         "text":
-        CGATReport.Plugins.Plotter.Text,
+        "CGATReport.Plugins.Plotter.Text",
         "status-matrix":
-        CGATReport.Plugins.Renderer.StatusMatrix,
+        "CGATReport.Plugins.Renderer.StatusMatrix",
         "line-plot":
-        CGATReport.Plugins.Plotter.LinePlot,
+        "CGATReport.Plugins.Plotter.LinePlot",
         # for backwards compatibility
         "density-plot":
-        CGATReport.Plugins.Seaborn.KdePlot,
+        "CGATReport.Plugins.Seaborn.KdePlot",
         "histogram-plot":
-        CGATReport.Plugins.Plotter.HistogramPlot,
+        "CGATReport.Plugins.Plotter.HistogramPlot",
         "pie-plot":
-        CGATReport.Plugins.Plotter.PiePlot,
+        "CGATReport.Plugins.Plotter.PiePlot",
         "scatter-plot":
-        CGATReport.Plugins.Plotter.ScatterPlot,
+        "CGATReport.Plugins.Plotter.ScatterPlot",
         "scatter-rainbow-plot":
-        CGATReport.Plugins.Plotter.ScatterPlotWithColor,
+        "CGATReport.Plugins.Plotter.ScatterPlotWithColor",
         "matrix-plot":
-        CGATReport.Plugins.Plotter.TableMatrixPlot,
+        "CGATReport.Plugins.Plotter.TableMatrixPlot",
         "matrixNP-plot":
-        CGATReport.Plugins.Plotter.NumpyMatrixPlot,
+        "CGATReport.Plugins.Plotter.NumpyMatrixPlot",
         "hinton-plot":
-        CGATReport.Plugins.Plotter.HintonPlot,
+        "CGATReport.Plugins.Plotter.HintonPlot",
         "gallery-plot":
-        CGATReport.Plugins.Plotter.GalleryPlot,
+        "CGATReport.Plugins.Plotter.GalleryPlot",
         "slideshow-plot":
-        CGATReport.Plugins.SlideShow.SlideShowPlot,
+        "CGATReport.Plugins.SlideShow.SlideShowPlot",
         "bar-plot":
-        CGATReport.Plugins.Plotter.BarPlot,
+        "CGATReport.Plugins.Plotter.BarPlot",
         "stacked-bar-plot":
-        CGATReport.Plugins.Plotter.StackedBarPlot,
+        "CGATReport.Plugins.Plotter.StackedBarPlot",
         "interleaved-bar-plot":
-        CGATReport.Plugins.Plotter.InterleavedBarPlot,
+        "CGATReport.Plugins.Plotter.InterleavedBarPlot",
         "venn-plot":
-        CGATReport.Plugins.Plotter.VennPlot,
+        "CGATReport.Plugins.Plotter.VennPlot",
         # ggplot
         "ggplot":
-        CGATReport.Plugins.GGPlotter.GGPlot,
+        "CGATReport.Plugins.GGPlotter.GGPlot",
         # holoview
         "hvplot":
-        CGATReport.Plugins.HoloviewsPlotter.HoloviewsPlot,
+        "CGATReport.Plugins.HoloviewsPlotter.HoloviewsPlot",
         # pandas plotting
         "pdplot":
-        CGATReport.Plugins.PandasPlotter.PandasPlot,
+        "CGATReport.Plugins.PandasPlotter.PandasPlot",
         # seaborn plots
         "sbplot":
-        CGATReport.Plugins.Seaborn.SeabornPlot,
+        "CGATReport.Plugins.Seaborn.SeabornPlot",
         "sb-box-plot":
-        CGATReport.Plugins.Seaborn.BoxPlot,
+        "CGATReport.Plugins.Seaborn.BoxPlot",
         "sb-violin-plot":
-        CGATReport.Plugins.Seaborn.ViolinPlot,
+        "CGATReport.Plugins.Seaborn.ViolinPlot",
         "sb-kde-plot":
-        CGATReport.Plugins.Seaborn.KdePlot,
+        "CGATReport.Plugins.Seaborn.KdePlot",
         "sb-pair-plot":
-        CGATReport.Plugins.Seaborn.PairPlot,
+        "CGATReport.Plugins.Seaborn.PairPlot",
         "sb-dist-plot":
-        CGATReport.Plugins.Seaborn.DistPlot,
+        "CGATReport.Plugins.Seaborn.DistPlot",
         "sb-heatmap-plot":
-        CGATReport.Plugins.Seaborn.HeatmapPlot,
+        "CGATReport.Plugins.Seaborn.HeatmapPlot",
         "sb-clustermap-plot":
-        CGATReport.Plugins.Seaborn.ClustermapPlot,
+        "CGATReport.Plugins.Seaborn.ClustermapPlot",
         # R plots
         "r-line-plot":
-        CGATReport.Plugins.RPlotter.LinePlot,
+        "CGATReport.Plugins.RPlotter.LinePlot",
         "r-box-plot":
-        CGATReport.Plugins.RPlotter.BoxPlot,
+        "CGATReport.Plugins.RPlotter.BoxPlot",
         "r-smooth-scatter-plot":
-        CGATReport.Plugins.RPlotter.SmoothScatterPlot,
+        "CGATReport.Plugins.RPlotter.SmoothScatterPlot",
         "r-heatmap-plot":
-        CGATReport.Plugins.RPlotter.HeatmapPlot,
+        "CGATReport.Plugins.RPlotter.HeatmapPlot",
         "r-ggplot":
-        CGATReport.Plugins.RPlotter.GGPlot,
+        "CGATReport.Plugins.RPlotter.GGPlot",
         # Bokeh plots
         "bk-line-plot":
-        CGATReport.Plugins.BokehPlotter.LinePlot,
+        "CGATReport.Plugins.BokehPlotter.LinePlot",
         "box-plot":
-        CGATReport.Plugins.Seaborn.BoxPlot,
+        "CGATReport.Plugins.Seaborn.BoxPlot",
         "violin-plot":
-        CGATReport.Plugins.Seaborn.ViolinPlot,
+        "CGATReport.Plugins.Seaborn.ViolinPlot",
     }
 }
 
+# libraries that collectors collect output from. Collectors are only
+# created once their library has been imported, as otherwise there
+# can be no output to collect. The matplotlib collector is always
+# created as it sets the default figure size.
+CollectorModules = {
+    "rplot": "rpy2",
+    "bokeh": "bokeh",
+    "hv": "holoviews",
+}
+
+# plugin classes that have been imported
+_PLUGINS = {}
+
+
+def get_plugin(capability, name):
+    """return the plugin class *name* providing *capability*.
+
+    The plugin is imported when it is first requested. Raises
+    KeyError if there is no such plugin.
+    """
+    path = CapabilityMap[capability][name]
+    if path not in _PLUGINS:
+        modulename, cls = path.rsplit(".", 1)
+        debug("importing plugin %s" % path)
+        _PLUGINS[path] = getattr(importlib.import_module(modulename), cls)
+    return _PLUGINS[path]
+
+
+class LazyCollector(object):
+    """collector that creates the collector plugin *name* when
+    there might be output to collect.
+
+    The plugin is created with *kwargs*.
+    """
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+        self.kwargs = kwargs
+        self.collector = None
+        self.load()
+
+    def load(self):
+        """create the collector if its library has been imported.
+
+        returns True if the collector has been created.
+        """
+        if self.collector is None:
+            module = CollectorModules.get(self.name, None)
+            if module is not None and module not in sys.modules:
+                return False
+            self.collector = get_plugin("collect", self.name)(**self.kwargs)
+        return True
+
+    def collect(self, blocks, *args, **kwargs):
+        if not self.load():
+            return {}
+        return self.collector.collect(blocks, *args, **kwargs)
+
+
+def get_collectors(**kwargs):
+    """return collectors for all collector plugins.
+
+    The collectors are created with *kwargs*.
+    """
+    return [LazyCollector(name, **kwargs)
+            for name in CapabilityMap["collect"]]
+
+
+# modules loaded by get_module() with their file and its
+# modification time
+_MODULES = {}
+
+# index of classes and functions defined in a file, see
+# get_code_index()
+_CODE_INDEX = {}
+
 
-@memoized
 def get_module(name):
+    """return module *name* and the path of its file.
+
+    Modules are loaded once per process and loaded again if their
+    file has been modified.
+    """
+    if name in _MODULES:
+        module, pathname, mtime = _MODULES[name]
+        try:
+            if os.path.getmtime(pathname) == mtime:
+                return module, pathname
+        except OSError:
+            pass
+
+    module, pathname = load_module(name)
+    _MODULES[name] = (module, pathname, os.path.getmtime(pathname))
+    return module, pathname
+
+
+def get_modified_modules():
+    """return names of modules loaded by get_module() whose file
+    has been modified since."""
+    modified = []
+    for name, (module, pathname, mtime) in list(_MODULES.items()):
+        try:
+            if os.path.getmtime(pathname) != mtime:
+                modified.append(name)
+        except OSError:
+            modified.append(name)
+    return modified
+
+
+def load_module(name):
     """load module in fullpat
     """
     # remove leading '.'
@@ -264,8 +356,51 @@ def get_module(name):
     return module, pathname
 
 
+def get_code_index(pathname):
+    '''return a dictionary mapping the names of classes and functions
+    defined in *pathname* to their source code.
+
+    The index is built once per file and built again if the file
+    has been modified.
+    '''
+    mtime = os.path.getmtime(pathname)
+    if pathname in _CODE_INDEX and _CODE_INDEX[pathname][0] == mtime:
+        return _CODE_INDEX[pathname][1]
+
+    with open(pathname, "r", encoding=get_encoding()) as infile:
+        lines = infile.readlines()
+
+    index = {}
+    try:
+        tree = ast.parse("".join(lines), filename=pathname)
+    except (SyntaxError, ValueError) as msg:
+        warning("could not parse %s: %s" % (pathname, msg))
+        tree = None
+
+    if tree is not None:
+        # breadth first, so that outer definitions take precedence
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.ClassDef,
+                                 ast.FunctionDef,
+                                 ast.AsyncFunctionDef)) and \
+                    node.name not in index:
+                index[node.name] = lines[node.lineno - 1:node.end_lineno]
+
+    _CODE_INDEX[pathname] = (mtime, index)
+    return index
+
+
 def get_code(cls, pathname):
     '''retrieve code for methods and functions.'''
+    index = get_code_index(pathname)
+    if cls in index:
+        return list(index[cls])
+    return scan_code(cls, pathname)
+
+
+def scan_code(cls, pathname):
+    '''retrieve code for methods and functions by scanning
+    *pathname* line by line.'''
     # extract code
     code = []
     if six.PY2:
@@ -393,9 +528,8 @@ def get_transformers(transformers, kwargs=None):
 
     result = []
     for transformer in transformers:
-        tt = CapabilityMap["transform"].get(transformer, None)
-        if tt is not None:
-            instance = tt(**kwargs)
+        if transformer in CapabilityMap["transform"]:
+            instance = get_plugin("transform", transformer)(**kwargs)
         else:
             instance = make_transformer(transformer, (), kwargs)
 
@@ -418,9 +552,8 @@ def get_renderer(renderer_name, kwargs=None):
 
     instance = None
 
-    tt = CapabilityMap["render"].get(renderer_name, None)
-    if tt is not None:
-        instance = tt(**kwargs)
+    if renderer_name in CapabilityMap["render"]:
+        instance = get_plugin("render", renderer_name)(**kwargs)
     else:
         instance = make_renderer(renderer_name, (), kwargs)
 
@@ -435,8 +568,19 @@ def get_renderer(renderer_name, kwargs=None):
 
 
 def get_plugins(capability):
-    return CapabilityMap[capability]
+    """return a dictionary of all plugin classes providing
+    *capability*.
+
+    Note that this imports all plugins.
+    """
+    return dict([(name, get_plugin(capability, name))
+                 for name in CapabilityMap[capability]])
 
 
 def get_all_plugins():
-    return CapabilityMap
+    """return all plugin classes for each capability.
+
+    Note that this imports all plugins.
+    """
+    return dict([(capability, get_plugins(capability))
+                 for capability in CapabilityMap])
@@ -7,7 +7,7 @@ from collections import OrderedDict as odict
 import pandas
 from CGATReport import Utils
 from CGATReport import Component
-from CGATReport.Types import is_string, is_array, is_dataframe
+from CGATReport.Types import is_string, is_array, is_dataframe, ContainerTypes
 
 
 def unique(iterables):
@@ -520,11 +520,7 @@ def as_dataframe(data, tracker=None):
 
     if is_hierarchical:
         n = list(df.index.names)
-        try:
-            if tracker is not None:
-                l = getattr(tracker, "levels")
-        except AttributeError:
-            l = ["track", "slice"] + ["level%i" % x for x in range(len(n))]
+        l = getLevelNames(tracker, len(n))
 
         for x, y in enumerate(n):
             if y is None:
@@ -536,6 +532,19 @@ def as_dataframe(data, tracker=None):
     return df
 
 
+def getLevelNames(tracker, nlevels):
+    '''return names for the levels of a hierarchical index with
+    *nlevels* levels.
+
+    The names are taken from the attribute ``levels`` of *tracker*
+    if it exists.
+    '''
+    try:
+        return getattr(tracker, "levels")
+    except AttributeError:
+        return ["track", "slice"] + ["level%i" % x for x in range(nlevels)]
+
+
 def getPaths(work):
     '''extract labels from data.
 
@@ -807,7 +816,7 @@ def count_levels(labels):
     '''count number of levels for each level in labels'''
     counts = []
     for x in labels:
-        if type(x[0]) in Utils.ContainerTypes:
+        if type(x[0]) in ContainerTypes:
             counts.append(len(x[0]))
         else:
             counts.append(1)
@@ -876,7 +885,7 @@ def tree2table(data, transpose=False, head=None):
 
             # add row header only for first row (if there are sub-rows)
             if first:
-                if type(row) in Utils.ContainerTypes:
+                if type(row) in ContainerTypes:
                     row_headers.append(row[0])
                     for z, p in enumerate(row[1:]):
                         row_data[z] = p
@@ -896,7 +905,7 @@ def tree2table(data, transpose=False, head=None):
             for y, column in enumerate(labels[-1]):
                 if column not in work:
                     continue
-                if type(work[column]) not in Utils.ContainerTypes:
+                if type(work[column]) not in ContainerTypes:
                     is_container = False
                     break
                 if max_rows == None:
@@ -1,6 +1,12 @@
+import os
 import re
+import pickle
+import hashlib
 import traceback
 import itertools
+import threading
+import multiprocessing
+import concurrent.futures
 import pandas
 import numpy
 
@@ -9,9 +15,8 @@ from CGATReport import DataTree
 from CGATReport import Component
 from CGATReport import Utils
 from CGATReport import Cache
-
-# move User renderer to CGATReport main distribution
-from CGATReport.Plugins import Renderer
+from CGATReport.Options import get_option_map
+from CGATReport.Capabilities import get_plugin
 from CGATReport.Types import is_string, ContainerTypes
 
 from collections import OrderedDict
@@ -20,6 +25,81 @@ VERBOSE = True
 # maximimum number of levels in data tree
 MAX_PATH_NESTING = 5
 
+# modes for parallel data collection
+PARALLEL_MODES = ("threads", "processes")
+
+# dispatcher used by worker processes during parallel collection
+_COLLECT_DISPATCHER = None
+
+
+def _init_collect_worker():
+    """initialize worker process for parallel data collection.
+
+    Database connections can not be shared with the parent
+    process, thus the tracker will reconnect.
+    """
+    tracker = _COLLECT_DISPATCHER.tracker
+    if getattr(tracker, "db", None) is not None:
+        tracker.db = None
+
+
+def _collect_path(path):
+    """compute data for *path* in a worker process."""
+    return _COLLECT_DISPATCHER.callTracker(path)
+
+
+# locks for data trees that are being collected, see get_tree_lock()
+_TREE_LOCKS = {}
+_TREE_LOCKS_LOCK = threading.Lock()
+
+
+def get_tree_lock(key):
+    """return the lock for collecting the data tree with *key*.
+
+    Directives collecting the same data tree in this process wait
+    for each other and the first directive shares its result.
+    """
+    with _TREE_LOCKS_LOCK:
+        if key not in _TREE_LOCKS:
+            _TREE_LOCKS[key] = threading.Lock()
+        return _TREE_LOCKS[key]
+
+
+def clear_trees():
+    """remove data trees shared between directives.
+
+    Shared data trees are only valid within a single build or job,
+    as the data of untracked sources might have changed since.
+    """
+    memory_cache = Cache.get_memory_cache()
+    with _TREE_LOCKS_LOCK:
+        for key in _TREE_LOCKS:
+            memory_cache.remove(key)
+        _TREE_LOCKS.clear()
+
+
+# dispatcher and groups used by worker processes during parallel
+# rendering
+_RENDER_DISPATCHER = None
+_RENDER_GROUPS = None
+
+
+def _init_render_worker():
+    """initialize worker process for parallel rendering.
+
+    Figures are rendered with the non-interactive Agg backend and
+    figures inherited from the parent process are discarded.
+    """
+    import matplotlib.pyplot as plt
+    plt.switch_backend("Agg")
+    plt.close("all")
+
+
+def _render_group(index):
+    """render group *index* in a worker process."""
+    key, work = _RENDER_GROUPS[index]
+    return _RENDER_DISPATCHER.renderGroup(key, work)
+
 
 class Dispatcher(Component.Component):
     """Dispatch the directives in the ``:report:`` directive
@@ -63,6 +143,8 @@ class Dispatcher(Component.Component):
         # set to true if index will be later set by tracker
         self.indexFromTracker = False
 
+        self.nocache = False
+
         try:
             self.debug("cache of tracker: %s: %s" % (self.tracker,
                                                      str(tracker.cache)))
@@ -78,6 +160,17 @@ class Dispatcher(Component.Component):
         self.tree = None
         self.data = None
 
+        # dataframe collected from trackers providing all data as
+        # a single dataframe, see collectBatchFrame()
+        self.frame = None
+
+        # cache for dataframes after transformation and filtering
+        self.frame_cache = None
+        self.frame_key = None
+
+        # key of the collected data tree shared between directives
+        self.tree_key = None
+
         # Level at which to group the results of Renderers
         # None is no grouping
         # 0: group on first level ('groupby=track')
@@ -87,7 +180,7 @@ class Dispatcher(Component.Component):
 
         # no caching for user renderers, figure needs
         # to be created for collection.
-        if isinstance(renderer, Renderer.User):
+        if isinstance(renderer, get_plugin("render", "user")):
             self.nocache = True
 
     def __del__(self):
@@ -118,7 +211,9 @@ class Dispatcher(Component.Component):
         except ValueError:
             pass
 
-        self.nocache = "nocache" in kwargs
+        # caching might have been disabled already for the tracker
+        # or the renderer
+        self.nocache = self.nocache or "nocache" in kwargs
 
         self.mInputTracks = as_list(kwargs.get("tracks", None))
         self.mInputSlices = as_list(kwargs.get("slices", None))
@@ -130,57 +225,211 @@ class Dispatcher(Component.Component):
         self.include_columns = as_list(kwargs.get("include-columns", None))
         self.set_index = as_list(kwargs.get("set-index", None))
 
+        self.parallel_collect = kwargs.get(
+            "parallel-collect",
+            getattr(self.tracker, "parallel_collect", None))
+        if self.parallel_collect is not None and \
+           self.parallel_collect not in PARALLEL_MODES:
+            raise ValueError(
+                "unknown mode '%s' for parallel-collect, "
+                "expected one of %s" % (self.parallel_collect,
+                                        ",".join(PARALLEL_MODES)))
+        self.collect_jobs = int(kwargs.get(
+            "collect-jobs",
+            getattr(self.tracker, "collect_jobs",
+                    multiprocessing.cpu_count())))
+
+        self.parallel_render = "parallel-render" in kwargs
+        self.render_jobs = int(kwargs.get("render-jobs",
+                                          multiprocessing.cpu_count()))
+
+        # cached data are invalid if the tracker or its data have changed
+        option_map = get_option_map()
+        tracker_options = dict(
+            [(x, y) for x, y in kwargs.items()
+             if x not in option_map["dispatch"] and
+             x not in option_map["transform"]])
+        fingerprint = Cache.tracker2fingerprint(
+            self.tracker, tracker_options)
+
+        # the collected data are shared with other directives in
+        # this process, also if the tracker is not cached. User
+        # renderers need to create their figures during collection.
+        if "nocache" not in kwargs and \
+           not isinstance(self.renderer, get_plugin("render", "user")):
+            self.tree_key = self.getTreeKey(fingerprint)
+
+        if isinstance(self.cache, Cache.Cache):
+            self.cache.fingerprint = fingerprint
+
+            if not self.nocache and self.renderer is not None and \
+               not isinstance(self.renderer, get_plugin("render", "debug")):
+                self.frame_cache = Cache.Cache(
+                    os.path.join(self.cache.cache_name, "frames"),
+                    fingerprint=self.cache.fingerprint)
+                self.frame_key = self.getFrameKey(kwargs)
+
         # TODO: indicate if tracker is parameterized
         self.tracker_options = False
 
+    def getTreeKey(self, fingerprint):
+        """return key for the collected data tree.
+
+        The key is derived from the tracker, its fingerprint, the
+        options selecting data paths and the renderer, which
+        determines how the data are collected.
+        """
+        if self.renderer is None:
+            renderer = None
+        else:
+            renderer = (self.renderer.__class__.__module__,
+                        self.renderer.__class__.__name__)
+        key = repr((Cache.tracker2key(self.tracker),
+                    fingerprint,
+                    renderer,
+                    self.useBatchFrame(),
+                    self.mInputTracks,
+                    self.mInputSlices,
+                    self.mInputPaths,
+                    self.restrict_paths,
+                    self.exclude_paths))
+        return "tree:" + hashlib.md5(key.encode("utf-8")).hexdigest()
+
+    def hasBatchMethod(self, name):
+        """return True if the tracker provides data for many paths at
+        once with its method *name*.
+
+        The method is only used if it is defined by the class that
+        defines :meth:`__call__` of the tracker or by a class derived
+        from it. Subclasses that override :meth:`__call__` only are
+        thus not bypassed by the method of a base class.
+        """
+        def _owner(attribute):
+            for cls in type(self.tracker).__mro__:
+                if attribute in cls.__dict__:
+                    return cls
+            return None
+
+        owner = _owner(name)
+        if owner is None:
+            return hasattr(self.tracker, name)
+        call_owner = _owner("__call__")
+        return call_owner is None or issubclass(owner, call_owner)
+
+    def useBatchFrame(self):
+        """return True if data are collected as a single dataframe
+        with the :meth:`getBatchFrame` method of the tracker.
+
+        The data tree is only needed by some renderers and for
+        inspection.
+        """
+        return self.hasBatchMethod("getBatchFrame") and \
+            self.renderer is not None and \
+            not isinstance(self.renderer, (get_plugin("render", "user"),
+                                           get_plugin("render", "debug")))
+
+    def getFrameKey(self, kwargs):
+        """return cache key for the dataframe before grouping.
+
+        The key is derived from the fingerprint of the tracker, the
+        transformers and all options that affect the dataframe.
+        Options that only affect grouping and layout are ignored.
+        """
+        options = [(str(x), repr(y)) for x, y in kwargs.items()
+                   if x not in ("groupby", "layout", "long-titles",
+                                "parallel-collect", "collect-jobs",
+                                "parallel-render", "render-jobs")]
+        transformers = [(x.__class__.__module__, x.__class__.__name__)
+                        for x in self.transformers]
+        key = repr((self.cache.fingerprint,
+                    transformers,
+                    sorted(options)))
+        return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+    def getCachedFrame(self):
+        """return transformed dataframe from cache.
+
+        Returns None if not in cache.
+        """
+        if self.frame_key is None:
+            return None
+        try:
+            dataframe = self.frame_cache[self.frame_key]
+        except KeyError:
+            return None
+        self.debug("%s: using cached dataframe %s" %
+                   (self.tracker, self.frame_key))
+        return dataframe
+
     def getData(self, path):
         """get data for track and slice. Save data in persistent cache for
         further use.
 
         For functions, path should be an empty tuple.
         """
+        key = self.getKey(path)
+
+        # trackers with options are not cached
+        if self.nocache or self.tracker_options:
+            result = self.callTracker(path)
+            if not self.nocache:
+                self.cache[key] = result
+            return result
+
+        result = self.getCachedData(key)
+        if result is not None:
+            return result
+
+        # only one process computes the data for a key, others
+        # wait and then use the cached result.
+        with self.cache.lock(key):
+            result = self.getCachedData(key)
+            if result is None:
+                result = self.callTracker(path)
+                # exception - do not store data frames
+                # test with None fails for some reason
+                self.cache[key] = result
+
+        return result
+
+    def getKey(self, path):
+        """return cache key for *path*."""
         if path:
-            key = DataTree.path2str(path)
+            return DataTree.path2str(path)
         else:
-            key = "all"
+            return "all"
 
-        result, fromcache = None, False
-        # trackers with options are not cached
-        if not self.nocache and not self.tracker_options:
-            try:
-                result = self.cache[key]
-                fromcache = True
-            except KeyError:
-                pass
-            except RuntimeError as msg:
-                raise RuntimeError(
-                    "error when accessing key %s from cache: %s "
-                    "- potential problem with unpickable object?" % (key, msg))
+    def getCachedData(self, key):
+        """return data for *key* from cache.
 
+        Returns None if key is not in cache.
+        """
+        try:
+            return self.cache[key]
+        except KeyError:
+            return None
+        except RuntimeError as msg:
+            raise RuntimeError(
+                "error when accessing key %s from cache: %s "
+                "- potential problem with unpickable object?" % (key, msg))
+
+    def callTracker(self, path):
+        """call tracker to compute data for *path*."""
         kwargs = {}
         if self.tracker_options:
             kwargs = Utils.parse_tracker_options(self.tracker_options)
 
-        if result is None:
-            try:
-                result = self.tracker(*path, **kwargs)
-            except Exception as msg:
-                self.warn("exception for tracker '%s', path '%s': msg=%s" %
-                          (str(self.tracker),
-                           DataTree.path2str(
-                               path),
-                           msg))
-                if VERBOSE:
-                    self.warn(traceback.format_exc())
-                raise
-
-        # store in cache
-        if not self.nocache and not fromcache:
-            # exception - do not store data frames
-            # test with None fails for some reason
-            self.cache[key] = result
-
-        return result
+        try:
+            return self.tracker(*path, **kwargs)
+        except Exception as msg:
+            self.warn("exception for tracker '%s', path '%s': msg=%s" %
+                      (str(self.tracker),
+                       DataTree.path2str(
+                           path),
+                       msg))
+            if VERBOSE:
+                self.warn(traceback.format_exc())
+            raise
 
     def getDataPaths(self, obj):
         '''determine if obj is a function and return
@@ -288,10 +537,38 @@ class Dispatcher(Component.Component):
     def collect(self):
         '''collect all data.
 
+        Data is stored in a multi-level dictionary (DataTree)
+
+        Data trees are shared between directives in the same process
+        that use the same tracker with the same options. If several
+        directives need the same data at the same time, the data are
+        collected only once.
+        '''
+        if self.tree_key is None:
+            return self.collectTree()
+
+        memory_cache = Cache.get_memory_cache()
+        with get_tree_lock(self.tree_key):
+            found, data = memory_cache.get(self.tree_key)
+            if found:
+                self.debug("%s: using collected data tree %s" %
+                           (self.tracker, self.tree_key))
+                self.tree, self.frame, self.indexFromTracker = data
+                return self.tree
+
+            self.collectTree()
+            memory_cache.put(self.tree_key,
+                             (self.tree, self.frame, self.indexFromTracker))
+        return self.tree
+
+    def collectTree(self):
+        '''collect all data from the tracker.
+
         Data is stored in a multi-level dictionary (DataTree)
         '''
 
         self.tree = OrderedDict()
+        self.frame = None
 
         self.debug("%s: collecting data paths." % (self.tracker))
 
@@ -336,16 +613,32 @@ class Dispatcher(Component.Component):
                 "%s: number of nesting in data paths too large: %i" % (
                     self.tracker, len(datapaths)))
 
-        all_paths = list(itertools.product(*datapaths))
+        all_paths = self.prefilterPaths(
+            list(itertools.product(*datapaths)), datapaths)
         self.debug(
             "%s: collecting data started for %i data paths" % (
                 self.tracker,
                 len(all_paths)))
 
-        self.tree = OrderedDict()
-        for path in all_paths:
+        # trackers providing a dataframe for all paths
+        if self.useBatchFrame():
+            self.frame = self.collectBatchFrame(all_paths)
+            if self.frame is not None:
+                self.debug(
+                    "%s: collected dataframe for %i data paths" % (
+                        self.tracker,
+                        len(all_paths)))
+                return self.tree
+
+        if self.hasBatchMethod("getBatch"):
+            results = self.collectBatch(all_paths)
+        elif self.parallel_collect and len(all_paths) > 1:
+            results = self.collectParallel(all_paths)
+        else:
+            results = [self.getData(path) for path in all_paths]
 
-            d = self.getData(path)
+        self.tree = OrderedDict()
+        for path, d in zip(all_paths, results):
 
             # ignore empty data sets
             if d is None:
@@ -360,26 +653,265 @@ class Dispatcher(Component.Component):
                 len(all_paths)))
         return self.tree
 
-    def _match(self, label, paths):
-        '''return True if any of paths match to label.'''
+    def prefilterPaths(self, all_paths, datapaths):
+        '''apply restrict and exclude options to data paths before
+        the data are collected.
+
+        Patterns are only applied if the index of the dataframe is
+        built from the data paths, i.e. if there are no transformers
+        and neither the tracker nor the ``set-index`` option change
+        the index. Only patterns that match a label in *datapaths*
+        are applied. Paths are only removed by restrict patterns
+        that name a label exactly, as regular expressions might also
+        match labels in levels that are created later. All other
+        patterns are left to :meth:`filterPaths`, which is always
+        applied after collection.
+
+        returns the filtered list of paths.
+        '''
+        if self.transformers or self.set_index or self.indexFromTracker:
+            return all_paths
+
+        labels = [label for level in datapaths for label in level]
+
+        def _pushable(patterns):
+            return [x for x in self._compile(patterns)
+                    if any([self._matchCompiled(label, [x])
+                            for label in labels])]
+
+        if self.restrict_paths:
+            patterns = [x for x in _pushable(self.restrict_paths)
+                        if x[1] is None]
+            if len(datapaths) == 1:
+                # a single level is restricted to labels matching
+                # any of the patterns.
+                if len(patterns) == len(self.restrict_paths):
+                    all_paths = [x for x in all_paths
+                                 if self._matchCompiled(x[0], patterns)]
+            else:
+                # multiple levels are restricted to paths matching
+                # all of the patterns.
+                for pattern in patterns:
+                    all_paths = [x for x in all_paths
+                                 if any([self._matchCompiled(label, [pattern])
+                                         for label in x])]
+
+        if self.exclude_paths:
+            patterns = _pushable(self.exclude_paths)
+            if patterns:
+                all_paths = [x for x in all_paths
+                             if not any([self._matchCompiled(label, patterns)
+                                         for label in x])]
+
+        self.debug("%s: %i data paths after restrict and exclude" %
+                   (self.tracker, len(all_paths)))
+        return all_paths
+
+    def collectBatch(self, all_paths):
+        """collect data for *all_paths* with a single call to the
+        :meth:`getBatch` method of the tracker.
+
+        Data in the cache are used where available and only the
+        remaining paths are passed to the tracker. Paths missing from
+        the mapping returned by the tracker are collected
+        individually.
+
+        Returns a list of data in the same order as *all_paths*.
+        """
+        results, todo = [None] * len(all_paths), []
+        for x, path in enumerate(all_paths):
+            if not self.nocache and not self.tracker_options:
+                results[x] = self.getCachedData(self.getKey(path))
+            if results[x] is None:
+                todo.append(x)
+
+        if not todo:
+            return results
+
+        self.debug("%s: collecting %i data paths in batch" %
+                   (self.tracker, len(todo)))
+
+        batch = self.callBatch([all_paths[x] for x in todo])
+        for x in todo:
+            path = all_paths[x]
+            if path in batch:
+                results[x] = batch[path]
+                if not self.nocache:
+                    self.cache[self.getKey(path)] = results[x]
+            else:
+                results[x] = self.getData(path)
+
+        return results
+
+    def collectBatchFrame(self, all_paths):
+        """collect data for *all_paths* as a single dataframe from the
+        :meth:`getBatchFrame` method of the tracker.
+
+        The dataframe is used instead of the dataframe built from
+        the data tree. It is cached as a whole.
+
+        Returns None if the tracker does not provide a dataframe
+        for *all_paths*.
+        """
+        key = "frame-%s" % hashlib.md5(
+            repr(all_paths).encode("utf-8")).hexdigest()
+
+        if not self.nocache and not self.tracker_options:
+            frame = self.getCachedData(key)
+            if frame is not None:
+                return frame
+
+        kwargs = {}
+        if self.tracker_options:
+            kwargs = Utils.parse_tracker_options(self.tracker_options)
 
+        try:
+            frame = self.tracker.getBatchFrame(all_paths, **kwargs)
+        except Exception as msg:
+            self.warn("exception for tracker '%s', dataframe of %i paths: "
+                      "msg=%s" % (str(self.tracker), len(all_paths), msg))
+            if VERBOSE:
+                self.warn(traceback.format_exc())
+            raise
+
+        if frame is not None and not self.nocache:
+            self.cache[key] = frame
+        return frame
+
+    def callBatch(self, paths):
+        """call tracker to compute data for all *paths* at once."""
+        kwargs = {}
+        if self.tracker_options:
+            kwargs = Utils.parse_tracker_options(self.tracker_options)
+
+        try:
+            return self.tracker.getBatch(paths, **kwargs)
+        except Exception as msg:
+            self.warn("exception for tracker '%s', batch of %i paths: "
+                      "msg=%s" % (str(self.tracker), len(paths), msg))
+            if VERBOSE:
+                self.warn(traceback.format_exc())
+            raise
+
+    def collectParallel(self, all_paths):
+        """collect data for *all_paths* in parallel.
+
+        In ``threads`` mode, paths are collected with a pool of
+        threads. In ``processes`` mode, data are computed in a pool of
+        worker processes, while the cache is accessed in this
+        process.
+
+        Returns a list of data in the same order as *all_paths*. If
+        collection fails for any path, the exception of the first
+        failing path is raised.
+        """
+        njobs = max(1, min(self.collect_jobs, len(all_paths)))
+        mode = self.parallel_collect
+
+        # daemonic processes (such as worker processes) can not
+        # have children and platforms without fork can not pass
+        # the tracker to the workers.
+        if mode == "processes":
+            try:
+                context = multiprocessing.get_context("fork")
+            except ValueError:
+                context = None
+            if context is None or multiprocessing.current_process().daemon:
+                self.warn("%s: parallel collection with processes not "
+                          "possible, using threads" % self.tracker)
+                mode = "threads"
+
+        self.debug("%s: collecting %i data paths with %i %s" %
+                   (self.tracker, len(all_paths), njobs, mode))
+
+        if mode == "threads":
+            with concurrent.futures.ThreadPoolExecutor(njobs) as pool:
+                return list(pool.map(self.getData, all_paths))
+
+        global _COLLECT_DISPATCHER
+
+        # get data from cache first
+        results, todo = [None] * len(all_paths), []
+        for x, path in enumerate(all_paths):
+            if not self.nocache and not self.tracker_options:
+                results[x] = self.getCachedData(self.getKey(path))
+            if results[x] is None:
+                todo.append(x)
+
+        _COLLECT_DISPATCHER = self
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                    njobs,
+                    mp_context=context,
+                    initializer=_init_collect_worker) as pool:
+                computed = pool.map(_collect_path,
+                                    [all_paths[x] for x in todo])
+                for x, result in zip(todo, computed):
+                    results[x] = result
+                    if not self.nocache:
+                        self.cache[self.getKey(all_paths[x])] = result
+        finally:
+            _COLLECT_DISPATCHER = None
+
+        return results
+
+    def _compile(self, paths):
+        '''compile patterns in *paths*.
+
+        Returns a list of tuples (pattern, regular expression). The
+        regular expression is None for patterns that need to match
+        exactly.
+        '''
+        result = []
         for s in paths:
+            if s.startswith("r(") and s.endswith(")"):
+                # collect pattern matches:
+                # remove r()
+                rx = s[2:-1]
+                # remove flanking quotation marks
+                if rx[0] in ('"', "'") and rx[-1] in ('"', "'"):
+                    rx = rx[1:-1]
+                result.append((s, re.compile(rx)))
+            else:
+                result.append((s, None))
+        return result
+
+    def _matchCompiled(self, label, patterns):
+        '''return True if any of the compiled *patterns* match to label.'''
+        for s, rx in patterns:
             if label == s:
                 return True
-            elif s.startswith("r(") and s.endswith(")"):
-                    # collect pattern matches:
-                    # remove r()
-                s = s[2:-1]
-                # remove flanking quotation marks
-                if s[0] in ('"', "'") and s[-1] in ('"', "'"):
-                    s = s[1:-1]
-                rx = re.compile(s)
-                if not is_string(label):
-                    continue
-                if rx.search(label):
-                    return True
+            elif rx is not None and is_string(label) and rx.search(label):
+                return True
         return False
 
+    def _match(self, label, paths):
+        '''return True if any of paths match to label.'''
+        return self._matchCompiled(label, self._compile(paths))
+
+    def _matchIndex(self, index, patterns):
+        '''return a boolean array with rows in *index* that have a
+        label matching any of the compiled *patterns*.
+
+        Patterns are matched against the unique labels in each level
+        of the index only.
+        '''
+        if isinstance(index, pandas.MultiIndex):
+            levels = list(zip(index.levels, index.codes))
+        else:
+            codes, uniques = pandas.factorize(index)
+            levels = [(uniques, codes)]
+
+        result = numpy.zeros(len(index), dtype=bool)
+        for labels, codes in levels:
+            matches = numpy.array(
+                [self._matchCompiled(x, patterns) for x in labels] +
+                # missing values have code -1
+                [False],
+                dtype=bool)
+            result |= matches[numpy.asarray(codes)]
+        return result
+
     def filterPaths(self, path_patterns, mode="restrict"):
         '''restrict or exclude data paths.
 
@@ -392,31 +924,20 @@ class Dispatcher(Component.Component):
             return
 
         # rows first
+        patterns = self._compile(path_patterns)
 
         # select rows to keep (matching any of the patterns in any
         # of the levels of the hierarchical index)
         is_hierarchical = isinstance(self.data.index,
                                      pandas.MultiIndex)
-        if is_hierarchical:
-            if mode == "restrict":
-                keep = [True] * len(self.data.index)
-                for pattern in path_patterns:
-                    keep = numpy.logical_and(
-                        keep,
-                        [any([self._match(x, [pattern]) for x in labels])
-                         for labels in self.data.index])
-            elif mode == "exclude":
-                keep = [False] * len(self.data.index)
-                for pattern in path_patterns:
-                    keep = numpy.logical_or(
-                        keep,
-                        [any([self._match(x, [pattern]) for x in labels])
-                         for labels in self.data.index])
+        if is_hierarchical and mode == "restrict":
+            keep = numpy.ones(len(self.data.index), dtype=bool)
+            for pattern in patterns:
+                keep &= self._matchIndex(self.data.index, [pattern])
         else:
-            keep = [self._match(x, path_patterns) for x in self.data.index]
-
+            keep = self._matchIndex(self.data.index, patterns)
             if mode == "exclude":
-                keep = [not x for x in keep]
+                keep = ~keep
 
         self.data = self.data[keep]
 
@@ -646,14 +1167,17 @@ class Dispatcher(Component.Component):
             self.debug("%s: grouping by levels: %s" %
                        (self, str(level)))
 
-            for key, work in dataframe.groupby(level=level):
+            rendered = None
+            if self.parallel_render:
+                rendered = self.renderParallel(
+                    list(dataframe.groupby(level=level)))
+
+            if rendered is None:
+                rendered = (self.renderGroup(key, work) for key, work in
+                            dataframe.groupby(level=level))
 
-                try:
-                    results.extend(self.renderer(work,
-                                                 path=key))
-                except:
-                    self.error("%s: exception in rendering" % self)
-                    results.append(Utils.buildException("rendering"))
+            for blocks in rendered:
+                results.extend(blocks)
 
         if len(results) == 0:
             self.warn("renderer returned no data.")
@@ -664,27 +1188,72 @@ class Dispatcher(Component.Component):
 
         return results
 
-    def __call__(self, *args, **kwargs):
+    def renderGroup(self, key, work):
+        """render dataframe *work* of group *key*.
 
+        returns a ResultBlocks data structure. Exceptions are
+        converted to text elements.
+        """
         try:
-            self.parseArguments(*args, **kwargs)
+            return self.renderer(work, path=key)
         except:
-            self.error("%s: exception in parsing" % self)
-            return ResultBlocks(Utils.buildException("parsing"))
+            self.error("%s: exception in rendering" % self)
+            return ResultBlocks(Utils.buildException("rendering"))
 
-        # collect no data if tracker is the empty tracker
-        # and go straight to rendering
+    def renderParallel(self, groups):
+        """render *groups* in a pool of worker processes.
+
+        Each worker saves the images of a group with the collectors
+        of the renderer and returns the rendered text. Thus parallel
+        rendering is only possible if the renderer has collectors.
+
+        Returns a list of ResultBlocks in the same order as
+        *groups*. Returns None if the groups can not be rendered in
+        parallel and need to be rendered serially.
+        """
+        if len(groups) < 2 or \
+           not getattr(self.renderer, "collectors", None):
+            return None
+
+        # daemonic processes (such as worker processes) can not
+        # have children and platforms without fork can not pass
+        # the renderer to the workers.
         try:
-            if self.tracker.getTracks() == ["empty"]:
-                # is instance does not work because of module mapping
-                # type(Tracker.Empty) == CGATReport.Tracker.Empty
-                # type(self.tracker) == Tracker.Empty
-                # if isinstance(self.tracker, Tracker.Empty):
-                return self.renderer()
-        except AttributeError:
-            # for function trackers
-            pass
+            context = multiprocessing.get_context("fork")
+        except ValueError:
+            return None
+        if multiprocessing.current_process().daemon:
+            return None
+
+        njobs = max(1, min(self.render_jobs, len(groups)))
+        self.debug("%s: rendering %i groups with %i processes" %
+                   (self.renderer, len(groups), njobs))
 
+        global _RENDER_DISPATCHER, _RENDER_GROUPS
+
+        _RENDER_DISPATCHER, _RENDER_GROUPS = self, groups
+        try:
+            with concurrent.futures.ProcessPoolExecutor(
+                    njobs,
+                    mp_context=context,
+                    initializer=_init_render_worker) as pool:
+                return list(pool.map(_render_group, range(len(groups))))
+        except (pickle.PicklingError, TypeError, AttributeError,
+                concurrent.futures.BrokenExecutor) as msg:
+            self.warn("%s: parallel rendering failed, rendering "
+                      "serially: %s" % (self.renderer, msg))
+            return None
+        finally:
+            _RENDER_DISPATCHER, _RENDER_GROUPS = None, None
+
+    def prepare(self):
+        """collect data and build the dataframe for rendering.
+
+        The data are transformed and filtered.
+
+        Returns a tuple (success, result). If success is False,
+        result should be returned to the caller.
+        """
         self.debug("profile: started: tracker: %s" % (self.tracker))
 
         # collecting data
@@ -692,14 +1261,23 @@ class Dispatcher(Component.Component):
             self.collect()
         except Exception as ex:
             self.error("%s: exception in collection: %s" % (self, str(ex)))
-            return ResultBlocks(
+            return False, ResultBlocks(
                 Utils.buildException("collection"))
         finally:
             self.debug("profile: finished: tracker: %s" % (self.tracker))
 
+        if self.frame is not None:
+            # data have been collected as a dataframe. The collected
+            # dataframe might be shared with other directives.
+            self.data = self.frame.copy()
+            if len(self.data) == 0:
+                self.info("%s: no data - processing complete" % self.tracker)
+                return False, None
+            return self.process()
+
         if self.tree is None or len(self.tree) == 0:
             self.info("%s: no data - processing complete" % self.tracker)
-            return None
+            return False, None
 
         data_paths = DataTree.getPaths(self.tree)
         self.debug("%s: after collection: %i data_paths: %s" %
@@ -707,22 +1285,30 @@ class Dispatcher(Component.Component):
 
         # special Renderers - do not process data further but render
         # directly. Note that no transformations will be applied.
-        if isinstance(self.renderer, Renderer.User):
+        if isinstance(self.renderer, get_plugin("render", "user")):
             results = ResultBlocks(title="main")
             results.extend(self.renderer(self.tree))
-            return results
-        elif isinstance(self.renderer, Renderer.Debug):
+            return False, results
+        elif isinstance(self.renderer, get_plugin("render", "debug")):
             results = ResultBlocks(title="main")
             results.extend(self.renderer(self.tree))
-            return results
+            return False, results
 
         # merge all data to hierarchical indexed dataframe
         self.data = DataTree.as_dataframe(self.tree, self.tracker)
 
         if self.data is None:
             self.info("%s: no data after conversion" % self.tracker)
-            return None
+            return False, None
+
+        return self.process()
+
+    def process(self):
+        """transform and filter the dataframe.
 
+        Returns a tuple (success, result). If success is False,
+        result should be returned to the caller.
+        """
         self.debug("dataframe memory usage: total=%i,data=%i,index=%i,col=%i" %
                    (self.data.values.nbytes +
                     self.data.index.nbytes +
@@ -740,14 +1326,14 @@ class Dispatcher(Component.Component):
             self.transform()
         except:
             self.error("%s: exception in transformation" % self)
-            return ResultBlocks(
+            return False, ResultBlocks(
                 Utils.buildException("transformation"))
 
         try:
             self.reframe()
         except:
             self.error("%s: exception in reframing" % self)
-            return ResultBlocks(Utils.buildException("reframing"))
+            return False, ResultBlocks(Utils.buildException("reframing"))
 
         # data_paths = DataTree.getPaths(self.data)
         # self.debug("%s: after transformation: %i data_paths: %s" %
@@ -757,7 +1343,7 @@ class Dispatcher(Component.Component):
             self.filterPaths(self.restrict_paths, mode="restrict")
         except:
             self.error("%s: exception in restrict" % self)
-            return ResultBlocks(
+            return False, ResultBlocks(
                 Utils.buildException("restrict"))
 
         # data_paths = DataTree.getPaths(self.data)
@@ -768,12 +1354,43 @@ class Dispatcher(Component.Component):
             self.filterPaths(self.exclude_paths, mode="exclude")
         except:
             self.error("%s: exception in exclude" % self)
-            return ResultBlocks(Utils.buildException("exclude"))
+            return False, ResultBlocks(Utils.buildException("exclude"))
 
         # data_paths = DataTree.getPaths(self.data)
         # self.debug("%s: after exclude: %i data_paths: %s" %
         #          (self, len(data_paths), str(data_paths)))
 
+        return True, None
+
+    def __call__(self, *args, **kwargs):
+
+        try:
+            self.parseArguments(*args, **kwargs)
+        except:
+            self.error("%s: exception in parsing" % self)
+            return ResultBlocks(Utils.buildException("parsing"))
+
+        # collect no data if tracker is the empty tracker
+        # and go straight to rendering
+        try:
+            if self.tracker.getTracks() == ["empty"]:
+                # is instance does not work because of module mapping
+                # type(Tracker.Empty) == CGATReport.Tracker.Empty
+                # type(self.tracker) == Tracker.Empty
+                # if isinstance(self.tracker, Tracker.Empty):
+                return self.renderer()
+        except AttributeError:
+            # for function trackers
+            pass
+
+        self.data = self.getCachedFrame()
+        if self.data is None:
+            success, result = self.prepare()
+            if not success:
+                return result
+            if self.frame_key is not None:
+                self.frame_cache[self.frame_key] = self.data
+
         # No pruning - maybe enable later as a user option
         self.pruned = []
         # try:
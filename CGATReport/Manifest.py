@@ -0,0 +1,281 @@
+'''Manifest of report directives.
+
+The manifest is a persistent dependency graph of a report. For each
+directive it records the document it appears in, the
+:class:`Tracker` it uses, the fingerprint of the tracker (code,
+options and the state of its data sources, see
+:func:`Cache.tracker2fingerprint`), the data sources themselves and
+the files that have been created together with their size and
+content hash and the text that has been inserted into the document.
+
+Checking if a directive is up to date thus requires a single
+lookup in the manifest. The manifest is also used by
+:mod:`CGATReport.clean` and :mod:`CGATReport.gallery` to find the
+files created by a directive.
+
+The manifest is stored as an sqlite database in the output
+directory of the report directive.
+'''
+
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import collections
+
+from CGATReport import Utils
+
+# name of the manifest database within the output directory
+MANIFEST_NAME = "manifest.db"
+
+# version of the database schema. Manifests with an older
+# schema are discarded.
+SCHEMA_VERSION = 2
+
+# seconds to wait for a lock held by another process
+TIMEOUT = 60
+
+# manifests of this process by output directory, see get_manifest()
+_MANIFESTS = {}
+_MANIFESTS_LOCK = threading.Lock()
+_MANIFESTS_PID = None
+
+SCHEMA = ("""CREATE TABLE IF NOT EXISTS directives (
+name TEXT PRIMARY KEY,
+document TEXT,
+lineno INTEGER,
+tracker TEXT,
+options_hash TEXT,
+fingerprint TEXT,
+sources TEXT,
+text TEXT,
+reason TEXT,
+updated REAL,
+pending INTEGER)""",
+          """CREATE INDEX IF NOT EXISTS directives_document
+ON directives (document)""",
+          """CREATE TABLE IF NOT EXISTS artifacts (
+name TEXT,
+path TEXT,
+size INTEGER,
+md5 TEXT,
+PRIMARY KEY (name, path))""")
+
+
+def get_md5(filename):
+    '''return md5 hexdigest of the contents of *filename*.'''
+    md5 = hashlib.md5()
+    with open(filename, "rb") as inf:
+        for block in iter(lambda: inf.read(1 << 20), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+class Manifest(object):
+    '''manifest of directives in the output directory *dirname*.
+
+    The database is created if it does not exist. Connections are
+    opened lazily, kept for each thread and not shared between
+    processes.
+    '''
+
+    def __init__(self, dirname=None):
+        if dirname is None:
+            dirname = Utils.getOutputDirectory()
+        self.filename = os.path.join(dirname, MANIFEST_NAME)
+        self.local = None
+        self.pid = None
+
+    def exists(self):
+        '''return True if the manifest database exists.'''
+        return os.path.exists(self.filename)
+
+    def connect(self):
+        '''return connection to the manifest database.
+
+        The schema is checked when a connection is opened. A new
+        connection is opened if the database has been removed.
+        '''
+        if self.local is None or self.pid != os.getpid():
+            self.local = threading.local()
+            self.pid = os.getpid()
+
+        db = getattr(self.local, "db", None)
+        if db is not None and self.exists():
+            return db
+
+        dirname = os.path.dirname(self.filename)
+        if dirname and not os.path.exists(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                pass
+        db = sqlite3.connect(self.filename, timeout=TIMEOUT)
+        db.row_factory = sqlite3.Row
+        # readers do not block the writers in other processes
+        db.execute("PRAGMA journal_mode=WAL")
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        with db:
+            if version != SCHEMA_VERSION:
+                db.execute("DROP TABLE IF EXISTS directives")
+                db.execute("DROP TABLE IF EXISTS artifacts")
+                db.execute("PRAGMA user_version = %i" % SCHEMA_VERSION)
+            for statement in SCHEMA:
+                db.execute(statement)
+        self.local.db = db
+        return db
+
+    def getRecords(self, where="", args=()):
+        '''return records of directives selected by the sql
+        condition *where* as a list of dictionaries.'''
+        records = collections.OrderedDict()
+        for row in self.connect().execute(
+                "SELECT d.*, a.path AS path, a.size AS size, a.md5 AS md5 "
+                "FROM directives AS d LEFT JOIN artifacts AS a "
+                "ON d.name = a.name %s ORDER BY d.name" % where, args):
+            row = dict(row)
+            name = row["name"]
+            if name not in records:
+                record = dict([(x, y) for x, y in row.items()
+                               if x not in ("path", "size", "md5")])
+                record["sources"] = json.loads(record["sources"])
+                record["artifacts"] = []
+                records[name] = record
+            if row["path"] is not None:
+                records[name]["artifacts"].append(
+                    {"path": row["path"],
+                     "size": row["size"],
+                     "md5": row["md5"]})
+        for record in records.values():
+            record["outputs"] = [x["path"] for x in record["artifacts"]]
+        return list(records.values())
+
+    def get(self, name):
+        '''return the record for directive *name* as a dictionary.
+
+        The record contains the files created by the directive
+        together with their size and md5 checksum in the field
+        ``artifacts``. Returns None if *name* is not in the manifest.
+        '''
+        records = self.getRecords("WHERE d.name = ?", (name,))
+        if not records:
+            return None
+        return records[0]
+
+    def find(self, pattern=None):
+        '''return records of directives with a tracker matching the
+        regular expression *pattern*. If *pattern* is None, all
+        records are returned.'''
+        records = self.getRecords()
+        if pattern is None:
+            return records
+        rx = re.compile(pattern)
+        return [x for x in records if rx.search(x["tracker"])]
+
+    def update(self, name, document, lineno, tracker, fingerprint,
+               sources, outputs, reason=None, pending=False,
+               options_hash=None, text=None):
+        '''record that directive *name* has been computed.
+
+        *outputs* are the files created. Their size and md5 checksum
+        are recorded. *text* is the restructured text inserted into
+        the document.
+
+        If *pending* is set, the document containing the directive
+        needs to be re-read by sphinx, see :meth:`getPendingDocuments`.
+        '''
+        artifacts = []
+        for filename in outputs:
+            try:
+                artifacts.append((name, filename,
+                                  os.path.getsize(filename),
+                                  get_md5(filename)))
+            except (IOError, OSError):
+                pass
+
+        with self.connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO directives VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, document, lineno, tracker, options_hash,
+                 fingerprint,
+                 json.dumps(sources, default=str),
+                 text,
+                 reason,
+                 time.time(),
+                 int(pending)))
+            db.execute("DELETE FROM artifacts WHERE name = ?", (name,))
+            db.executemany(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?)",
+                artifacts)
+
+    def remove(self, names):
+        '''remove directives *names* from the manifest.'''
+        with self.connect() as db:
+            for table in ("directives", "artifacts"):
+                db.executemany(
+                    "DELETE FROM %s WHERE name = ?" % table,
+                    [(x,) for x in names])
+
+    def getOutdatedReason(self, name, fingerprint=None, record=None):
+        '''return the reason why directive *name* needs to be
+        recomputed.
+
+        The fingerprint is only checked if *fingerprint* is given.
+        Files are checked for presence and size, but not read. If
+        *record* is given, the manifest is not queried.
+
+        Returns None if the directive is up to date.
+        '''
+        if record is None:
+            record = self.get(name)
+        if record is None:
+            return "not in manifest"
+        if fingerprint is not None and record["fingerprint"] != fingerprint:
+            return "tracker, options or data sources changed"
+        for artifact in record["artifacts"]:
+            try:
+                size = os.path.getsize(artifact["path"])
+            except OSError:
+                return "file %s is missing" % artifact["path"]
+            if size != artifact["size"]:
+                return "file %s has changed" % artifact["path"]
+        return None
+
+    def getPendingDocuments(self):
+        '''return documents with directives that have been computed
+        outside of sphinx since the documents were last read.'''
+        return set([x[0] for x in self.connect().execute(
+            "SELECT DISTINCT document FROM directives WHERE pending = 1")])
+
+    def clearPending(self, documents=None):
+        '''mark *documents* as read. If *documents* is None, all
+        documents are marked.'''
+        with self.connect() as db:
+            if documents is None:
+                db.execute("UPDATE directives SET pending = 0")
+            else:
+                db.executemany(
+                    "UPDATE directives SET pending = 0 WHERE document = ?",
+                    [(x,) for x in documents])
+
+
+def get_manifest():
+    '''return the manifest of the current report.
+
+    A single manifest is kept for each output directory in a
+    process, thus the database is only opened once.
+    '''
+    global _MANIFESTS_PID
+
+    dirname = os.path.abspath(Utils.getOutputDirectory())
+    with _MANIFESTS_LOCK:
+        if _MANIFESTS_PID != os.getpid():
+            _MANIFESTS.clear()
+            _MANIFESTS_PID = os.getpid()
+        if dirname not in _MANIFESTS:
+            _MANIFESTS[dirname] = Manifest(dirname)
+        return _MANIFESTS[dirname]
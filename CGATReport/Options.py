@@ -4,12 +4,122 @@ import re
 
 from docutils.parsers.rst import directives
 
-from CGATReport.Capabilities import get_all_plugins
 from CGATReport.Utils import get_params
 
 
 OPTIONS = None
 
+# options of the plugins in :mod:`CGATReport.Capabilities`. The
+# options are declared here so that the option spec can be built
+# without importing the plugins. New options of plugins need to be
+# added here as well.
+PLUGIN_OPTIONS = {
+    'collect': {},
+    'transform': {
+        'adj-method': directives.unchanged,
+        'keep-background': directives.flag,
+        'missing-value': directives.unchanged,
+        'p-value': directives.unchanged,
+        'pivot-column': directives.unchanged,
+        'pivot-index': directives.unchanged,
+        'pivot-value': directives.unchanged,
+        'tf-aggregate': directives.unchanged,
+        'tf-bins': directives.unchanged,
+        'tf-fields': directives.unchanged,
+        'tf-max-bins': directives.unchanged,
+        'tf-range': directives.unchanged,
+        'tf-rarify': directives.unchanged,
+        'tf-smooth-window-size': directives.length_or_unitless,
+        'tf-statement': directives.unchanged,
+    },
+    'render': {
+        'add-percent': directives.unchanged,
+        'add-rowindex': directives.unchanged,
+        'add-title': directives.flag,
+        'aes': directives.unchanged,
+        'as-lines': directives.flag,
+        'autoplay': directives.flag,
+        'bar-width': directives.unchanged,
+        'bins': directives.unchanged,
+        'bottom-value': directives.unchanged,
+        'col-regex': directives.unchanged,
+        'colorbar-format': directives.unchanged,
+        'colour': directives.unchanged,
+        'colours': directives.unchanged,
+        'columns': directives.unchanged,
+        'error': directives.unchanged,
+        'first-is-offset': directives.unchanged,
+        'force': directives.unchanged,
+        'format': directives.unchanged,
+        'format-columns': directives.unchanged,
+        'full-row-labels': directives.unchanged,
+        'function': directives.unchanged,
+        'geom': directives.unchanged,
+        'head': directives.length_or_unitless,
+        'html-class': directives.unchanged,
+        'kind': directives.unchanged,
+        'kwargs': directives.unchanged,
+        'label': directives.unchanged,
+        'language': directives.unchanged,
+        'large': directives.unchanged,
+        'large-html-class': directives.unchanged,
+        'large-rows': directives.length_or_unitless,
+        'legend-location': directives.unchanged,
+        'logscale': directives.unchanged,
+        'max-cols': directives.length_or_unitless,
+        'max-rows': directives.length_or_unitless,
+        'mpl-figure': directives.unchanged,
+        'mpl-legend': directives.unchanged,
+        'mpl-rc': directives.unchanged,
+        'mpl-subplot': directives.unchanged,
+        'no-legend': directives.unchanged,
+        'no-tight': directives.flag,
+        'nolabel-cols': directives.flag,
+        'nolabel-rows': directives.flag,
+        'orientation': directives.unchanged,
+        'original': directives.flag,
+        'palette': directives.unchanged,
+        'pie-first-is-total': directives.unchanged,
+        'pie-min-percentage': directives.unchanged,
+        'preview': directives.unchanged,
+        'regex-title': directives.unchanged,
+        'regression': directives.unchanged,
+        'reverse-palette': directives.flag,
+        'row-column': directives.unchanged,
+        'row-regex': directives.unchanged,
+        'separate': directives.unchanged,
+        'split-always': directives.unchanged,
+        'split-at': directives.nonnegative_int,
+        'split-cols': directives.unchanged,
+        'split-rows': directives.unchanged,
+        'statement': directives.unchanged,
+        'style': directives.unchanged,
+        'summary': directives.unchanged,
+        'switch': directives.unchanged,
+        'tail': directives.length_or_unitless,
+        'thumbnail-display': directives.positive_int,
+        'thumbnail-lanes': directives.positive_int,
+        'thumbnail-width': directives.positive_int,
+        'tight': directives.flag,
+        'title': directives.unchanged,
+        'transform-matrix': directives.unchanged,
+        'transparency': directives.unchanged,
+        'transpose': directives.unchanged,
+        'vline': directives.unchanged,
+        'xformat': directives.unchanged,
+        'xrange': directives.unchanged,
+        'xticks-action': directives.unchanged,
+        'xticks-max-chars': directives.length_or_unitless,
+        'xticks-rotation': directives.length_or_unitless,
+        'xtitle': directives.unchanged,
+        'yerror': directives.flag,
+        'yformat': directives.unchanged,
+        'yrange': directives.unchanged,
+        'ytitle': directives.unchanged,
+        'zrange': directives.unchanged,
+    },
+}
+
 
 def get_option_map():
 
@@ -17,13 +127,8 @@ def get_option_map():
 
     if OPTIONS is None:
         OPTIONS = {}
-        for section, plugins in get_all_plugins().items():
-            OPTIONS[section] = {}
-            for name, cls in list(plugins.items()):
-                try:
-                    OPTIONS[section].update(dict(cls.options))
-                except AttributeError:
-                    pass
+        for section, options in PLUGIN_OPTIONS.items():
+            OPTIONS[section] = dict(options)
 
         OPTIONS["dispatch"] = {
             'groupby': directives.unchanged,
@@ -38,6 +143,10 @@ def get_option_map():
             'restrict': directives.unchanged,
             'exclude': directives.unchanged,
             'nocache': directives.flag,
+            'parallel-collect': directives.unchanged,
+            'collect-jobs': directives.positive_int,
+            'parallel-render': directives.flag,
+            'render-jobs': directives.positive_int,
         }
 
         # options used in trackers
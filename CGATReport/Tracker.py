@@ -2,6 +2,7 @@ from __future__ import unicode_literals
 import os
 import sys
 import re
+import struct
 import yaml
 from collections import OrderedDict as odict
 import collections
@@ -10,6 +11,9 @@ import inspect
 import logging
 import glob
 import gzip
+import time
+import threading
+import multiprocessing
 
 
 # Python 2/3 Compatibility
@@ -23,10 +27,19 @@ import pandas
 import sqlalchemy
 import sqlalchemy.exc as exc
 import sqlalchemy.engine
+import sqlalchemy.event
+import sqlalchemy.pool
 import six
 
+try:
+    import pyarrow
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
 from CGATReport import Utils
 from CGATReport import Stats
+from CGATReport import DataTree
 
 
 class SQLError(Exception):
@@ -66,13 +79,572 @@ def getCallerLocals(level=4, decorators=0):
     return args[3]
 
 
+# placeholders in SQL statement templates
+_PLACEHOLDER_RX = re.compile(
+    r"%%|'%\((\w+)\)s'|%\((\w+)\)([-#0 +]*\d*(?:\.\d+)?[a-zA-Z])")
+
+# text preceding a placeholder that is a value: comparisons, LIKE,
+# BETWEEN, LIMIT and OFFSET clauses and the elements of IN lists.
+_VALUE_CONTEXT_RX = re.compile(
+    r"(?:[=<>]|\b(?:LIKE|GLOB|BETWEEN|LIMIT|OFFSET)|"
+    r"\bBETWEEN\s+(?:'[^']*'|[^\s']+)\s+AND|"
+    r"\bIN\s*\((?:(?:[^()]|%\(\w+\))*,)?)\s*$",
+    re.IGNORECASE)
+
+# statement templates that have been parsed, see getStatement()
+_STATEMENTS = {}
+
+# maximum number of parsed statements to keep. Statements built
+# by trackers with variable contents are not re-used.
+STATEMENT_CACHE_SIZE = 1024
+
+
+class Statement(object):
+    '''SQL statement template with ``%(name)s`` style placeholders.
+
+    The template is parsed once. Placeholders that are values are
+    bound as SQL parameters, such that the database can re-use the
+    query plan. These are quoted strings such as ``'%(slice)s'``
+    and stand-alone numbers such as ``%(min)i`` or ``%(min)f`` that
+    follow a comparison, ``LIKE``, ``BETWEEN``, ``LIMIT`` or
+    ``OFFSET`` or are part of an ``IN`` list. All other
+    placeholders, for example table and column names in
+    ``FROM '%(table)s'`` or positions in ``ORDER BY %(n)i``, are
+    interpolated into the statement text.
+    '''
+
+    def __init__(self, template):
+        self.template = template
+        # list of segments (kind, text, name, converter). kind is
+        # one of "text", "format" or "param", text is the literal
+        # text or the format of a placeholder and converter the
+        # type of a bound value.
+        self.segments = []
+        self.names = []
+        self.has_params = False
+
+        last = 0
+        for match in _PLACEHOLDER_RX.finditer(template):
+            self.addText(template[last:match.start()])
+            last = match.end()
+            quoted, name, spec = match.groups()
+            if match.group(0) == "%%":
+                self.addText("%")
+            elif quoted and self.isValue(template, match.start()):
+                self.addSegment("param", "'%%(%s)s'" % quoted, quoted, str)
+            elif quoted:
+                self.addSegment("format", "'%%(%s)s'" % quoted, quoted)
+            elif spec in ("i", "d", "f") and \
+                    self.isValue(template, match.start()) and \
+                    not self.isAdjacent(template, match.start() - 1) and \
+                    not self.isAdjacent(template, match.end()):
+                self.addSegment("param", match.group(0), name,
+                                float if spec == "f" else int)
+            else:
+                self.addSegment("format", match.group(0), name)
+        self.addText(template[last:])
+
+    def isValue(self, template, pos):
+        '''return True if the placeholder at *pos* is in a position
+        where SQL expects a value.'''
+        return _VALUE_CONTEXT_RX.search(template[:pos]) is not None
+
+    def isAdjacent(self, template, pos):
+        '''return True if the character at *pos* is part of a word
+        or literal.'''
+        if pos < 0 or pos >= len(template):
+            return False
+        c = template[pos]
+        return c.isalnum() or c in "_.'\""
+
+    def addText(self, text):
+        if text:
+            self.segments.append(("text", text, None, None))
+
+    def addSegment(self, kind, text, name, converter=None):
+        self.segments.append((kind, text, name, converter))
+        if name not in self.names:
+            self.names.append(name)
+        if kind == "param":
+            self.has_params = True
+
+    def bind(self, values):
+        '''return the SQL statement and the parameters for *values*.
+
+        *values* is a dictionary with the values for the placeholders.
+
+        If the statement has parameters, they are denoted as
+        ``:name`` and colons elsewhere in the statement are escaped
+        as required by :func:`sqlalchemy.text`.
+
+        returns a tuple (statement, parameters).
+        '''
+        if not self.has_params:
+            return self.interpolate(values), {}
+
+        parts, params = [], {}
+        for kind, text, name, converter in self.segments:
+            if kind == "text":
+                parts.append(text.replace(":", "\\:"))
+            elif kind == "format":
+                parts.append(
+                    (text % {name: values[name]}).replace(":", "\\:"))
+            else:
+                params[name] = converter(values[name])
+                parts.append(":%s" % name)
+        return "".join(parts), params
+
+    def interpolate(self, values):
+        '''return the SQL statement with all placeholders replaced by
+        *values*.'''
+        parts = []
+        for kind, text, name, converter in self.segments:
+            if kind == "text":
+                parts.append(text)
+            else:
+                parts.append(text % {name: values[name]})
+        return "".join(parts)
+
+
+def getStatement(template):
+    '''return the parsed :class:`Statement` for *template*.'''
+    try:
+        return _STATEMENTS[template]
+    except KeyError:
+        if len(_STATEMENTS) >= STATEMENT_CACHE_SIZE:
+            _STATEMENTS.clear()
+        statement = _STATEMENTS[template] = Statement(template)
+        return statement
+
+
+# number of rows fetched at a time when building arrays
+FETCH_SIZE = 100000
+
+
+def toArray(values):
+    '''convert a sequence of column *values* to a numpy array.
+
+    Numeric columns with missing values are converted to floats
+    with missing values set to NaN. Strings and mixed columns are
+    stored in arrays of type object.
+    '''
+    array = numpy.array(values)
+    if array.dtype.kind == "O":
+        try:
+            array = numpy.array(values, dtype=float)
+        except (TypeError, ValueError):
+            pass
+    elif array.dtype.kind in "SU":
+        array = numpy.array(values, dtype=object)
+    return array
+
+
+def fetchArrays(result, size=FETCH_SIZE):
+    '''fetch the rows in *result* as a dictionary of numpy arrays.
+
+    Rows are fetched in chunks of *size* rows that are converted
+    to arrays, such that the complete result is never held as
+    python tuples.
+
+    returns an ordered dictionary mapping column names to arrays.
+    The dictionary is empty if there is no result.
+    '''
+    columns = list(result.keys())
+    chunks = [[] for x in columns]
+    while True:
+        rows = result.fetchmany(size)
+        if not rows:
+            break
+        for chunk, values in zip(chunks, zip(*rows)):
+            chunk.append(toArray(values))
+
+    data = odict()
+    if not columns or not chunks[0]:
+        return data
+
+    for column, chunk in zip(columns, chunks):
+        if len(chunk) == 1:
+            data[column] = chunk[0]
+        else:
+            data[column] = numpy.concatenate(chunk)
+    return data
+
+
+def toValue(value):
+    '''convert a value taken from a dataframe to a python type.
+
+    Missing values are returned as None.
+    '''
+    if pandas.isnull(value):
+        return None
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+
+def unique(values):
+    '''return unique elements of *values* in order of appearance.'''
+    seen, result = set(), []
+    for value in values:
+        if value not in seen:
+            seen.add(value)
+            result.append(value)
+    return result
+
+
+def selectFrame(dataframe, paths):
+    '''select the data for *paths* from *dataframe*.
+
+    *dataframe* contains a row for each track and a column for
+    each slice. The returned dataframe is the same as the one built
+    from a data tree with a leaf for each path: missing values are
+    NaN and tracks and slices without any values are removed.
+
+    Returns None if *paths* are not all combinations of tracks and
+    slices.
+    '''
+    if not paths or len(set([len(path) for path in paths])) != 1 or \
+       len(paths[0]) != 2:
+        return None
+    tracks = unique([path[0] for path in paths])
+    slices = unique([path[1] for path in paths])
+    if len(paths) != len(tracks) * len(slices):
+        return None
+
+    frame = dataframe.reindex(index=tracks, columns=slices)
+    frame = frame.where(frame.notnull())
+    frame.dropna(axis=0, how="all", inplace=True)
+    frame.dropna(axis=1, how="all", inplace=True)
+    if frame.index.nlevels == 1:
+        frame.index.name = "track"
+    else:
+        frame.index.names = dataframe.index.names
+    return frame
+
+
+def getFileState(filename):
+    '''return a tuple describing the state of a file.
+
+    The tuple contains the absolute filename, its
+    modification time and its size. Time and size
+    are None if the file does not exist.
+    '''
+    filename = os.path.abspath(filename)
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return (filename, None, None)
+    return (filename, st.st_mtime, st.st_size)
+
+
+def getSQLiteState(filename):
+    '''return a tuple describing the state of an sqlite database.
+
+    In addition to the file state, the tuple contains the
+    file change counter stored in the database header. The
+    counter is incremented by every transaction that modifies
+    the database.
+    '''
+    state = getFileState(filename)
+    counter = None
+    try:
+        with open(filename, "rb") as inf:
+            header = inf.read(28)
+        if len(header) == 28 and header.startswith(b"SQLite format 3"):
+            counter = struct.unpack(">I", header[24:28])[0]
+    except (IOError, OSError):
+        pass
+    return state + (counter,)
+
+
 def quoteField(s):
     '''returns a quoted version of s for inclusion in SQL statements.'''
     # replace internal "'" with "\'"
     return re.sub("'", "''", s)
 
 
-@Utils.memoized
+# engines shared by all TrackerSQL instances in this process,
+# see getEngine()
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+_ENGINES_PID = None
+
+# schema caches of the engines in this process, see getSchemaCache()
+_SCHEMAS = {}
+
+# minimum number of connections kept open by sqlite engines. The
+# default is the number of threads used for parallel collection.
+POOL_SIZE = 5
+
+# seconds after which cached table names and columns are reloaded
+# for backends other than sqlite
+SCHEMA_TTL = 60
+
+
+def getDatabaseIdentity(backend, attach=()):
+    '''return a tuple identifying the sqlite database files of
+    *backend* and the attached databases *attach*.
+
+    The identity changes if a database file is replaced, for example
+    if it has been deleted and created again. Returns an empty
+    tuple for backends other than sqlite.
+    '''
+    if not backend.startswith("sqlite"):
+        return ()
+    filenames = [re.sub("sqlite:///", "", backend)]
+    filenames.extend([filename for filename, name in attach])
+    result = []
+    for filename in filenames:
+        try:
+            st = os.stat(filename)
+            result.append((st.st_dev, st.st_ino))
+        except OSError:
+            result.append(None)
+    return tuple(result)
+
+
+def isSQLiteFile(backend):
+    '''return True if *backend* is an sqlite database in a file.'''
+    return re.sub("sqlite:///?", "", backend) not in ("", ":memory:")
+
+
+def createEngine(backend, attach=(), creator=None):
+    '''create an sqlalchemy engine for *backend*.
+
+    *attach* is a list of tuples (filename, name) of sqlite databases
+    that are attached to each connection. sqlite engines keep their
+    connections open and hand them to any thread, such that threads
+    collecting data in parallel do not open the database (and attach
+    databases) for each query.
+    '''
+    # attach to additional databases (sqlite)
+    if attach:
+
+        if creator is not None:
+            raise NotImplementedError(
+                'attach not implemented if creator is set')
+
+        if not backend.startswith('sqlite'):
+            raise NotImplementedError(
+                'attach only implemented for sqlite backend')
+
+        def _my_creator():
+            # issuing the ATTACH DATABASE into the sqlalchemy
+            # ORM (self.db.execute(...))
+            # does not work. The database is attached, but tables
+            # are not accessible in later
+            # SELECT statements.
+            import sqlite3
+            conn = sqlite3.connect(
+                re.sub("sqlite:///", "", backend),
+                check_same_thread=False)
+            for filename, name in attach:
+                conn.execute("ATTACH DATABASE '%s' AS %s" %
+                             (os.path.abspath(filename),
+                              name))
+            return conn
+        creator = _my_creator
+
+    kwargs = {"echo": False}
+    if creator:
+        kwargs["creator"] = creator
+    if backend.startswith("sqlite") and isSQLiteFile(backend):
+        # a connection is only used by one thread at a time. The
+        # pool never blocks, connections beyond the pool size are
+        # closed when they are returned.
+        kwargs["poolclass"] = sqlalchemy.pool.QueuePool
+        kwargs["pool_size"] = max(POOL_SIZE, multiprocessing.cpu_count())
+        kwargs["max_overflow"] = -1
+        if not creator:
+            kwargs["connect_args"] = {"check_same_thread": False}
+
+    db = sqlalchemy.create_engine(backend, **kwargs)
+    if not db:
+        raise ValueError(
+            "could not connect to database %s" % backend)
+
+    db.echo = False
+    return db
+
+
+def getEngine(backend, attach=(), creator=None):
+    '''return the engine for *backend* shared by all trackers
+    in this process.
+
+    Engines are identified by the backend, the attached databases
+    *attach* and the connection *creator*. Engines are not shared
+    with forked processes and are re-created if an sqlite database
+    file has been replaced.
+    '''
+    global _ENGINES_PID
+
+    attach = tuple([tuple(x) for x in attach])
+    key = (backend, attach, creator)
+    identity = getDatabaseIdentity(backend, attach)
+
+    with _ENGINES_LOCK:
+        if _ENGINES_PID != os.getpid():
+            # connections of the parent process can not be used
+            _ENGINES.clear()
+            _SCHEMAS.clear()
+            _ENGINES_PID = os.getpid()
+
+        record = _ENGINES.get(key, None)
+        if record is not None and record["identity"] != identity:
+            record["engine"].dispose()
+            _SCHEMAS.pop(record["engine"], None)
+            record = None
+
+        if record is None:
+            logging.debug("creating engine for %s" % backend)
+            record = {"backend": backend,
+                      "attach": attach,
+                      "identity": identity,
+                      "engine": createEngine(backend, attach, creator),
+                      "trackers": 0,
+                      "connections": 0,
+                      "checkouts": 0}
+
+            def _connect(dbapi_connection, connection_record):
+                record["connections"] += 1
+
+            def _checkout(dbapi_connection, connection_record,
+                          connection_proxy):
+                record["checkouts"] += 1
+
+            sqlalchemy.event.listen(record["engine"], "connect", _connect)
+            sqlalchemy.event.listen(record["engine"], "checkout", _checkout)
+            _ENGINES[key] = record
+
+        record["trackers"] += 1
+        return record["engine"]
+
+
+def getEngineStatistics():
+    '''return statistics of the engines in this process.
+
+    returns a list of dictionaries with the backend, the attached
+    databases, the number of trackers that have used the engine,
+    the number of database connections that have been opened and
+    the number of times a connection has been checked out from the
+    pool.
+    '''
+    with _ENGINES_LOCK:
+        if _ENGINES_PID != os.getpid():
+            return []
+        return [{"backend": x["backend"],
+                 "attach": x["attach"],
+                 "trackers": x["trackers"],
+                 "connections": x["connections"],
+                 "checkouts": x["checkouts"],
+                 "pool": x["engine"].pool.status()}
+                for x in _ENGINES.values()]
+
+
+def disposeEngines():
+    '''close all connections and remove all shared engines.'''
+    with _ENGINES_LOCK:
+        if _ENGINES_PID == os.getpid():
+            for record in _ENGINES.values():
+                record["engine"].dispose()
+        _ENGINES.clear()
+        _SCHEMAS.clear()
+
+
+class SchemaCache(object):
+    '''cache of table names and columns in the database *db*
+    with the attached databases *attach*.
+
+    For sqlite databases, the cache is invalidated if the schema
+    version of any of the databases changes, i.e. if a table
+    has been created, altered or dropped. For other backends,
+    the cache expires after *ttl* seconds.
+
+    The cache is shared by all trackers using the same engine,
+    see :func:`getSchemaCache`.
+    '''
+
+    def __init__(self, db, attach=(), ttl=SCHEMA_TTL):
+        self.db = db
+        self.attach = attach
+        self.ttl = ttl
+        self.is_sqlite = db.dialect.name == "sqlite"
+        self.lock = threading.RLock()
+        self.version = None
+        self.tables = None
+        self.sorted_tables = None
+        self.databases = {}
+        self.columns = {}
+
+    def getVersion(self):
+        '''return the current version of the schema.'''
+        if not self.is_sqlite:
+            return int(time.time() / self.ttl)
+
+        conn = self.db.raw_connection()
+        try:
+            cursor = conn.cursor()
+            version = [cursor.execute(
+                "PRAGMA schema_version").fetchone()[0]]
+            for filename, name in self.attach:
+                version.append(cursor.execute(
+                    "PRAGMA %s.schema_version" % name).fetchone()[0])
+        finally:
+            conn.close()
+        return tuple(version)
+
+    def validate(self):
+        '''empty the cache if the schema has changed.'''
+        version = self.getVersion()
+        if version != self.version:
+            self.tables = self.sorted_tables = None
+            self.databases = {}
+            self.columns = {}
+            self.version = version
+
+    def getTableNames(self, database=None):
+        '''return a set of table names, see :func:`getTableNames`.'''
+        with self.lock:
+            self.validate()
+            if database is not None:
+                if database not in self.databases:
+                    self.databases[database] = getTableNames(
+                        self.db, database=database)
+                return self.databases[database]
+            if self.tables is None:
+                self.tables = getTableNames(self.db, attach=self.attach)
+                self.sorted_tables = sorted(self.tables)
+            return self.tables
+
+    def getSortedTableNames(self, database=None):
+        '''return a sorted list of table names.'''
+        with self.lock:
+            tables = self.getTableNames(database)
+            if database is not None:
+                return sorted(tables)
+            return self.sorted_tables
+
+    def getColumns(self, tablename):
+        '''return column information for table *tablename*, see
+        :func:`getTableColumns`.'''
+        with self.lock:
+            self.validate()
+            if tablename not in self.columns:
+                self.columns[tablename] = getTableColumns(
+                    self.db, tablename, attach=self.attach)
+            return self.columns[tablename]
+
+
+def getSchemaCache(db, attach=()):
+    '''return the schema cache for engine *db* shared by all
+    trackers in this process.'''
+    with _ENGINES_LOCK:
+        if db not in _SCHEMAS:
+            _SCHEMAS[db] = SchemaCache(
+                db, attach=tuple([tuple(x) for x in attach]))
+        return _SCHEMAS[db]
+
+
 def getTableNames(db, database=None, attach=None):
     '''return a set of table names.'''
 
@@ -163,6 +735,14 @@ class Tracker(object):
 
     would return the lengths of blue cars.
 
+    Trackers that can compute the data for many paths more
+    efficiently at once, for example with a single SQL statement,
+    can implement the method ``getBatch(paths)``. It receives a list
+    of paths (tuples of track, slice, ...) and returns a dictionary
+    mapping each path to its data. If present, the method is
+    preferred over calling the tracker for each path. Paths missing
+    from the dictionary are collected individually.
+
     This class accepts the following user arguments:
 
     datadir : string (optional)
@@ -175,6 +755,10 @@ class Tracker(object):
     # set to False, if results of tracker should be cached
     cache = True
 
+    # set to "threads" or "processes" to collect data paths
+    # in parallel
+    parallel_collect = None
+
     # default: empty tracks/slices
     # tracks = []
     # slices = []
@@ -206,6 +790,11 @@ class Tracker(object):
     #     """
     #     return self.paths
 
+    # def getBatch(self, paths):
+    #     """return a dictionary mapping each path in *paths* to its data.
+    #     """
+    #     return dict([(path, self(*path)) for path in paths])
+
     def getShortCaption(self):
         """return one line caption.
 
@@ -226,6 +815,18 @@ class Tracker(object):
         raise NotImplementedError(
             "Tracker not fully implemented -> __call__ missing")
 
+    def getDataSources(self):
+        """return a list describing the data sources of this tracker.
+
+        Each entry is a tuple describing a data source and its current
+        state, for example a filename together with its modification
+        time and size (see :func:`getFileState`). A change in the
+        data sources will invalidate cached results.
+
+        The default is to return an empty list.
+        """
+        return []
+
     def members(self, locals=None):
         '''function similar to locals() but returning member variables of this
         tracker.
@@ -273,6 +874,9 @@ class TrackerSingleFile(Tracker):
 
         self.filename = kwargs['filename'].strip()
 
+    def getDataSources(self):
+        return [getFileState(self.filename)]
+
 
 class TrackerMultipleFiles(Tracker):
 
@@ -324,6 +928,9 @@ class TrackerMultipleFiles(Tracker):
                 "regular expression requires exactly one group enclosed in ()")
         self.regex = re.compile(self.regex)
 
+    def getDataSources(self):
+        return [getFileState(x) for x in sorted(glob.glob(self.glob))]
+
     def openFile(self, track):
         '''open a file.'''
         filename = self.mapTrack2File[track]
@@ -459,6 +1066,9 @@ class TrackerImages(Tracker):
             raise ValueError("TrackerImages requires a:glob: parameter")
         self.glob = kwargs["glob"]
 
+    def getDataSources(self):
+        return [getFileState(x) for x in sorted(glob.glob(self.glob))]
+
     def getTracks(self, subset=None):
         g = glob.glob(self.glob)
         if len(g) == 0:
@@ -479,8 +1089,8 @@ class TrackerSQL(Tracker):
     The pattern should contain at least one group. If there are multiple
     groups, these will be associated as tracks/slices.
 
-    This tracker connects to the database. Each tracker will establish
-    its own connection for efficient multi-processing.
+    This tracker connects to the database. Trackers within a process
+    share connections to the same database, see :func:`getEngine`.
 
     If:attr:`as_tables` is set, the full table names will be returned.
     The default is to apply:attr:`pattern` and return the result.
@@ -531,69 +1141,44 @@ class TrackerSQL(Tracker):
             self.as_tables = self.mAsTables
 
     def connect(self, creator=None):
-        """lazy connection function."""
+        """lazy connection function.
+
+        Trackers using the same backend and attached databases share
+        an engine and its connections, see :func:`getEngine`.
+        """
 
         if not self.db:
 
             logging.debug("connecting to %s" % self.backend)
 
-            # attach to additional databases (sqlite)
-            if self.attach:
-
-                if creator is not None:
-                    raise NotImplementedError(
-                        'attach not implemented if creator is set')
+            self.db = getEngine(self.backend,
+                                attach=self.attach,
+                                creator=creator)
 
-                if not self.backend.startswith('sqlite'):
-                    raise NotImplementedError(
-                        'attach only implemented for sqlite backend')
-
-                def _my_creator():
-                    # issuing the ATTACH DATABASE into the sqlalchemy
-                    # ORM (self.db.execute(...))
-                    # does not work. The database is attached, but tables
-                    # are not accessible in later
-                    # SELECT statements.
-                    import sqlite3
-                    conn = sqlite3.connect(
-                        re.sub("sqlite:///", "", self.backend))
-                    for filename, name in self.attach:
-                        conn.execute("ATTACH DATABASE '%s' AS %s" %
-                                     (os.path.abspath(filename),
-                                      name))
-                    return conn
-                creator = _my_creator
-
-            # creator can not be None.
-            if creator:
-                db = sqlalchemy.create_engine(self.backend,
-                                              echo=False,
-                                              creator=creator)
-            else:
-                db = sqlalchemy.create_engine(self.backend,
-                                              echo=False)
-
-            if not db:
-                raise ValueError(
-                    "could not connect to database %s" % self.backend)
+            logging.debug("connected to %s" % self.backend)
 
-            db.echo = False
+    def getDatabaseFiles(self):
+        '''return a list of sqlite database files this tracker uses.
 
-            # ignore unknown type BigInt warnings
-            # Note that this step can take a while on large databases
-            # with many tables and many columns
-            if db and False:
-                try:
-                    with warnings.catch_warnings():
-                        warnings.simplefilter("ignore")
-                        self.metadata = sqlalchemy.MetaData(
-                            db, reflect=True)
-                except AttributeError:
-                    self.metadata = sqlalchemy.MetaData(db, reflect=True)
+        Returns an empty list if the backend is not sqlite.
+        '''
+        if not self.backend.startswith("sqlite"):
+            return []
+        filenames = [re.sub("sqlite:///", "", self.backend)]
+        filenames.extend([filename for filename, name in self.attach])
+        return filenames
 
-            self.db = db
+    def getDataSources(self):
+        '''return the state of all databases this tracker uses.
 
-            logging.debug("connected to %s" % self.backend)
+        For sqlite databases, the state contains the file change
+        counter in addition to the modification time and size. For
+        other backends only the backend is returned and changes in
+        the data will not be detected.
+        '''
+        if not self.backend.startswith("sqlite"):
+            return [(self.backend,)]
+        return [getSQLiteState(x) for x in self.getDatabaseFiles()]
 
     def rconnect(self, creator=None):
         '''open connection within R to database.'''
@@ -625,16 +1210,14 @@ class TrackerSQL(Tracker):
         returns a sorted list of table names.
         """
         self.connect()
-        sorted_tables = sorted(getTableNames(
-            self.db,
-            database=database,
-            attach=self.attach))
+        sorted_tables = getSchemaCache(
+            self.db, self.attach).getSortedTableNames(database)
 
         if pattern:
             rx = re.compile(pattern)
             return [x for x in sorted_tables if rx.search(x)]
         else:
-            return sorted_tables
+            return list(sorted_tables)
 
     def getTableNames(self, pattern=None):
         '''return a list of tablenames matching a *pattern*.
@@ -644,13 +1227,14 @@ class TrackerSQL(Tracker):
     def hasTable(self, tablename):
         """return table with name *tablename*."""
         self.connect()
-        return tablename in getTableNames(self.db, attach=self.attach)
+        return tablename in getSchemaCache(
+            self.db, self.attach).getTableNames()
 
     def getColumns(self, tablename):
         '''return a list of columns in table *tablename*.'''
 
         self.connect()
-        columns = getTableColumns(self.db, tablename, attach=self.attach)
+        columns = getSchemaCache(self.db, self.attach).getColumns(tablename)
 
         return [re.sub("%s[.]" % tablename, "", x['name']) for x in columns]
 
@@ -690,19 +1274,59 @@ class TrackerSQL(Tracker):
             return result
         return None
 
-    def execute(self, stmt):
+    def execute(self, stmt, params=None):
+        '''execute SQL statement *stmt*.
+
+        If *params* are given, *stmt* is executed as a
+        :func:`sqlalchemy.text` statement with bound parameters.
+        '''
         self.connect()
         try:
-            r = self.db.execute(stmt)
+            if params:
+                r = self.db.execute(sqlalchemy.text(stmt), params)
+            else:
+                r = self.db.execute(stmt)
         except exc.SQLAlchemyError as msg:
             raise SQLError(msg)
         return r
 
+    def getStatementValues(self, statement):
+        '''return values for the placeholders in *statement*.
+
+        Values are taken from the local variables of the method
+        that called the SQL functions of this tracker or from
+        member variables. Only the placeholders in *statement*
+        are looked up.
+        '''
+        f = sys._getframe(1)
+        while f is not None and f.f_code in _TRACKER_SQL_CODE:
+            f = f.f_back
+        local_vars = f.f_locals if f is not None else {}
+
+        values = {}
+        for name in statement.names:
+            if name in local_vars:
+                values[name] = local_vars[name]
+            else:
+                try:
+                    values[name] = getattr(self, name)
+                except AttributeError:
+                    raise KeyError(name)
+        return values
+
+    def prepareStatement(self, stmt):
+        '''return SQL statement and parameters for statement
+        template *stmt*, see :class:`Statement`.
+
+        returns a tuple (statement, parameters).
+        '''
+        statement = getStatement(stmt)
+        return statement.bind(self.getStatementValues(statement))
+
     def buildStatement(self, stmt):
         '''fill in placeholders in stmt.'''
-        kwargs = self.members(getCallerLocals())
-        statement = stmt % dict(list(kwargs.items()))
-        return statement
+        statement = getStatement(stmt)
+        return statement.interpolate(self.getStatementValues(statement))
 
     # --------------------------------------------------
     # Functions returning the results of SQL statements
@@ -718,7 +1342,7 @@ class TrackerSQL(Tracker):
 
         Returns None if result is empty.
         """
-        e = self.execute(self.buildStatement(stmt)).fetchone()
+        e = self.execute(*self.prepareStatement(stmt)).fetchone()
         if e:
             return list(e)
         else:
@@ -732,7 +1356,7 @@ class TrackerSQL(Tracker):
 
         Returns None if result is empty.
         """
-        e = self.execute(self.buildStatement(stmt)).fetchone()
+        e = self.execute(*self.prepareStatement(stmt)).fetchone()
         # assumes that values are sorted in ResultProxy.keys()
         if e:
             return odict([x, e[x]] for x in list(e.keys()))
@@ -747,7 +1371,7 @@ class TrackerSQL(Tracker):
 
         Returns an empty list if there is no result.
         """
-        e = self.execute(self.buildStatement(stmt)).fetchall()
+        e = self.execute(*self.prepareStatement(stmt)).fetchall()
 
         if e:
             return [x[0] for x in e]
@@ -767,7 +1391,7 @@ class TrackerSQL(Tracker):
         Returns an empty dictionary if there is no result.
         """
         # convert to tuples
-        e = self.execute(self.buildStatement(stmt))
+        e = self.execute(*self.prepareStatement(stmt))
         columns = list(e.keys())
         d = e.fetchall()
         return odict(list(zip(columns, list(zip(*d)))))
@@ -780,7 +1404,35 @@ class TrackerSQL(Tracker):
 
         Returns an empty list if there is no result.
         """
-        return self.execute(self.buildStatement(stmt)).fetchall()
+        return self.execute(*self.prepareStatement(stmt)).fetchall()
+
+    def getArrays(self, stmt):
+        """return all rows from SQL statement *stmt* as a dictionary
+        of numpy arrays.
+
+        Example: SELECT column1, column2 FROM table
+        Example: { 'column1': array([1,2,3]), 'column2': array([2,4,2]) }
+
+        The result is equivalent to :meth:`getAll`, but rows are
+        fetched in chunks and stored as typed arrays, see
+        :func:`fetchArrays`.
+
+        Returns an empty dictionary if there is no result.
+        """
+        return fetchArrays(self.execute(*self.prepareStatement(stmt)))
+
+    def getArrowTable(self, stmt):
+        """return all rows from SQL statement *stmt* as a
+        :class:`pyarrow.Table`.
+
+        Requires pyarrow.
+        """
+        if not HAS_ARROW:
+            raise ImportError("getArrowTable requires pyarrow")
+        data = fetchArrays(self.execute(*self.prepareStatement(stmt)))
+        return pyarrow.Table.from_arrays(
+            [pyarrow.array(x, from_pandas=True) for x in data.values()],
+            names=list(data.keys()))
 
     def getDict(self, stmt):
         """return results from SQL statement *stmt* as a dictionary.
@@ -794,7 +1446,7 @@ class TrackerSQL(Tracker):
         that can be used for matrix visualization.
         """
         # convert to tuples
-        e = self.execute(self.buildStatement(stmt))
+        e = self.execute(*self.prepareStatement(stmt))
         columns = list(e.keys())
         result = odict()
         for row in e:
@@ -813,8 +1465,7 @@ class TrackerSQL(Tracker):
         This function will return the first value in the first row
         from a SELECT statement.
         """
-        statement = self.buildStatement(stmt)
-        result = self.execute(statement).fetchone()
+        result = self.execute(*self.prepareStatement(stmt)).fetchone()
         if result is None:
             return result
         return result[0]
@@ -831,7 +1482,11 @@ class TrackerSQL(Tracker):
 
         '''
         self.connect()
-        return pandas.read_sql(self.buildStatement(stmt),
+        statement, params = self.prepareStatement(stmt)
+        if params:
+            statement = sqlalchemy.text(statement)
+            kwargs["params"] = params
+        return pandas.read_sql(statement,
                                self.db,
                                **kwargs)
 
@@ -845,7 +1500,7 @@ class TrackerSQL(Tracker):
 
     #     Returns an empty list if there is no result.
     #     """
-    #     return self.execute(self.buildStatement(stmt)).fetchall()
+    #     return self.execute(*self.prepareStatement(stmt)).fetchall()
 
     # def get(self, stmt):
     #     """deprecated - use getRows instead."""
@@ -865,16 +1520,23 @@ class TrackerSQL(Tracker):
     # def getRow(self, stmt):
     #     '''return results of SQL statement as pandas dataframe
     #     '''
-    #     e = self.execute(self.buildStatement(stmt))
+    #     e = self.execute(*self.prepareStatement(stmt))
     #     return pandas.Series(e.fetchone())
 
     # def getFirstRow(self, stmt):
     #     '''return first row of SQL statement as pandas Series.
     #     '''
-    #     e = self.execute(self.buildStatement(stmt))
+    #     e = self.execute(*self.prepareStatement(stmt))
     #     return pandas.Series(e.fetchone())
 
 
+# code of TrackerSQL methods, skipped when looking up the caller
+# of the SQL functions, see TrackerSQL.getStatementValues()
+_TRACKER_SQL_CODE = frozenset(
+    [x.__code__ for x in TrackerSQL.__dict__.values()
+     if inspect.isfunction(x)])
+
+
 class TrackerSQLCheckTables(TrackerSQL):
     """Tracker that examines the presence/absence of a certain
     field in a list of tables.
@@ -1093,6 +1755,10 @@ class SingleTableTrackerRows(TrackerSQL):
     :py:attr:`where` is an optional where that will be added as a
     WHERE clause to the SQL statement
 
+    The table is loaded into :py:attr:`dataframe`. Values are
+    returned as python types, values in integer columns that
+    contain NULL values are returned as floats.
+
     '''
     exclude_columns = ()
     table = None
@@ -1101,6 +1767,8 @@ class SingleTableTrackerRows(TrackerSQL):
     sort = None
     loaded = False
     where = None
+    dataframe = None
+    _data = None
 
     # not called by default as Mixin class
     def __init__(self, *args, **kwargs):
@@ -1138,17 +1806,55 @@ class SingleTableTrackerRows(TrackerSQL):
             self._slices = [x for x in self._slices
                             if not re.search("[:+-]", x)]
 
-            data = self.get("SELECT %s, %s FROM %s" %
-                            (",".join(self.fields),
-                             ",".join(self._slices),
-                             self.table))
-            self.data = odict()
-            for d in data:
-                tr = tuple(d[:nfields])
-                self.data[tr] = odict(list(zip(self._slices,
-                                               tuple(d[nfields:]))))
+            columns = list(self.fields) + self._slices
+            data = fetchArrays(self.execute(
+                "SELECT %s, %s FROM %s" %
+                (",".join(self.fields),
+                 ",".join(self._slices),
+                 self.table)))
+            dataframe = pandas.DataFrame(
+                odict(list(zip(columns, data.values()))),
+                columns=columns)
+            dataframe.set_index(list(self.fields), inplace=True)
+            # rows are unique for each track, keep the last as before
+            self.dataframe = dataframe[
+                ~dataframe.index.duplicated(keep="last")]
+            self._data = None
+
+            # name the index as a dataframe built from a data tree
+            if nfields == 1:
+                self.dataframe.index.name = "track"
+            else:
+                self.dataframe.index.names = DataTree.getLevelNames(
+                    self, nfields)[:nfields]
         self.loaded = True
 
+    @property
+    def data(self):
+        '''dictionary mapping a tuple of :py:attr:`fields` of each
+        track to a dictionary with the value of each slice.
+
+        Subclasses that load the data themselves can set this
+        dictionary instead of :py:attr:`dataframe`. Once the
+        dictionary has been used, values are taken from it, such
+        that changes to it are visible.
+        '''
+        if self._data is None and self.dataframe is not None:
+            self._data = odict()
+            for track, values in zip(self.dataframe.index,
+                                     self.dataframe.itertuples(
+                                         index=False, name=None)):
+                if not isinstance(track, tuple):
+                    track = (track,)
+                self._data[track] = odict(
+                    [(x, toValue(y))
+                     for x, y in zip(self.dataframe.columns, values)])
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
     @property
     def tracks(self):
         if not self.hasTable(self.table):
@@ -1171,9 +1877,24 @@ class SingleTableTrackerRows(TrackerSQL):
     def __call__(self, track, slice=None):
         if not self.loaded:
             self._load()
-        if len(self.fields) == 1:
-            track = (track,)
-        return self.data[track][slice]
+        if self._data is not None or self.dataframe is None:
+            if len(self.fields) == 1:
+                track = (track,)
+            return self.data[track][slice]
+        return toValue(self.dataframe.loc[track, slice])
+
+    def getBatchFrame(self, paths):
+        '''return data for all *paths* as a dataframe with a row for
+        each track and a column for each slice.
+
+        Returns None if *paths* are not all combinations of tracks
+        and slices or if values are taken from :py:attr:`data`.
+        '''
+        if not self.loaded:
+            self._load()
+        if self._data is not None or self.dataframe is None:
+            return None
+        return selectFrame(self.dataframe, paths)
 
 
 class SingleTableTrackerColumns(TrackerSQL):
@@ -1235,6 +1956,66 @@ class SingleTableTrackerColumns(TrackerSQL):
             data = self.getValues("SELECT %(track)s FROM %(table)s")
         return data
 
+    def getBatch(self, paths):
+        '''return data for all *paths* from a single statement.'''
+        tracks = []
+        for path in paths:
+            if path[0] not in tracks:
+                tracks.append(path[0])
+        fields = ",".join(tracks)
+
+        result = odict()
+        if self.column:
+            # keep the first row for each value as in __call__
+            rows = odict()
+            for row in self.execute(
+                    "SELECT %s, %s FROM %s" %
+                    (self.column, fields, self.table)):
+                rows.setdefault(str(row[0]), row[1:])
+            for path in paths:
+                row = rows.get(str(path[1]))
+                if row is None:
+                    result[path] = None
+                else:
+                    result[path] = row[tracks.index(path[0])]
+        else:
+            rows = self.execute(
+                "SELECT %s FROM %s" % (fields, self.table)).fetchall()
+            for path in paths:
+                x = tracks.index(path[0])
+                result[path] = [row[x] for row in rows]
+        return result
+
+    def getBatchFrame(self, paths):
+        '''return data for all *paths* as a dataframe with a row for
+        each track and a column for each slice.
+
+        Returns None if :attr:`column` is not set or *paths* are not
+        all combinations of tracks and slices.
+        '''
+        if not self.column:
+            return None
+        tracks = unique([path[0] for path in paths])
+        data = fetchArrays(self.execute(
+            "SELECT %s, %s FROM %s" %
+            (self.column, ",".join(tracks), self.table)))
+        columns = [self.column] + tracks
+        dataframe = pandas.DataFrame(
+            odict(list(zip(columns, data.values()))),
+            columns=columns)
+        # keep the first row for each value as in __call__
+        dataframe.index = dataframe[self.column].astype(str)
+        dataframe = dataframe[~dataframe.index.duplicated(keep="first")]
+
+        # slices without values have been removed from the frame
+        labels = dict([(str(path[-1]), path[-1]) for path in paths])
+        frame = selectFrame(dataframe[tracks].transpose(),
+                            [tuple(path[:-1]) + (str(path[-1]),)
+                             for path in paths])
+        if frame is not None:
+            frame.columns = [labels[x] for x in frame.columns]
+        return frame
+
 
 class SingleTableTrackerEdgeList(TrackerSQL):
 
@@ -1502,7 +2283,7 @@ class SingleTableTrackerHistogram(TrackerSQL):
                 "column not set - Tracker not fully implemented")
         # labels need to be consistent in order
         # so rename track to value.
-        data = self.getAll(
+        data = self.getArrays(
             "SELECT %(column)s, %(track)s AS %(value)s FROM %(table)s")
         return data
 
@@ -1556,7 +2337,35 @@ class MultipleTableTrackerHistogram(TrackerSQL):
         if slice not in self.getColumns(track):
             return None
 
-        return self.getAll("""SELECT %(column)s, %(slice)s FROM %(track)s""")
+        return self.getArrays(
+            """SELECT %(column)s, %(slice)s FROM %(track)s""")
+
+    def getBatch(self, paths):
+        '''return data for all *paths* with a single statement per table.'''
+        slices = odict()
+        for track, slice in paths:
+            slices.setdefault(track, []).append(slice)
+
+        result = odict()
+        for track, track_slices in slices.items():
+            columns = self.getColumns(track)
+            present = [x for x in track_slices if x in columns]
+            for slice in track_slices:
+                # no data if column does not exist in particular table
+                result[(track, slice)] = None
+            if not present:
+                continue
+            fields = ",".join(present)
+            values = list(fetchArrays(self.execute(
+                "SELECT %s, %s FROM %s" %
+                (self.column, fields, track))).values())
+            for x, slice in enumerate(present):
+                if values:
+                    result[(track, slice)] = odict(
+                        ((self.column, values[0]), (slice, values[x + 1])))
+                else:
+                    result[(track, slice)] = odict()
+        return result
 
     # def __call__(self, track):
 
@@ -1606,6 +2415,11 @@ class TrackerSQLMulti(TrackerSQL):
 
             self.connect(creator=_my_creator)
 
+    def getDatabaseFiles(self):
+        filenames = TrackerSQL.getDatabaseFiles(self)
+        filenames.extend([os.path.join(x, "csvdb") for x in self.databases])
+        return filenames
+
 
 class TrackerMultipleLists(TrackerSQL):
 
@@ -1714,6 +2528,9 @@ class MeltedTableTracker(TrackerSQL):
     tracks = "all"
     pattern = None
     column_name = 'track'
+    # maximum number of tables combined in a single statement
+    # (SQLITE_MAX_COMPOUND_SELECT)
+    max_compound_select = 500
 
     def __init__(self, *args, **kwargs):
         TrackerSQL.__init__(self, *args, **kwargs)
@@ -1727,7 +2544,7 @@ class MeltedTableTracker(TrackerSQL):
 
         ref_columns = self.getColumns(tables[0])
         fields = ",".join(ref_columns)
-        results = []
+        statements = []
         for table in tables:
             columns = self.getColumns(table)
             if columns != ref_columns:
@@ -1737,13 +2554,34 @@ class MeltedTableTracker(TrackerSQL):
 
             track = re.search(self.pattern, table).groups()[0]
 
-            results.extend(
-                self.get(
-                    "SELECT '%(track)s' as track, %(fields)s FROM %(table)s"))
+            statements.append(
+                "SELECT '%s' as track, %s FROM %s" % (track, fields, table))
+
+        # combine tables into as few statements as possible
+        results = []
+        for x in range(0, len(statements), self.max_compound_select):
+            values = list(fetchArrays(self.execute(
+                " UNION ALL ".join(
+                    statements[x:x + self.max_compound_select]))).values())
+            if values:
+                results.append(values)
+
+        if not results:
+            return odict()
 
         ref_columns.insert(0, self.column_name)
 
-        return odict(list(zip(ref_columns, list(zip(*results)))))
+        return odict([(column, numpy.concatenate([x[y] for x in results]))
+                      for y, column in enumerate(ref_columns)])
+
+    def getBatch(self, paths):
+        '''return data for all *paths*.
+
+        The melted table does not depend on the track, thus it is
+        computed only once.
+        '''
+        data = self(*paths[0])
+        return odict([(path, data) for path in paths])
 
 
 class MeltedTableTrackerDataframe(MeltedTableTracker):
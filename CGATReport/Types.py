@@ -4,7 +4,7 @@ import re
 from collections import OrderedDict
 from six import string_types, integer_types
 
-ContainerTypes = (tuple, list, type(numpy.zeros(0)))
+ContainerTypes = (tuple, list, type(numpy.zeros(0)), numpy.memmap)
 DictionaryTypes = (dict, OrderedDict)
 
 # Taken from numpy.ScalarType, but removing the types object and unicode
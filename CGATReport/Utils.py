@@ -5,6 +5,8 @@ import traceback
 import math
 import glob
 import pkgutil
+import threading
+import collections
 import pandas
 
 from logging import warning
@@ -22,7 +24,8 @@ import CGATReport
 from CGATReport.ResultBlock import ResultBlocks, ResultBlock
 import CGATReport.Component as Component
 import CGATReport.Config
-from CGATReport.Types import quote_filename, quote_rst, is_string, as_list
+from CGATReport.Types import quote_filename, quote_rst, is_string, as_list, \
+    get_encoding
 
 # set with keywords that will not be pruned
 # This is important for the User Tracker
@@ -46,6 +49,32 @@ PARAMS = {
     "report_images": "hires,hires.png,200,eps,eps,50",
 }
 
+# copy of the default values, see reset_parameters()
+DEFAULT_PARAMS = dict(PARAMS)
+
+
+# maximum number of return values kept by a memoized function
+MEMOIZED_SIZE = 256
+
+# all memoized functions, see clear_memoized()
+_MEMOIZED = []
+
+
+def freeze(value):
+    '''return a hashable version of *value*.
+
+    Dictionaries, lists and sets are converted recursively.
+    Raises TypeError if *value* can not be hashed.
+    '''
+    if isinstance(value, dict):
+        return (dict, frozenset([(x, freeze(y)) for x, y in value.items()]))
+    elif isinstance(value, (list, tuple)):
+        return (type(value), tuple([freeze(x) for x in value]))
+    elif isinstance(value, (set, frozenset)):
+        return (frozenset, frozenset([freeze(x) for x in value]))
+    hash(value)
+    return value
+
 
 # read placeholders from config file in current directory
 # It would be nice to read default values, but the location
@@ -55,29 +84,60 @@ class memoized(object):
     """Decorator that caches a function's return value each time it is called.
     If called later with the same arguments, the cached value is returned, and
     not re-evaluated.
+
+    The key is built from the positional arguments and the names and
+    values of the keyword arguments. Calls with arguments that can not
+    be hashed are not cached.
+
+    At most :data:`MEMOIZED_SIZE` values are kept, the least recently
+    used value is discarded first. Use :func:`clear_memoized` to clear
+    all caches, for example at the start of a build.
     """
 
-    def __init__(self, func):
+    def __init__(self, func, maxsize=MEMOIZED_SIZE):
         self.func = func
-        self.cache = {}
+        self.maxsize = maxsize
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        _MEMOIZED.append(self)
 
     def __call__(self, *args, **kwargs):
         try:
-            return self.cache[args + list(kwargs)]
-        except KeyError:
-            self.cache[
-                args + list(kwargs)] = value = self.func(*args, **kwargs)
-            return value
+            key = freeze((args, kwargs))
         except TypeError:
-            # uncachable -- for instance, passing a list as an argument.
+            # uncachable -- for instance, passing an array as an argument.
             # Better to not cache than to blow up entirely.
             return self.func(*args, **kwargs)
 
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+        value = self.func(*args, **kwargs)
+
+        with self.lock:
+            self.cache[key] = value
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        return value
+
+    def clear(self):
+        """remove all cached values."""
+        with self.lock:
+            self.cache.clear()
+
     def __repr__(self):
         """Return the function's docstring."""
         return self.func.__doc__
 
 
+def clear_memoized():
+    '''clear the caches of all memoized functions.'''
+    for x in _MEMOIZED:
+        x.clear()
+
+
 def getDataFrameLevels(dataframe,
                        test_for_trivial=False):
     '''return numbers of levels in the index
@@ -277,6 +337,12 @@ def update_parameters(filenames):
 # If 'inifile' is in conf.py, read it first.
 
 
+def reset_parameters():
+    '''reset the parameter dictionary to the default values.'''
+    PARAMS.clear()
+    PARAMS.update(DEFAULT_PARAMS)
+
+
 def get_parameters():
     return update_parameters(
         filenames=[getattr(CGATReport.Config, 'inifile', None)] +
@@ -747,6 +813,23 @@ def build_paths(reference):
 
     return basedir, filename, basename, ext, outdir, codename, notebookname
 
+
+def writeFileIfChanged(filename, lines):
+    '''write *lines* to *filename* unless the file exists and has
+    the same contents.
+
+    returns True if the file has been written.
+    '''
+    text = "".join(lines)
+    if os.path.exists(filename):
+        with open(filename, "r", encoding=get_encoding()) as inf:
+            if inf.read() == text:
+                return False
+
+    with open(filename, "w", encoding=get_encoding()) as outf:
+        outf.write(text)
+    return True
+
 NOTEBOOK_TEMPLATE = """
 <!DOCTYPE html>
 <html>
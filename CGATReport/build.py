@@ -3,17 +3,300 @@
 """cgatreport-build
 ==================
 
-:command:`cgatreport-build` used to be a pre-processor for restructured
-texts. It has now been deprecated. The current implementation simply
-calls sphinx.
+:command:`cgatreport-build` runs sphinx after pre-computing the
+output of all ``report`` directives in parallel. It is called as::
+
+   cgatreport-build [OPTIONS] sphinx-build [SPHINX OPTIONS]
+
+for example::
+
+   cgatreport-build --num-jobs=8 sphinx-build -b html -d _build/doctrees . _build/html
+
+Before sphinx is started, all restructured text documents in the
+source directory are scanned for ``report`` directives. Duplicate
+directives are removed and the remaining directives are executed
+in a pool of:option:`-j/--num-jobs` processes. Each directive saves
+its text and images in :file:`_static/report_directive`, such that
+sphinx only needs to insert the existing text.
+
+Directives within directives that are not known to docutils, for
+example sphinx specific directives such as ``only``, are not found
+by the scan. These are executed by sphinx as usual.
+
+The options are:
+
+**-j/--num-jobs** number
+   Number of directives to execute in parallel.
+
+**--incremental**
+   Only recompute directives whose tracker code, tracker options or
+   data sources have changed since they were last computed. The
+   directives that have been skipped and the reasons for recomputing
+   the others are reported.
+
+**--no-precompute**
+   Do not pre-compute directives, just run sphinx.
+
+If a :command:`cgatreport-daemon` is running in the current
+directory, directives are pre-computed within the daemon.
 
 """
 
+import io
+import os
 import sys
 import optparse
 import subprocess
+import collections
+import multiprocessing
 from logging import warn
+
+from docutils.core import publish_doctree
+from docutils.parsers.rst import directives
+from docutils.parsers.rst import Directive
+
 from CGATReport import Component
+from CGATReport import Dispatcher
+from CGATReport import Utils
+from CGATReport import daemon
+from CGATReport import report_directive
+from CGATReport.Options import get_option_spec
+
+# sphinx-build options that take a value
+SPHINX_VALUE_OPTIONS = ("-b", "-d", "-j", "-c", "-D", "-A", "-t", "-w")
+
+# directives found while parsing a document
+_DIRECTIVES = []
+
+
+class RecordingDirective(Directive):
+    '''directive recording the arguments of a ``report`` directive
+    instead of executing it.
+
+    Options are converted with the same option specification as
+    in the report directive.
+    '''
+    required_arguments = 1
+    optional_arguments = 0
+    has_content = True
+    final_argument_whitespace = True
+
+    option_spec = get_option_spec()
+
+    def run(self):
+        _DIRECTIVES.append((self.arguments,
+                            self.options,
+                            self.lineno,
+                            list(self.content)))
+        return []
+
+
+def getSphinxDirectories(args):
+    '''return source and configuration directory from the
+    sphinx-build command line *args*.
+    '''
+    positional, confdir = [], None
+    x = 1
+    while x < len(args):
+        arg = args[x]
+        if arg in SPHINX_VALUE_OPTIONS:
+            if arg == "-c":
+                confdir = args[x + 1]
+            x += 2
+            continue
+        if not arg.startswith("-"):
+            positional.append(arg)
+        x += 1
+
+    if not positional:
+        raise ValueError("no source directory in %s" % " ".join(args))
+
+    srcdir = positional[0]
+    if confdir is None:
+        confdir = srcdir
+    return os.path.abspath(srcdir), os.path.abspath(confdir)
+
+
+def loadConfiguration(confdir):
+    '''execute :file:`conf.py` in *confdir* like sphinx does.
+
+    returns the configuration namespace.
+    '''
+    filename = os.path.join(confdir, "conf.py")
+    namespace = {"__file__": filename}
+    if not os.path.exists(filename):
+        return namespace
+
+    cwd = os.getcwd()
+    os.chdir(confdir)
+    try:
+        with open(filename) as inf:
+            exec(compile(inf.read(), filename, "exec"), namespace)
+    finally:
+        os.chdir(cwd)
+    return namespace
+
+
+def loadParameters(confdir):
+    '''read the report parameters from the ini files in *confdir*.
+
+    The parameters are read from the same files as when sphinx
+    loads the report extension.
+
+    returns the parameter dictionary.
+    '''
+    cwd = os.getcwd()
+    os.chdir(confdir)
+    try:
+        return Utils.get_parameters()
+    finally:
+        os.chdir(cwd)
+
+
+def collectDirectives(srcdir, suffix=".rst"):
+    '''return all report directives in documents within *srcdir*.
+
+    Documents are parsed with docutils and errors due to
+    sphinx specific markup are ignored. Directories starting
+    with ``_`` or ``.`` are skipped.
+
+    Identical directives are returned only once.
+
+    returns a list of tuples (arguments, options, lineno, content,
+    document).
+    '''
+    directives.register_directive("report", RecordingDirective)
+
+    result, seen = [], set()
+    for root, dirs, files in os.walk(srcdir):
+        dirs[:] = sorted([x for x in dirs
+                          if not x.startswith("_") and
+                          not x.startswith(".")])
+        for f in sorted(files):
+            if not f.endswith(suffix):
+                continue
+            document = os.path.join(root, f)
+            with open(document, encoding="utf-8") as inf:
+                text = inf.read()
+            if ".. report::" not in text:
+                continue
+
+            del _DIRECTIVES[:]
+            publish_doctree(
+                text,
+                source_path=document,
+                settings_overrides={"report_level": 5,
+                                    "halt_level": 5,
+                                    "warning_stream": io.StringIO()})
+
+            for arguments, options, lineno, content in _DIRECTIVES:
+                key = (tuple(arguments),
+                       repr(sorted(options.items())),
+                       tuple(content))
+                if key in seen:
+                    continue
+                seen.add(key)
+                result.append(
+                    (arguments, options, lineno, content, document))
+
+    return result
+
+
+def _init_worker(params):
+    '''initialize worker process with the report parameters of the
+    parent process.'''
+    Utils.PARAMS.update(params)
+
+
+def runDirective(args):
+    '''execute a report directive in a worker process.
+
+    returns a dictionary with the status of the directive.
+    '''
+    arguments, options, lineno, content, document, srcdir, incremental = args
+
+    status = {"document": document,
+              "lineno": lineno,
+              "action": "failed",
+              "reason": None}
+    try:
+        report_directive.run(arguments,
+                             options,
+                             lineno,
+                             content,
+                             document=document,
+                             srcdir=srcdir,
+                             builddir=os.getcwd(),
+                             incremental=incremental,
+                             status=status)
+    except Exception as msg:
+        Component.get_logger().warn(
+            "cgatreport-build: precomputing %s:%i failed: %s" %
+            (document, lineno, msg))
+        status["action"] = "failed"
+        status["reason"] = str(msg)
+    return status
+
+
+def precompute(srcdir, confdir, num_jobs=2, incremental=False):
+    '''execute all report directives in documents within *srcdir*
+    in a pool of *num_jobs* processes.
+
+    If *incremental* is set, only directives whose tracker or data
+    have changed are recomputed.
+
+    returns a list with the status of each directive.
+    '''
+    logger = Component.get_logger()
+
+    namespace = loadConfiguration(confdir)
+    suffix = namespace.get("source_suffix", ".rst")
+    if not isinstance(suffix, str):
+        suffix = list(suffix)[0]
+
+    # directives use the parameters of the project, which are
+    # read before any tracker is created.
+    loadParameters(confdir)
+
+    # trackers and data trees are shared between the directives
+    # of a build
+    Utils.clear_memoized()
+    Dispatcher.clear_trees()
+
+    todo = collectDirectives(srcdir, suffix=suffix)
+    logger.info("cgatreport-build: precomputing %i directives with "
+                "%i processes" % (len(todo), num_jobs))
+
+    tasks = [x + (srcdir, incremental) for x in todo]
+    if num_jobs > 1:
+        pool = multiprocessing.Pool(num_jobs,
+                                    initializer=_init_worker,
+                                    initargs=(dict(Utils.PARAMS),))
+        try:
+            results = pool.map(runDirective, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = list(map(runDirective, tasks))
+
+    counts = collections.Counter([x["action"] for x in results])
+    logger.info("cgatreport-build: precomputed %i directives: %s" %
+                (len(results), str(dict(counts))))
+    return results
+
+
+def reportStatus(results, outfile=sys.stdout):
+    '''write status of directives to *outfile*.'''
+    for action in ("skipped", "computed", "failed"):
+        selected = [x for x in results if x["action"] == action]
+        outfile.write("%s: %i directives\n" % (action, len(selected)))
+        for x in selected:
+            if x["reason"]:
+                outfile.write("   %s:%i: %s\n" %
+                              (x["document"], x["lineno"], x["reason"]))
+            else:
+                outfile.write("   %s:%i\n" % (x["document"], x["lineno"]))
 
 
 def main(argv=None):
@@ -27,11 +310,23 @@ def main(argv=None):
     parser.add_option("-j", "-a", "--num-jobs", dest="num_jobs", type="int",
                       help="number of parallel jobs to run [default=%default]")
 
+    parser.add_option("--incremental", dest="incremental",
+                      action="store_true",
+                      help="only recompute directives whose tracker or "
+                      "data have changed [default=%default]")
+
+    parser.add_option("--no-precompute", dest="precompute",
+                      action="store_false",
+                      help="do not pre-compute report directives "
+                      "[default=%default]")
+
     parser.add_option("-v", "--verbose", dest="loglevel", type="int",
                       help="loglevel. The higher, the more output "
                       "[default=%default]")
 
     parser.set_defaults(num_jobs=2,
+                        precompute=True,
+                        incremental=False,
                         loglevel=10,)
 
     parser.disable_interspersed_args()
@@ -41,6 +336,22 @@ def main(argv=None):
     assert args[0].endswith(
         "sphinx-build"), "command line should contain sphinx-build"
 
+    if options.precompute:
+        srcdir, confdir = getSphinxDirectories(args)
+        # use a running cgatreport-daemon with warm trackers
+        try:
+            results = daemon.submit("precompute",
+                                    srcdir=srcdir,
+                                    confdir=confdir,
+                                    num_jobs=options.num_jobs,
+                                    incremental=options.incremental)
+        except (OSError, EOFError):
+            results = precompute(srcdir, confdir,
+                                 num_jobs=options.num_jobs,
+                                 incremental=options.incremental)
+        if options.incremental:
+            reportStatus(results)
+
     command = " ".join(args)
 
     try:
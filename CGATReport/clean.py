@@ -8,7 +8,7 @@ cgatreport-clean
 with:class:`Tracker` thus allowing it to be re-built the next
 time:command:`sphinx` is invoked as::
 
-   cgatreport-clean [clean|distclean|cache|Tracker1] [Tracker2] [...]
+   cgatreport-clean [clean|distclean|cache|gc|Tracker1] [Tracker2] [...]
 
 The full list of command line options is listed by suppling:option:`-h/--help`
 on the command line.
@@ -34,11 +34,26 @@ The options are:
    in the current directory. Without the documents, the clean command will not be able
    to remove all documents that refer to a:term:`tracker`.
 
+**--max-size** size
+   Maximum size of the cache for the ``gc`` target, for example
+   ``500M`` or ``10G``.
+
+**--max-age** age
+   Maximum age of cached data for the ``gc`` target, for example
+   ``12h`` or ``30d``. Numbers without a unit are interpreted as days.
+
 If there is only one target and it is ``clean``, ``distclean``,
 the full build we cleaned up. If it is ``cache``, only the cache
 will be cleaned forcing newly built:class:`Tracker` objects to recompute
 their data.
 
+If the target is ``gc``, cached data are removed until the cache
+is within the limits set by the ``--max-size`` and ``--max-age``
+options. Data that have not been used for the longest time are
+removed first::
+
+   cgatreport-clean --max-size=10G --max-age=30d gc
+
 Alternatively, if one or more than one:class:`Tracker` is given, all
 documents referencing these will be removed to force a re-built next
 time:command:`sphinx` is invoked.
@@ -61,6 +76,9 @@ import glob
 import optparse
 import shutil
 
+from CGATReport import Cache
+from CGATReport import Manifest
+
 USAGE = """python %s [OPTIONS] target
 
 clean all data according to target.
@@ -127,7 +145,49 @@ def removeTracker(tracker,
     test_f = lambda x: rx1.search(x) or rx2.search(
         x) or rx3.search(x) or rx4.search(x)
 
-    return deleteFiles(test_f, dirs_to_check, dry_run=dry_run)
+    removed = deleteFiles(test_f, dirs_to_check, dry_run=dry_run)
+
+    # remove the files recorded in the manifest, which includes
+    # files not matching the patterns above
+    removed.extend([x for x in removeArtifacts(pattern, dry_run=dry_run)
+                    if x not in removed])
+
+    # each tracker is cached in a directory of its own
+    if os.path.isdir("_cache"):
+        for d in os.listdir("_cache"):
+            dd = os.path.join("_cache", d)
+            if os.path.isdir(dd) and rx2.search(d):
+                if not dry_run:
+                    shutil.rmtree(dd)
+                removed.append(dd)
+
+    return removed
+
+
+def removeArtifacts(pattern, dry_run=False):
+    """remove all files recorded in the manifest for directives
+    with a tracker matching ``pattern``.
+
+    The directives are removed from the manifest.
+    """
+    manifest = Manifest.get_manifest()
+    if not manifest.exists():
+        return []
+
+    removed = []
+    records = manifest.find(pattern)
+    for record in records:
+        for filename in record["outputs"]:
+            if not os.path.exists(filename):
+                continue
+            if not dry_run:
+                os.remove(filename)
+            removed.append(filename)
+
+    if not dry_run:
+        manifest.remove([x["name"] for x in records])
+
+    return removed
 
 
 def removeText(pattern,
@@ -173,6 +233,43 @@ def removeText(pattern,
     return deleteFiles(test_f, dirs_to_check, dry_run=dry_run)
 
 
+def parseSize(size):
+    """convert *size* with an optional unit (K, M, G, T) to bytes."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    size = size.strip().upper().rstrip("B")
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(float(size))
+
+
+def parseAge(age):
+    """convert *age* with an optional unit (s, m, h, d, w) to seconds.
+
+    Numbers without a unit are interpreted as days.
+    """
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+    age = age.strip().lower()
+    if age and age[-1] in units:
+        return float(age[:-1]) * units[age[-1]]
+    return float(age) * units["d"]
+
+
+def collectGarbage(max_size=None, max_age=None, dry_run=False):
+    """remove least recently used data from the cache.
+
+    Prints the number of bytes reclaimed per tracker.
+    """
+    reclaimed = Cache.collect_garbage("_cache",
+                                      max_size=max_size,
+                                      max_age=max_age,
+                                      dry_run=dry_run)
+    print("tracker\tbytes")
+    for tracker, nbytes in sorted(reclaimed.items()):
+        print("%s\t%i" % (tracker, nbytes))
+    print("total\t%i" % sum(reclaimed.values()))
+    return reclaimed
+
+
 def main():
 
     parser = optparse.OptionParser(version="%prog version: $Id$", usage=USAGE)
@@ -193,7 +290,17 @@ def main():
     parser.add_option("-n", "--dry-run", dest="dry_run", action="store_true",
                       help="only show what is about to be deleted, but do not delete [default=%default]")
 
+    parser.add_option("--max-size", dest="max_size", type="string",
+                      help="maximum size of the cache for target gc, "
+                      "for example 10G [default=%default]")
+
+    parser.add_option("--max-age", dest="max_age", type="string",
+                      help="maximum age of cached data for target gc, "
+                      "for example 30d [default=%default]")
+
     parser.set_defaults(loglevel=2,
+                        max_size=None,
+                        max_age=None,
                         dry_run=False,
                         path=RSTDIR,
                         builddir=".",
@@ -205,7 +312,19 @@ def main():
         print(USAGE)
         raise ValueError("please supply at least one target.""")
 
-    if len(args) == 1 and args[0] in ("clean", "distclean", "cache"):
+    if len(args) == 1 and args[0] == "gc":
+        if options.max_size is None and options.max_age is None:
+            raise ValueError("gc requires --max-size or --max-age")
+        if options.dry_run:
+            print("the following data will be removed:")
+        collectGarbage(
+            max_size=(parseSize(options.max_size)
+                      if options.max_size else None),
+            max_age=(parseAge(options.max_age)
+                     if options.max_age else None),
+            dry_run=options.dry_run)
+
+    elif len(args) == 1 and args[0] in ("clean", "distclean", "cache"):
         dirs = []
         target = args[0]
         if target in ("clean", "distclean"):
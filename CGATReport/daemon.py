@@ -0,0 +1,368 @@
+#!/bin/env python
+
+"""cgatreport-daemon
+===================
+
+:command:`cgatreport-daemon` runs a long-running process that keeps
+python modules and database connections in memory between
+invocations of :command:`cgatreport-test` and
+:command:`cgatreport-build`. :class:`Tracker` objects and data held
+in memory are discarded at the start of every job, as the data of a
+tracker might have changed in the meantime. It is called as::
+
+   cgatreport-daemon [OPTIONS] [start|stop|status|serve]
+
+in the directory of a report. The actions are:
+
+**start**
+   start the daemon in the background.
+
+**stop**
+   stop a running daemon.
+
+**status**
+   report whether the daemon is running and the usage of its
+   database connections.
+
+**serve**
+   run the daemon in the foreground.
+
+While the daemon is running, :command:`cgatreport-build` pre-computes
+directives within the daemon and :command:`cgatreport-test` renders
+within the daemon if no interactive output is requested, for
+example::
+
+   cgatreport-test -t Tracker -r line-plot --no-show --hardcopy=plot%s.png
+
+If the daemon is not running, both commands run as usual.
+
+Jobs are submitted through a Unix socket in the current directory
+that is only accessible by the user who started the daemon. Jobs
+are executed one at a time in the working directory of the client.
+
+The options are:
+
+**-s/--socket** filename
+   Filename of the socket. The default is :file:`.cgatreport-daemon.sock`.
+
+"""
+
+import io
+import os
+import sys
+import time
+import pickle
+import socket
+import struct
+import optparse
+import traceback
+import threading
+import contextlib
+import subprocess
+import socketserver
+
+# socket the daemon listens on, relative to the report directory
+DEFAULT_SOCKET = ".cgatreport-daemon.sock"
+
+# seconds to wait for a daemon to start
+START_TIMEOUT = 60
+
+# options of cgatreport-test that require the client process
+INTERACTIVE_OPTIONS = ("-i", "--start-interpreter",
+                       "-I", "--ii", "--start-ipython")
+
+
+class DaemonError(Exception):
+    '''exception raised if a job failed within the daemon.'''
+    pass
+
+
+def sendMessage(sock, message):
+    '''send pickled *message* through *sock*.'''
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(struct.pack("!Q", len(data)) + data)
+
+
+def receiveMessage(sock):
+    '''receive a message sent with :func:`sendMessage`.'''
+
+    def _receive(size):
+        chunks = []
+        while size > 0:
+            chunk = sock.recv(min(size, 1 << 20))
+            if not chunk:
+                raise EOFError("connection closed by peer")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    size = struct.unpack("!Q", _receive(8))[0]
+    return pickle.loads(_receive(size))
+
+
+def submit(command, socket_path=DEFAULT_SOCKET, **kwargs):
+    '''submit job *command* with arguments *kwargs* to the daemon.
+
+    The job is executed in the current working directory.
+
+    Raises OSError if the daemon is not running and
+    :class:`DaemonError` if the job failed.
+
+    returns the result of the job.
+    '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sendMessage(sock, {"command": command,
+                           "cwd": os.getcwd(),
+                           "kwargs": kwargs})
+        response = receiveMessage(sock)
+    finally:
+        sock.close()
+
+    if response["status"] != "ok":
+        raise DaemonError(response["result"])
+    return response["result"]
+
+
+def isRunning(socket_path=DEFAULT_SOCKET):
+    '''return True if a daemon is listening on *socket_path*.'''
+    try:
+        submit("ping", socket_path=socket_path)
+    except (OSError, EOFError, DaemonError):
+        return False
+    return True
+
+
+def warmUp():
+    '''import the modules needed by the jobs.'''
+    import matplotlib
+    matplotlib.use("Agg")
+    import CGATReport.test
+    import CGATReport.build
+
+
+def startJob():
+    '''clear state kept from previous jobs.
+
+    Trackers and data in memory might be outdated, as the data of
+    trackers can change between jobs without their modules being
+    modified. Imported modules and database engines are kept.
+
+    The parameters are reset and read from the ini files in the
+    working directory of the job, thus parameters of a previous
+    job in a different report are not used.
+    '''
+    from CGATReport import Cache, Dispatcher, Utils
+    Utils.reset_parameters()
+    Utils.get_parameters()
+    Utils.clear_memoized()
+    Dispatcher.clear_trees()
+    Cache.get_memory_cache().clear()
+
+
+def runTest(argv):
+    '''run cgatreport-test with the command line *argv*.
+
+    returns a tuple (return code, output).
+    '''
+    import matplotlib.pyplot as plt
+    import CGATReport.test
+
+    startJob()
+
+    output = io.StringIO()
+    retcode = 0
+    with contextlib.redirect_stdout(output):
+        try:
+            CGATReport.test.main(argv=list(argv))
+        except SystemExit as msg:
+            retcode = msg.code
+        finally:
+            plt.close("all")
+    return retcode, output.getvalue()
+
+
+def runPrecompute(srcdir, confdir, num_jobs=2, incremental=False):
+    '''pre-compute all directives, see :func:`CGATReport.build.precompute`.
+    '''
+    from CGATReport import build
+
+    startJob()
+    return build.precompute(srcdir, confdir,
+                            num_jobs=num_jobs,
+                            incremental=incremental)
+
+
+def getEngineStatistics():
+    '''return statistics of the database engines in the daemon,
+    see :func:`CGATReport.Tracker.getEngineStatistics`.'''
+    from CGATReport import Tracker
+    return Tracker.getEngineStatistics()
+
+
+# jobs the daemon can execute
+JOBS = {
+    "ping": lambda: os.getpid(),
+    "test": runTest,
+    "precompute": runPrecompute,
+    "engines": getEngineStatistics,
+}
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    '''execute a job within the daemon.'''
+
+    def handle(self):
+        request = receiveMessage(self.request)
+        command = request["command"]
+
+        if command == "stop":
+            sendMessage(self.request, {"status": "ok",
+                                       "result": os.getpid()})
+            threading.Thread(target=self.server.shutdown).start()
+            return
+
+        # jobs run in the directory of the client and must not
+        # change the state of the daemon
+        cwd, path = os.getcwd(), list(sys.path)
+        try:
+            os.chdir(request["cwd"])
+            result = JOBS[command](**request["kwargs"])
+            response = {"status": "ok", "result": result}
+        except Exception:
+            response = {"status": "error",
+                        "result": traceback.format_exc()}
+        finally:
+            os.chdir(cwd)
+            sys.path[:] = path
+
+        sendMessage(self.request, response)
+
+
+class Daemon(socketserver.UnixStreamServer):
+    '''daemon executing jobs submitted through the Unix socket
+    *socket_path*.
+
+    Jobs are executed one at a time.
+    '''
+
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        self.socket_path = os.path.abspath(socket_path)
+        if os.path.exists(self.socket_path):
+            if isRunning(self.socket_path):
+                raise OSError("daemon is already running on %s" %
+                              socket_path)
+            os.unlink(self.socket_path)
+
+        # pickled jobs are executed, restrict access to the user.
+        # The path is not made absolute, as socket paths are limited
+        # to about 100 characters.
+        umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.__init__(
+                self, socket_path, RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def start(socket_path=DEFAULT_SOCKET):
+    '''start the daemon in a background process and wait until
+    it accepts jobs.'''
+    if isRunning(socket_path):
+        return
+    subprocess.Popen(
+        [sys.executable, "-m", "CGATReport.daemon",
+         "--socket=%s" % socket_path, "serve"],
+        stdin=subprocess.DEVNULL,
+        start_new_session=True)
+
+    for x in range(START_TIMEOUT * 10):
+        if isRunning(socket_path):
+            return
+        time.sleep(0.1)
+    raise OSError("daemon did not start within %i seconds" % START_TIMEOUT)
+
+
+def test_main(argv=None):
+    '''run cgatreport-test within the daemon if it is running.
+
+    Interactive sessions and displaying plots require the client
+    process, thus these run in-process.
+    '''
+    if argv is None:
+        argv = sys.argv
+
+    interactive = [x for x in argv[1:] if x in INTERACTIVE_OPTIONS]
+    show = "--no-show" not in argv
+    if not interactive and not show:
+        try:
+            retcode, output = submit("test", argv=argv)
+        except (OSError, EOFError):
+            pass
+        else:
+            sys.stdout.write(output)
+            return retcode
+
+    from CGATReport import test
+    return test.main(argv=argv)
+
+
+def main(argv=None):
+
+    if argv is None:
+        argv = sys.argv
+
+    parser = optparse.OptionParser(version="%prog version: $Id$",
+                                   usage=globals()["__doc__"])
+
+    parser.add_option("-s", "--socket", dest="socket", type="string",
+                      help="filename of the socket [default=%default]")
+
+    parser.set_defaults(socket=DEFAULT_SOCKET)
+
+    (options, args) = parser.parse_args(argv[1:])
+
+    if len(args) != 1 or args[0] not in ("start", "stop", "status", "serve"):
+        parser.error("please specify one of start, stop, status or serve")
+
+    action = args[0]
+
+    if action == "serve":
+        warmUp()
+        daemon = Daemon(options.socket)
+        try:
+            daemon.serve_forever()
+        finally:
+            daemon.server_close()
+    elif action == "start":
+        start(options.socket)
+        print("daemon is running on %s" % options.socket)
+    elif action == "stop":
+        try:
+            pid = submit("stop", socket_path=options.socket)
+            print("stopped daemon %i" % pid)
+        except (OSError, EOFError):
+            print("daemon is not running")
+    elif action == "status":
+        if isRunning(options.socket):
+            print("daemon %i is running on %s" % (
+                submit("ping", socket_path=options.socket), options.socket))
+            for engine in submit("engines", socket_path=options.socket):
+                print("%(backend)s: trackers=%(trackers)i "
+                      "connections=%(connections)i "
+                      "checkouts=%(checkouts)i" % engine)
+        else:
+            print("daemon is not running")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
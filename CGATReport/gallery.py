@@ -21,6 +21,8 @@ import re
 import collections
 import sys
 
+from CGATReport import Manifest
+
 template = """\
 {%% extends "layout.html" %%}
 {%% set title = "Thumbnail gallery" %%}
@@ -89,6 +91,23 @@ map_image2file = collections.defaultdict(set)
 basedir = '_build/html'
 
 
+def getCaptionFiles(thisdir):
+    """return the text elements of all directives in *thisdir*.
+
+    The text elements are taken from the manifest. If there is
+    no manifest, the directory is searched.
+    """
+    manifest = Manifest.Manifest(thisdir)
+    if not manifest.exists():
+        return sorted(glob.glob(os.path.join(thisdir, '*.txt')))
+
+    captionfiles = []
+    for record in manifest.find():
+        captionfiles.extend([x for x in record["outputs"]
+                             if x.endswith(".txt") and os.path.exists(x)])
+    return sorted(captionfiles)
+
+
 def main(argv=sys.argv):
 
     for root, dirs, files in os.walk(basedir):
@@ -119,7 +138,7 @@ def main(argv=sys.argv):
         # we search for pdfs here because there is one pdf for each
         # successful image build (2 pngs since one is high res) and the
         # mapping between py files and images is 1->many
-        for captionfile in sorted(glob.glob(os.path.join(thisdir, '*.txt'))):
+        for captionfile in getCaptionFiles(thisdir):
             basepath, filename = os.path.split(captionfile)
             basename, ext = os.path.splitext(filename)
             # print 'generating', subdir, basename
@@ -25,9 +25,10 @@ from docutils.parsers.rst import directives
 from docutils.parsers.rst import Directive
 
 from CGATReport import Config, Dispatcher, Utils, Cache, Component
+from CGATReport import Manifest
 from CGATReport.ResultBlock import ResultBlocks, ResultBlock
 from CGATReport.Types import as_list, force_encode, get_encoding
-from CGATReport.Capabilities import get_renderer, get_transformers, get_plugins, make_tracker
+from CGATReport.Capabilities import get_renderer, get_transformers, get_collectors, make_tracker
 from CGATReport.Options import get_option_spec, select_and_delete_options, get_option_map, update_options
 from CGATReport.Utils import get_default_display_options
 
@@ -50,6 +51,49 @@ def out_of_date(original, derived):
             os.stat(derived).st_mtime < os.stat(original).st_mtime)
 
 
+def get_outdated_reason(template_name, tracker_name, tracker_options,
+                        record=None):
+    """return the reason why the output of a directive is outdated.
+
+    *record* is the record of the directive in the manifest if it
+    has been retrieved before.
+
+    Returns None if the output is up to date.
+    """
+    try:
+        code, tracker, tracker_path = make_tracker(
+            tracker_name, (), tracker_options)
+    except Exception as msg:
+        return "tracker could not be created: %s" % msg
+    if not tracker:
+        return "tracker not found"
+    return Manifest.get_manifest().getOutdatedReason(
+        template_name,
+        Cache.tracker2fingerprint(tracker, tracker_options),
+        record=record)
+
+
+def get_outdated_documents(app, env, added, changed, removed):
+    """return documents that need to be re-read by sphinx as their
+    directives have been computed by :mod:`CGATReport.build`.
+    """
+    manifest = Manifest.get_manifest()
+    documents = manifest.getPendingDocuments()
+    if not documents:
+        return []
+    result = [docname for docname in env.found_docs
+              if os.path.abspath(str(env.doc2path(docname))) in documents]
+    manifest.clearPending()
+    return result
+
+
+def clear_caches(app):
+    """clear trackers, renderers, transformers and data trees kept
+    from a previous build."""
+    Utils.clear_memoized()
+    Dispatcher.clear_trees()
+
+
 def run(arguments,
         options,
         lineno,
@@ -58,11 +102,21 @@ def run(arguments,
         document=None,
         srcdir=None,
         builddir=None,
-        build_environment=None):
+        build_environment=None,
+        incremental=False,
+        status=None):
     """process:report: directive.
 
     *srdir* - top level directory of rst documents
     *builddir* - build directory
+
+    If *incremental* is set, existing output is only used if the
+    tracker, its options and its data sources have not changed
+    since the output was created (see :mod:`Manifest`).
+
+    If *status* is a dictionary, it will be updated with the name
+    of the directive, the action taken (``skipped`` or
+    ``computed``) and the reason for computing.
     """
 
     tag = "%s:%i" % (str(document), lineno)
@@ -210,8 +264,8 @@ def run(arguments,
         ###########################################################
         # check for existing files
         # update strategy does not use file stamps, but checks
-        # for presence/absence of text element and if all figures
-        # mentioned in the text element are present
+        # for presence/absence of the text element and of all
+        # figures recorded for the directive in the manifest
         ###########################################################
         queries = [re.compile("%s/(\S+.%s)" %
                               (root2builddir, suffix))
@@ -219,49 +273,47 @@ def run(arguments,
 
         logger.debug("report_directive.run: checking for changed files.")
 
-        # check if text element exists
-        if os.path.exists(filename_text):
-
-            with open(filename_text, "r", encoding="utf-8") as inf:
-                lines = [x[:-1] for x in inf]
-            filenames = []
-            
-            # check if all figures are present
-            for line in lines:
-                for query in queries:
-                    x = query.search(line)
-                    if x:
-                        filenames.extend(list(x.groups()))
-
-            filenames = [os.path.join(outdir, x) for x in filenames]
-            if len(filenames) == 0:
-                logger.info("report_directive.run: %s: redo: no files found" % tag)
-            else:
-                logger.debug(
-                    "report_directive.run: %s: checking for %s" %
-                    (tag, str(filenames)))
-                for filename in filenames:
-                    if not os.path.exists(filename):
-                        logger.info(
-                            "report_directive.run: %s: redo: file %s is missing" %
-                            (tag, filename))
-                        break
-                else:
-                    logger.info(
-                        "report_directive.run: %s: noredo: all files are present" %
-                        tag)
-                    # all is present - save text and return
-                    if lines and state_machine:
-                        state_machine.insert_input(
-                            lines, state_machine.input_lines.source(0))
-                    return []
+        manifest = Manifest.get_manifest()
+        record = manifest.get(template_name)
+        if record is None:
+            reason = "not in manifest"
         else:
             logger.debug(
-                "report_directive.run: %s: no check performed: %s missing" %
-                (tag, str(filename_text)))
+                "report_directive.run: %s: checking for %s" %
+                (tag, str(record["outputs"])))
+            reason = manifest.getOutdatedReason(template_name,
+                                                record=record)
+            figures = [x for x in record["outputs"] if x != filename_text]
+            # in incremental mode, text elements without figures are
+            # up to date if the tracker and its data have not changed
+            if incremental and reason is None:
+                reason = get_outdated_reason(
+                    template_name, tracker_name, tracker_options,
+                    record=record)
+            elif reason is None and len(figures) == 0:
+                reason = "no files found"
+
+        if reason is None:
+            logger.info(
+                "report_directive.run: %s: noredo: all files are present" %
+                tag)
+            if status is not None:
+                status.update(name=template_name,
+                              action="skipped",
+                              reason=None)
+            # all is present - insert text and return
+            lines = record["text"].split("\n")
+            if lines and state_machine:
+                state_machine.insert_input(
+                    lines, state_machine.input_lines.source(0))
+            return []
+
+        logger.info(
+            "report_directive.run: %s: redo: %s" % (tag, reason))
     else:
         template_name = ""
         filename_text = None
+        reason = None
 
     collect_here = False
     ##########################################################
@@ -318,15 +370,7 @@ def run(arguments,
         # write code output
         linked_codename = re.sub("\\\\", "/", os.path.join(rst2builddir, codename))
         if code and basedir != outdir:
-            if six.PY2:
-                with open(os.path.join(outdir, codename), "w") as outfile:
-                    for line in code:
-                        outfile.write(line)
-            else:
-                with open(os.path.join(outdir, codename), "w",
-                          encoding=get_encoding()) as outfile:
-                    for line in code:
-                        outfile.write(line)
+            Utils.writeFileIfChanged(os.path.join(outdir, codename), code)
 
         ########################################################
         # write notebook snippet
@@ -356,18 +400,16 @@ def run(arguments,
                  'rst_url': linked_rstname,
                  'notebook_url': linked_notebookname}
 
-        collectors = []
-        for name, collector in get_plugins("collect").items():
-            collectors.append(collector(
-                template_name=template_name,
-                outdir=outdir,
-                rstdir=rstdir,
-                builddir=builddir,
-                srcdir=srcdir,
-                content=content,
-                display_options=display_options,
-                trackerd_id=tracker_id,
-                links=links))
+        collectors = get_collectors(
+            template_name=template_name,
+            outdir=outdir,
+            rstdir=rstdir,
+            builddir=builddir,
+            srcdir=srcdir,
+            content=content,
+            display_options=display_options,
+            trackerd_id=tracker_id,
+            links=links)
 
         # user renderers might not have a set_collectors method
         try:
@@ -383,8 +425,10 @@ def run(arguments,
                                            renderer,
                                            transformers)
 
-        # add the tracker options
+        # add the tracker options and the transformer options
+        # that are part of the key for cached dataframes
         dispatcher_options.update(tracker_options)
+        dispatcher_options.update(transformer_options)
         blocks = dispatcher(**dispatcher_options)
 
         if blocks is None:
@@ -470,6 +514,38 @@ def run(arguments,
             with open(filename_text, "w", encoding=get_encoding()) as outf:
                 outf.write("\n".join(lines))
 
+        if tracker_id is not None:
+            # record directive and the files created
+            filenames = [filename_text]
+            for line in lines:
+                for query in queries:
+                    filenames.extend(
+                        [os.path.join(outdir, x)
+                         for x in query.findall(line)])
+            try:
+                sources = tracker.getDataSources()
+            except AttributeError:
+                sources = []
+            Manifest.get_manifest().update(
+                template_name,
+                os.path.abspath(document),
+                lineno,
+                tracker_name,
+                Cache.tracker2fingerprint(tracker, tracker_options),
+                sources,
+                filenames,
+                reason=reason,
+                # sphinx needs to re-read documents if directives
+                # have been computed outside of sphinx
+                pending=state_machine is None,
+                options_hash=options_hash,
+                text="\n".join(lines))
+
+    if status is not None:
+        status.update(name=template_name,
+                      action="computed",
+                      reason=reason)
+
     if CGATREPORT_DEBUG:
         for x, l in enumerate(lines):
             try:
@@ -487,6 +563,9 @@ def run(arguments,
     logger.debug(
         "report_directive.run: profile: finished: rst: %s:%i" %
         (str(document), lineno))
+    logger.debug(
+        "report_directive.run: memory cache: %s" %
+        str(Cache.get_memory_cache().getStatistics()))
 
     return []
 
@@ -524,6 +603,8 @@ def setup(app):
     setup.srcdir = app.srcdir
     setup.builddir = os.getcwd()
     app.add_directive('report', report_directive)
+    app.connect('builder-inited', clear_caches)
+    app.connect('env-get-outdated', get_outdated_documents)
 
     # update global parameters in Utils module.
     PARAMS = Utils.get_parameters()
@@ -48,10 +48,7 @@ def writeCode(class_name, code, inliner):
         if not os.path.exists(outdir):
             os.makedirs(outdir)
 
-        outfile = open(os.path.join(outdir, codename), "w")
-        for line in code:
-            outfile.write(line)
-        outfile.close()
+        Utils.writeFileIfChanged(os.path.join(outdir, codename), code)
 
     return linked_codename
 
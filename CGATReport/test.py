@@ -530,18 +530,19 @@ def main(argv=None, **kwargs):
                    (tracker_name, len(removed))))
 
         dispatcher = Dispatcher(tracker, renderer, transformers)
+        dispatcher_options = dict(kwargs, **transformer_options)
 
         if renderer is None:
             # dispatcher.parseArguments(**kwargs)
             # result = dispatcher.collect()
             # result = dispatcher.transform()
-            result = dispatcher(**kwargs)
+            result = dispatcher(**dispatcher_options)
             options.do_print = options.language == "notebook"
             options.do_show = False
             options.hardcopy = False
         else:
             # needs to be resolved between renderer and dispatcher options
-            result = dispatcher(**kwargs)
+            result = dispatcher(**dispatcher_options)
 
         if options.do_print:
 
@@ -144,7 +144,8 @@ setup(name='CGATReport',
           'console_scripts': [
               'cgatreport-build = CGATReport.build:main',
               'cgatreport-clean = CGATReport.clean:main',
-              'cgatreport-test = CGATReport.test:main',
+              'cgatreport-test = CGATReport.daemon:test_main',
+              'cgatreport-daemon = CGATReport.daemon:main',
               'cgatreport-quickstart = CGATReport.quickstart:main',
               'cgatreport-get = CGATReport.get:main',
               'cgatreport-profile = CGATReport.profile:main',
@@ -0,0 +1,93 @@
+'''unit testing code for cgatreport-build
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from CGATReport import Utils, build
+
+DOCUMENT = '''
+Title
+=====
+
+.. report:: Trackers.Data
+   :render: line-plot
+   :as-lines:
+
+   A plot
+
+.. report:: Trackers.Data
+   :render: table
+   :tracks: a,b
+
+:ref:`a sphinx role`
+
+.. report:: Trackers.Data
+   :render: line-plot
+   :as-lines:
+
+   A plot
+'''
+
+
+class TestCollectDirectives(unittest.TestCase):
+    '''test scanning documents for report directives.'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmpdir, "_build"))
+        for filename in ("index.rst", "_build/index.rst"):
+            with open(os.path.join(self.tmpdir, filename), "w") as outf:
+                outf.write(DOCUMENT)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testDuplicatesAreRemoved(self):
+
+        result = build.collectDirectives(self.tmpdir)
+        self.assertEqual(len(result), 2)
+        arguments, options, lineno, content, document = result[1]
+        self.assertEqual(arguments, ["Trackers.Data"])
+        self.assertEqual(options, {"render": "table", "tracks": "a,b"})
+        self.assertEqual(document, os.path.join(self.tmpdir, "index.rst"))
+        self.assertEqual(result[0][1], {"render": "line-plot",
+                                        "as-lines": None})
+        self.assertEqual(result[0][3], ["A plot"])
+
+    def testSphinxDirectories(self):
+
+        self.assertEqual(
+            build.getSphinxDirectories(
+                ["sphinx-build", "-b", "html", "-d", "_build/doctrees",
+                 "-c", "conf", "src", "_build/html"]),
+            (os.path.abspath("src"), os.path.abspath("conf")))
+
+
+class TestPrecompute(unittest.TestCase):
+    '''test pre-computing directives outside of sphinx.'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.params = dict(Utils.PARAMS)
+        with open(os.path.join(self.tmpdir, "index.rst"), "w") as outf:
+            outf.write("Title\n=====\n")
+        with open(os.path.join(self.tmpdir, "report.ini"), "w") as outf:
+            outf.write("[report]\nsql_backend=sqlite:///./other.db\n")
+
+    def tearDown(self):
+        Utils.PARAMS.clear()
+        Utils.PARAMS.update(self.params)
+        shutil.rmtree(self.tmpdir)
+
+    def testParametersAreLoaded(self):
+
+        build.precompute(self.tmpdir, self.tmpdir, num_jobs=1)
+        self.assertEqual(Utils.PARAMS["report_sql_backend"],
+                         "sqlite:///./other.db")
+
+
+if __name__ == "__main__":
+    unittest.main()
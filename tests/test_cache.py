@@ -0,0 +1,304 @@
+'''unit testing code for the CGATReport cache
+'''
+
+import os
+import json
+import time
+import pickle
+import shutil
+import multiprocessing
+import tempfile
+import unittest
+
+import numpy
+import pandas
+
+from CGATReport import Cache, Utils
+from CGATReport.Tracker import TrackerSingleFile
+
+
+class TestCache(unittest.TestCase):
+    '''test storing and retrieving data in the cache.'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = Utils.PARAMS.get("report_cachedir")
+        Utils.PARAMS["report_cachedir"] = self.tmpdir
+
+    def tearDown(self):
+        Utils.PARAMS["report_cachedir"] = self.cachedir
+        shutil.rmtree(self.tmpdir)
+
+    def testRoundTrip(self):
+
+        cache = Cache.Cache("test")
+        df = pandas.DataFrame({"a": [1, 2, 3], "b": ["x", "y", "z"]})
+        array = numpy.arange(10, dtype=numpy.float64)
+        values = {"x": [1, 2], "y": "text"}
+
+        cache["track1/slice1"] = df
+        cache["track1/slice2"] = array
+        cache["track2/slice1"] = values
+
+        cache = Cache.Cache("test", mode="r")
+        self.assertEqual(cache.keys(),
+                         ["track1/slice1", "track1/slice2", "track2/slice1"])
+        self.assertTrue(cache["track1/slice1"].equals(df))
+        self.assertTrue(numpy.array_equal(cache["track1/slice2"], array))
+        self.assertEqual(cache["track2/slice1"], values)
+
+    def testMappedArrays(self):
+
+        cache = Cache.Cache("test")
+        large = numpy.arange(100000, dtype=numpy.float64)
+        small = numpy.arange(10)
+        cache["all"] = {"large": large, "small": small, "text": "a"}
+        cache["array"] = large
+
+        Cache.get_memory_cache().clear()
+        cache = Cache.Cache("test", mode="r")
+        data = cache["all"]
+        self.assertTrue(isinstance(data["large"], numpy.memmap))
+        self.assertFalse(data["large"].flags.writeable)
+        self.assertFalse(isinstance(data["small"], numpy.memmap))
+        self.assertTrue(numpy.array_equal(data["large"], large))
+        self.assertEqual(data["text"], "a")
+        self.assertTrue(isinstance(cache["array"], numpy.memmap))
+
+        # fewer arrays in new entry
+        cache = Cache.Cache("test")
+        cache["all"] = {"small": small}
+        self.assertEqual(
+            len([x for x in os.listdir(cache.cache_filename)
+                 if x.endswith(".npy")]), 1)
+
+    def testMissingKey(self):
+
+        cache = Cache.Cache("test")
+        self.assertRaises(KeyError, cache.__getitem__, "track1")
+
+    def testMissingCache(self):
+
+        self.assertRaises(ValueError, Cache.Cache, "test", mode="r")
+
+    def testOverwrite(self):
+
+        cache = Cache.Cache("test")
+        cache["all"] = numpy.arange(5)
+        cache["all"] = {"a": 1}
+        self.assertEqual(cache["all"], {"a": 1})
+        self.assertEqual(len(os.listdir(cache.cache_filename)), 2)
+
+    def testFailedWriteKeepsEntry(self):
+
+        cache = Cache.Cache("test")
+        cache["all"] = {"a": numpy.zeros(100000)}
+        files = sorted(os.listdir(cache.cache_filename))
+
+        def fail(outf):
+            raise IOError("disk full")
+
+        # the entry is only replaced once the meta file has been written
+        write = cache.writeAtomic
+        cache.writeAtomic = lambda filename, write_f, add_suffix=True: \
+            write(filename, fail if filename.endswith(Cache.META_SUFFIX)
+                  else write_f, add_suffix)
+        cache["all"] = {"b": numpy.ones(100000)}
+        self.assertEqual(sorted(os.listdir(cache.cache_filename)), files)
+
+        Cache.get_memory_cache().clear()
+        cache = Cache.Cache("test", mode="r")
+        self.assertEqual(list(cache["all"].keys()), ["a"])
+
+    def testLegacyEntry(self):
+
+        cache = Cache.Cache("test")
+        filename = cache.getFilename("all")
+        with open(filename + ".pickle", "wb") as outf:
+            pickle.dump([1, 2], outf)
+        with open(filename + Cache.META_SUFFIX, "w") as outf:
+            json.dump({"key": "all", "format": "pickle", "arrays": 0,
+                       "fingerprint": None}, outf)
+        self.assertEqual(cache["all"], [1, 2])
+
+        cache["all"] = [3]
+        Cache.get_memory_cache().clear()
+        self.assertEqual(cache["all"], [3])
+        self.assertFalse(os.path.exists(filename + ".pickle"))
+
+    def testLegacyCacheIsRemoved(self):
+
+        legacy = os.path.join(self.tmpdir, "test.db")
+        with open(legacy, "w") as outf:
+            outf.write("shelve")
+        Cache.Cache("test")
+        self.assertFalse(os.path.exists(legacy))
+
+    def testConcurrentWrites(self):
+
+        pool = multiprocessing.Pool(4)
+        pool.map(_write_entry, [(self.tmpdir, x) for x in range(20)])
+        pool.close()
+        pool.join()
+
+        cache = Cache.Cache("test", mode="r")
+        self.assertEqual(cache.keys(), ["all"])
+        self.assertEqual(len(cache["all"]), 1000)
+        # no temporary files are left behind
+        self.assertEqual(
+            sorted([os.path.splitext(x)[1]
+                    for x in os.listdir(cache.cache_filename)]),
+            [".lock", ".meta", ".npy"])
+
+
+def _write_entry(args):
+    tmpdir, value = args
+    Utils.PARAMS["report_cachedir"] = tmpdir
+    cache = Cache.Cache("test")
+    with cache.lock("all"):
+        cache["all"] = numpy.ones(1000) * value
+
+
+class TestFingerprint(unittest.TestCase):
+    '''test invalidation of cached data.'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = Utils.PARAMS.get("report_cachedir")
+        Utils.PARAMS["report_cachedir"] = self.tmpdir
+
+    def tearDown(self):
+        Utils.PARAMS["report_cachedir"] = self.cachedir
+        shutil.rmtree(self.tmpdir)
+
+    def testOutdatedEntry(self):
+
+        cache = Cache.Cache("test", fingerprint="a")
+        cache["all"] = [1, 2, 3]
+
+        cache = Cache.Cache("test", fingerprint="b")
+        self.assertRaises(KeyError, cache.__getitem__, "all")
+
+        cache = Cache.Cache("test", fingerprint="a")
+        self.assertEqual(cache["all"], [1, 2, 3])
+
+        # without a fingerprint, all entries are valid
+        cache = Cache.Cache("test", mode="r")
+        self.assertEqual(cache["all"], [1, 2, 3])
+
+    def testTrackerFingerprint(self):
+
+        filename = os.path.join(self.tmpdir, "data.tsv")
+        with open(filename, "w") as outf:
+            outf.write("a\tb\n1\t2\n")
+
+        tracker = TrackerSingleFile(filename=filename)
+        fingerprint = Cache.tracker2fingerprint(tracker)
+        self.assertEqual(fingerprint, Cache.tracker2fingerprint(tracker))
+        self.assertNotEqual(
+            fingerprint, Cache.tracker2fingerprint(tracker, {"glob": "*"}))
+
+        with open(filename, "a") as outf:
+            outf.write("3\t4\n")
+        self.assertNotEqual(fingerprint, Cache.tracker2fingerprint(tracker))
+
+
+class TestGarbageCollection(unittest.TestCase):
+    '''test removal of least recently used data.'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cachedir = Utils.PARAMS.get("report_cachedir")
+        Utils.PARAMS["report_cachedir"] = self.tmpdir
+        # avoid serving data from memory
+        Cache.get_memory_cache().clear()
+
+        now = time.time()
+        for tracker in ("tracker1", "tracker2"):
+            cache = Cache.Cache(tracker)
+            for x, key in enumerate(("a", "b", "c")):
+                cache[key] = numpy.zeros(1000)
+                # key a is the oldest
+                t = now - (3 - x) * 86400
+                os.utime(cache.getFilename(key) + Cache.META_SUFFIX, (t, t))
+
+    def tearDown(self):
+        Utils.PARAMS["report_cachedir"] = self.cachedir
+        shutil.rmtree(self.tmpdir)
+
+    def testMaxAge(self):
+
+        reclaimed = Cache.collect_garbage(self.tmpdir, max_age=2.5 * 86400)
+        self.assertEqual(sorted(reclaimed.keys()), ["tracker1", "tracker2"])
+        self.assertEqual(Cache.Cache("tracker1").keys(), ["b", "c"])
+
+    def testMaxSize(self):
+
+        entry_size = sum([x[1] for x in Cache.get_entries(self.tmpdir)]) // 6
+        Cache.get_memory_cache().clear()
+        # accessing an entry updates its access time
+        Cache.Cache("tracker2")["a"]
+        Cache.collect_garbage(self.tmpdir, max_size=entry_size * 3)
+        self.assertEqual(Cache.Cache("tracker1").keys(), ["c"])
+        self.assertEqual(Cache.Cache("tracker2").keys(), ["a", "c"])
+
+    def testLocksAreKept(self):
+
+        cache = Cache.Cache("tracker1")
+        with cache.lock("a"):
+            reclaimed = Cache.collect_garbage(self.tmpdir, max_size=0)
+            self.assertTrue(reclaimed["tracker1"] > 0)
+        self.assertEqual(Cache.Cache("tracker1").keys(), [])
+        self.assertTrue(os.path.exists(
+            cache.getFilename("a") + Cache.LOCK_SUFFIX))
+
+    def testDryRun(self):
+
+        reclaimed = Cache.collect_garbage(self.tmpdir, max_size=0,
+                                          dry_run=True)
+        self.assertTrue(reclaimed["tracker1"] > 0)
+        self.assertEqual(len(Cache.Cache("tracker1").keys()), 3)
+
+
+class TestMemoryCache(unittest.TestCase):
+    '''test the in-memory cache.'''
+
+    def testEviction(self):
+
+        cache = Cache.MemoryCache(max_bytes=2000)
+        cache.put("a", numpy.zeros(100))
+        cache.put("b", numpy.zeros(100))
+        # access a so that b is least recently used
+        self.assertTrue(cache.get("a")[0])
+        cache.put("c", numpy.zeros(100))
+        self.assertTrue(cache.get("a")[0])
+        self.assertFalse(cache.get("b")[0])
+        self.assertTrue(cache.get("c")[0])
+        stats = cache.getStatistics()
+        self.assertEqual(stats["hits"], 3)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["bytes"], 1600)
+
+    def testItemsAreCopied(self):
+
+        cache = Cache.MemoryCache(max_bytes=10000)
+        df = pandas.DataFrame({"a": [1, 2, 3]})
+        cache.put("a", df)
+        df["a"] = 0
+        found, data = cache.get("a")
+        self.assertEqual(list(data["a"]), [1, 2, 3])
+        data["a"] = 0
+        found, data = cache.get("a")
+        self.assertEqual(list(data["a"]), [1, 2, 3])
+
+    def testFingerprint(self):
+
+        cache = Cache.MemoryCache(max_bytes=10000)
+        cache.put("a", [1, 2], fingerprint="x")
+        self.assertTrue(cache.get("a", fingerprint="x")[0])
+        self.assertFalse(cache.get("a", fingerprint="y")[0])
+        self.assertTrue(cache.get("a")[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+'''unit testing code for the CGATReport plugin registry
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+from CGATReport import Capabilities, Utils
+from CGATReport.Options import PLUGIN_OPTIONS
+
+
+class TestPluginOptions(unittest.TestCase):
+    '''test that declared options agree with the plugins.'''
+
+    def testOptionsAreDeclared(self):
+
+        for section, plugins in Capabilities.get_all_plugins().items():
+            options = {}
+            for name, cls in plugins.items():
+                options.update(dict(getattr(cls, "options", ())))
+            self.assertEqual(PLUGIN_OPTIONS[section], options)
+
+
+TRACKER_CODE = """
+from CGATReport.Tracker import Tracker
+
+
+class Data(Tracker):
+    value = %i
+
+    def __call__(self, track):
+        return self.value
+
+
+class DataExtended(Data):
+    pass
+"""
+
+
+class TestModuleCache(unittest.TestCase):
+    '''test loading of tracker modules and code.'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        sys.path.insert(0, self.tmpdir)
+        self.filename = os.path.join(self.tmpdir, "CacheTrackers.py")
+        self.writeModule(1)
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        shutil.rmtree(self.tmpdir)
+
+    def writeModule(self, value, mtime=None):
+        with open(self.filename, "w") as outf:
+            outf.write(TRACKER_CODE % value)
+        if mtime is not None:
+            os.utime(self.filename, (mtime, mtime))
+
+    def testModuleIsLoadedOnce(self):
+
+        module, pathname = Capabilities.get_module("CacheTrackers")
+        self.assertEqual(pathname, self.filename)
+        self.assertTrue(
+            Capabilities.get_module("CacheTrackers")[0] is module)
+
+        # modified modules are loaded again
+        self.writeModule(2, mtime=os.path.getmtime(self.filename) + 10)
+        module, pathname = Capabilities.get_module("CacheTrackers")
+        self.assertEqual(module.Data.value, 2)
+
+    def testCode(self):
+
+        code = Capabilities.get_code("Data", self.filename)
+        self.assertEqual(code[0], "class Data(Tracker):\n")
+        self.assertEqual(code[-1], "        return self.value\n")
+        self.assertEqual(Capabilities.get_code("DataExtended", self.filename),
+                         ["class DataExtended(Data):\n", "    pass\n"])
+
+    def testTrackersAreShared(self):
+
+        Utils.clear_memoized()
+        code, tracker, pathname = Capabilities.make_tracker(
+            "CacheTrackers.Data", (), {"glob": "*.tsv"})
+        self.assertTrue(Capabilities.make_tracker(
+            "CacheTrackers.Data", (), {"glob": "*.tsv"})[1] is tracker)
+        self.assertFalse(Capabilities.make_tracker(
+            "CacheTrackers.Data", (), {"glob": "*.csv"})[1] is tracker)
+
+        Utils.clear_memoized()
+        self.assertFalse(Capabilities.make_tracker(
+            "CacheTrackers.Data", (), {"glob": "*.tsv"})[1] is tracker)
+
+
+class TestMemoized(unittest.TestCase):
+    '''test memoization of function calls.'''
+
+    def setUp(self):
+        self.calls = []
+
+        def f(*args, **kwargs):
+            self.calls.append(args)
+            return len(self.calls)
+
+        self.f = Utils.memoized(f, maxsize=2)
+
+    def testKeys(self):
+
+        self.assertEqual(self.f("a", (), {"b": [1, 2]}), 1)
+        self.assertEqual(self.f("a", (), {"b": [1, 2]}), 1)
+        self.assertEqual(self.f("a", (), {"b": [1, 3]}), 2)
+        self.assertEqual(self.f("a", x=1), 3)
+        self.assertEqual(self.f("a", x=2), 4)
+
+    def testLeastRecentlyUsed(self):
+
+        self.f(1)
+        self.f(2)
+        self.f(1)
+        self.f(3)
+        self.assertEqual(self.f(1), 1)
+        self.assertEqual(self.f(2), 4)
+
+    def testClear(self):
+
+        self.f(1)
+        Utils.clear_memoized()
+        self.assertEqual(self.f(1), 2)
+
+
+class TestLazyLoading(unittest.TestCase):
+    '''test that plugins are only imported on demand.'''
+
+    def imported(self, statement):
+        '''return modules imported by *statement* in a new interpreter.'''
+        return subprocess.check_output(
+            [sys.executable, "-c",
+             statement + "; import sys; print(' '.join(sys.modules))"],
+            universal_newlines=True).split()
+
+    def testImportReportDirective(self):
+
+        modules = self.imported(
+            "import CGATReport.report_directive; "
+            "CGATReport.Options.get_option_spec()")
+        self.assertEqual(
+            [x for x in modules
+             if x.startswith("CGATReport.Plugins") or
+             x.split(".")[0] in ("matplotlib", "scipy", "openpyxl")],
+            [])
+
+    def testRendererIsImportedOnDemand(self):
+
+        modules = self.imported(
+            "from CGATReport.Capabilities import get_renderer; "
+            "get_renderer('table')")
+        self.assertTrue("CGATReport.Plugins.Renderer" in modules)
+        self.assertFalse("CGATReport.Plugins.Seaborn" in modules)
+
+    def testCollectorsWithoutOutput(self):
+
+        collectors = dict([(x.name, x) for x in
+                           Capabilities.get_collectors()])
+        for name, module in Capabilities.CollectorModules.items():
+            if module not in sys.modules:
+                self.assertEqual(collectors[name].collector, None)
+                self.assertEqual(collectors[name].collect([]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
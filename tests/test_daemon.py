@@ -0,0 +1,151 @@
+'''unit testing code for the CGATReport daemon
+'''
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from CGATReport import daemon
+
+
+class TestDaemon(unittest.TestCase):
+    '''test submitting jobs to the daemon.'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, "daemon.sock")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def startDaemon(self):
+        server = daemon.Daemon(self.socket_path)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        return server, thread
+
+    def testNotRunning(self):
+
+        self.assertFalse(daemon.isRunning(self.socket_path))
+        self.assertRaises(OSError, daemon.submit, "ping",
+                          socket_path=self.socket_path)
+
+    def testJobs(self):
+
+        server, thread = self.startDaemon()
+        try:
+            self.assertTrue(daemon.isRunning(self.socket_path))
+            self.assertEqual(daemon.submit("ping",
+                                           socket_path=self.socket_path),
+                             os.getpid())
+            # errors within the daemon are reported to the client
+            self.assertRaises(daemon.DaemonError, daemon.submit, "ping",
+                              socket_path=self.socket_path, argument=1)
+            self.assertEqual(os.stat(self.socket_path).st_mode & 0o077, 0)
+        finally:
+            daemon.submit("stop", socket_path=self.socket_path)
+            thread.join()
+            server.server_close()
+
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertFalse(daemon.isRunning(self.socket_path))
+
+    def testDataChangesBetweenJobs(self):
+
+        datafile = os.path.join(self.tmpdir, "data.txt")
+        with open(os.path.join(self.tmpdir, "daemon_trackers.py"),
+                  "w") as outf:
+            outf.write(TRACKER_MODULE % datafile)
+
+        argv = ["cgatreport-test",
+                "--tracker=daemon_trackers.DataTracker",
+                "--trackerdir=%s" % self.tmpdir,
+                "--renderer=table",
+                "--option=nocache",
+                "--no-show"]
+
+        server, thread = self.startDaemon()
+        try:
+            for value in ("first", "second"):
+                with open(datafile, "w") as outf:
+                    outf.write(value)
+                retcode, output = daemon.submit(
+                    "test", socket_path=self.socket_path, argv=argv)
+                self.assertFalse(retcode)
+                self.assertTrue(value in output)
+        finally:
+            daemon.submit("stop", socket_path=self.socket_path)
+            thread.join()
+            server.server_close()
+
+    def testParametersOfPreviousJob(self):
+
+        with open(os.path.join(self.tmpdir, "daemon_parameters.py"),
+                  "w") as outf:
+            outf.write(TRACKER_MODULE % "")
+
+        reports = []
+        for name in ("first", "second"):
+            reports.append(os.path.join(self.tmpdir, name))
+            os.mkdir(reports[-1])
+        with open(os.path.join(reports[0], "report.ini"), "w") as outf:
+            outf.write("[report]\nflag=first_report\n")
+
+        argv = ["cgatreport-test",
+                "--tracker=daemon_parameters.ParameterTracker",
+                "--trackerdir=%s" % self.tmpdir,
+                "--renderer=table",
+                "--option=nocache",
+                "--no-show"]
+
+        cwd = os.getcwd()
+        server, thread = self.startDaemon()
+        try:
+            outputs = []
+            for report in reports:
+                os.chdir(report)
+                outputs.append(daemon.submit(
+                    "test", socket_path=self.socket_path, argv=argv)[1])
+        finally:
+            os.chdir(cwd)
+            daemon.submit("stop", socket_path=self.socket_path)
+            thread.join()
+            server.server_close()
+
+        self.assertTrue("first_report" in outputs[0])
+        self.assertTrue("unset" in outputs[1])
+        self.assertFalse("first_report" in outputs[1])
+
+
+# tracker reading its data when it is created
+TRACKER_MODULE = '''
+from CGATReport.Tracker import Tracker
+
+
+class DataTracker(Tracker):
+
+    tracks = ["all"]
+
+    def __init__(self, *args, **kwargs):
+        Tracker.__init__(self, *args, **kwargs)
+        with open("%s") as inf:
+            self.value = inf.read()
+
+    def __call__(self, track):
+        return {"value": self.value}
+
+
+class ParameterTracker(Tracker):
+
+    tracks = ["all"]
+
+    def __call__(self, track):
+        from CGATReport import Utils
+        return {"value": Utils.PARAMS.get("report_flag", "unset")}
+'''
+
+
+if __name__ == "__main__":
+    unittest.main()
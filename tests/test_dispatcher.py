@@ -0,0 +1,409 @@
+'''unit testing code for the CGATReport dispatcher
+'''
+
+import os
+import time
+import threading
+import unittest
+
+import pandas
+
+from CGATReport import Cache
+from CGATReport.Dispatcher import Dispatcher, clear_trees
+from CGATReport.ResultBlock import ResultBlock, ResultBlocks
+from CGATReport.Tracker import Tracker, selectFrame
+
+
+class PathTracker(Tracker):
+
+    tracks = ["track%i" % x for x in range(10)]
+    slices = ["slice%i" % x for x in range(5)]
+
+    def __call__(self, track, slice):
+        if track == "track7" and slice == "slice3":
+            raise ValueError("error in %s/%s" % (track, slice))
+        return {"track": track, "slice": slice}
+
+
+class SafePathTracker(PathTracker):
+
+    def __call__(self, track, slice):
+        return {"track": track, "slice": slice}
+
+
+class BatchTracker(SafePathTracker):
+
+    def __init__(self, *args, **kwargs):
+        SafePathTracker.__init__(self, *args, **kwargs)
+        self.batches = []
+
+    def getBatch(self, paths):
+        self.batches.append(paths)
+        # leave out track0, which is collected individually
+        return dict([(path, self(*path)) for path in paths
+                     if path[0] != "track0"])
+
+
+class DerivedBatchTracker(BatchTracker):
+
+    def __call__(self, track, slice):
+        return {"track": track, "slice": slice, "derived": True}
+
+
+class CountingTracker(SafePathTracker):
+
+    def __init__(self, *args, **kwargs):
+        SafePathTracker.__init__(self, *args, **kwargs)
+        self.calls = 0
+
+    def __call__(self, track, slice):
+        self.calls += 1
+        return {"value": [1, 2]}
+
+
+class RenamingTransformer(object):
+    '''transformer renaming track1.'''
+
+    def __call__(self, data):
+        return data.rename(index={"track1": "renamed"})
+
+
+class UncachedTracker(SafePathTracker):
+    '''tracker opting out of the persistent cache that counts
+    calls across instances.'''
+
+    cache = False
+    calls = 0
+    lock = threading.Lock()
+
+    def __call__(self, track, slice):
+        with self.lock:
+            UncachedTracker.calls += 1
+        time.sleep(0.001)
+        return {"value": [1, 2]}
+
+
+class ScalarTracker(Tracker):
+
+    tracks = ["track%i" % x for x in range(10)]
+    slices = ["slice%i" % x for x in range(5)]
+
+    def __call__(self, track, slice):
+        if track == "track2" and slice == "slice4":
+            return None
+        return int(track[5:]) * 10 + int(slice[5:])
+
+
+class FrameTracker(ScalarTracker):
+
+    def __init__(self, *args, **kwargs):
+        ScalarTracker.__init__(self, *args, **kwargs)
+        self.frames = 0
+
+    def getBatchFrame(self, paths):
+        self.frames += 1
+        dataframe = pandas.DataFrame(
+            [[self(track, slice) for slice in reversed(self.slices)]
+             for track in self.tracks],
+            index=self.tracks,
+            columns=list(reversed(self.slices)))
+        return selectFrame(dataframe, paths)
+
+
+class DerivedFrameTracker(FrameTracker):
+
+    def __call__(self, track, slice):
+        value = ScalarTracker.__call__(self, track, slice)
+        if value is not None:
+            return -value
+
+
+class PathRenderer(object):
+    '''renderer returning the path and the process id.'''
+
+    group_level = 0
+    collectors = ["images"]
+
+    def __call__(self, dataframe, path):
+        return ResultBlocks(
+            ResultBlock("%i" % os.getpid(), title=str(path)))
+
+
+class UnpicklableRenderer(PathRenderer):
+
+    def __call__(self, dataframe, path):
+        result = PathRenderer.__call__(self, dataframe, path)
+        result[0].function = lambda x: x
+        return result
+
+
+class TestParallelCollection(unittest.TestCase):
+    '''test parallel data collection.'''
+
+    def collect(self, tracker, **kwargs):
+        dispatcher = Dispatcher(tracker, None, [])
+        dispatcher.parseArguments(nocache=True, **kwargs)
+        return dispatcher.collect()
+
+    def testOrderIsPreserved(self):
+
+        expected = self.collect(SafePathTracker())
+        for mode in ("threads", "processes"):
+            tree = self.collect(SafePathTracker(),
+                                **{"parallel-collect": mode,
+                                   "collect-jobs": 4})
+            self.assertEqual(list(tree.keys()), list(expected.keys()))
+            for track in tree:
+                self.assertEqual(list(tree[track].items()),
+                                 list(expected[track].items()))
+
+    def testExceptionIsPropagated(self):
+
+        self.assertRaises(ValueError, self.collect, PathTracker())
+        for mode in ("threads", "processes"):
+            self.assertRaises(ValueError,
+                              self.collect,
+                              PathTracker(),
+                              **{"parallel-collect": mode,
+                                 "collect-jobs": 4})
+
+    def testUnknownMode(self):
+
+        self.assertRaises(ValueError, self.collect, SafePathTracker(),
+                          **{"parallel-collect": "gpu"})
+
+
+class TestBatchCollection(unittest.TestCase):
+    '''test collection of all paths with a single call.'''
+
+    def testBatchIsPreferred(self):
+
+        dispatcher = Dispatcher(SafePathTracker(), None, [])
+        dispatcher.parseArguments(nocache=True)
+        expected = dispatcher.collect()
+
+        tracker = BatchTracker()
+        dispatcher = Dispatcher(tracker, None, [])
+        dispatcher.parseArguments(nocache=True)
+        tree = dispatcher.collect()
+
+        self.assertEqual(len(tracker.batches), 1)
+        self.assertEqual(len(tracker.batches[0]), 50)
+        self.assertEqual(list(tree.keys()), list(expected.keys()))
+        for track in tree:
+            self.assertEqual(list(tree[track].items()),
+                             list(expected[track].items()))
+
+    def testOverriddenCallIsUsed(self):
+
+        tracker = DerivedBatchTracker()
+        dispatcher = Dispatcher(tracker, None, [])
+        dispatcher.parseArguments(nocache=True)
+        tree = dispatcher.collect()
+        self.assertEqual(tracker.batches, [])
+        self.assertTrue(tree["track1"]["slice1"]["derived"])
+
+
+class TestFrameCollection(unittest.TestCase):
+    '''test collection of all paths as a single dataframe.'''
+
+    def prepare(self, tracker, **kwargs):
+        dispatcher = Dispatcher(tracker, PathRenderer(), [])
+        dispatcher.parseArguments(nocache=True, **kwargs)
+        success, result = dispatcher.prepare()
+        self.assertTrue(success)
+        return dispatcher.data
+
+    def testFrameIsUsed(self):
+
+        expected = self.prepare(ScalarTracker())
+        tracker = FrameTracker()
+        dataframe = self.prepare(tracker)
+        self.assertEqual(tracker.frames, 1)
+        pandas.testing.assert_frame_equal(
+            dataframe, expected, check_dtype=False)
+
+    def testSubsets(self):
+
+        for kwargs in ({"tracks": "track1,track3"},
+                       {"slices": "slice1,slice4"},
+                       {"tracks": "track2", "slices": "slice3,slice4"}):
+            tracker = FrameTracker()
+            pandas.testing.assert_frame_equal(
+                self.prepare(tracker, **kwargs),
+                self.prepare(ScalarTracker(), **kwargs),
+                check_dtype=False)
+            self.assertEqual(tracker.frames, 1)
+
+        # paths that are not all combinations of tracks and slices
+        # are collected individually
+        dataframe = self.prepare(FrameTracker(),
+                                 exclude="track1,slice1")
+        self.assertEqual(len(dataframe), 9)
+
+    def testOverriddenCallIsUsed(self):
+
+        tracker = DerivedFrameTracker()
+        dataframe = self.prepare(tracker)
+        self.assertEqual(tracker.frames, 0)
+        self.assertEqual(dataframe.loc["track1", "slice2"], -12)
+
+
+class TestPathFiltering(unittest.TestCase):
+    '''test restrict and exclude options.'''
+
+    def prepare(self, transformers=[], **kwargs):
+        tracker = CountingTracker()
+        dispatcher = Dispatcher(tracker, None, transformers)
+        dispatcher.parseArguments(nocache=True, **kwargs)
+        dispatcher.prepare()
+        return tracker.calls, dispatcher.data
+
+    def testRestrictBeforeCollection(self):
+
+        calls, data = self.prepare(restrict="track1,slice2")
+        self.assertEqual(calls, 1)
+
+        # regular expressions might match levels created later
+        calls, data = self.prepare(restrict="track1,r(slice[23])")
+        self.assertEqual(calls, 5)
+        self.assertEqual(sorted(set(data.index.get_level_values(1))),
+                         ["slice2", "slice3"])
+
+    def testExcludeBeforeCollection(self):
+
+        calls, data = self.prepare(exclude="r(track[1-9])")
+        self.assertEqual(calls, 5)
+        self.assertEqual(set(data.index.get_level_values(0)), set(["track0"]))
+
+    def testTransformersChangeIndex(self):
+
+        # paths are not removed before transformers have been applied
+        calls, data = self.prepare(transformers=[RenamingTransformer()],
+                                   exclude="track1")
+        self.assertEqual(calls, 50)
+        self.assertEqual(len(data), 100)
+        self.assertTrue("renamed" in data.index.get_level_values(0))
+
+    def testFilterAfterCollection(self):
+
+        # patterns not matching any path are applied after collection
+        calls, data = self.prepare(exclude="value")
+        self.assertEqual(calls, 50)
+        self.assertEqual(len(data), 0)
+
+        calls, data = self.prepare(restrict="track1,value")
+        self.assertEqual(calls, 5)
+        self.assertEqual(len(data), 10)
+
+    def testFilterIndexLevels(self):
+
+        dispatcher = Dispatcher(CountingTracker(), None, [])
+        index = pandas.MultiIndex.from_arrays(
+            [["track1", "track2", "track1", "track2"],
+             ["slice1", None, "slice2", "other"]])
+        data = pandas.DataFrame({"value": range(4)}, index=index)
+
+        dispatcher.data = data
+        dispatcher.filterPaths(["track1", "r(slice)"], mode="restrict")
+        self.assertEqual(list(dispatcher.data["value"]), [0, 2])
+
+        dispatcher.data = data
+        dispatcher.filterPaths(["r(^s)", "other"], mode="exclude")
+        self.assertEqual(list(dispatcher.data["value"]), [1])
+
+
+class TestSharedCollection(unittest.TestCase):
+    '''test sharing of collected data between directives.'''
+
+    def setUp(self):
+        Cache.get_memory_cache().clear()
+        UncachedTracker.calls = 0
+
+    def collect(self, renderer=None, **kwargs):
+        dispatcher = Dispatcher(UncachedTracker(), renderer, [])
+        dispatcher.parseArguments(**kwargs)
+        return dispatcher.collect()
+
+    def testSameOptionsShareData(self):
+
+        first = self.collect(tracks="track1,track2")
+        second = self.collect(tracks="track1,track2")
+        self.assertEqual(UncachedTracker.calls, 10)
+        self.assertEqual(list(first.keys()), list(second.keys()))
+
+        # shared data can be modified without affecting others
+        del second["track1"]
+        self.assertEqual(list(self.collect(tracks="track1,track2").keys()),
+                         ["track1", "track2"])
+        self.assertEqual(UncachedTracker.calls, 10)
+
+    def testDifferentOptionsCollectSeparately(self):
+
+        self.collect(restrict="track1")
+        self.collect(restrict="track2")
+        self.assertEqual(UncachedTracker.calls, 10)
+
+    def testDifferentRenderersCollectSeparately(self):
+
+        self.collect()
+        self.collect(PathRenderer())
+        self.assertEqual(UncachedTracker.calls, 100)
+        self.collect(PathRenderer())
+        self.assertEqual(UncachedTracker.calls, 100)
+
+    def testClearTrees(self):
+
+        self.collect(tracks="track1")
+        clear_trees()
+        self.collect(tracks="track1")
+        self.assertEqual(UncachedTracker.calls, 10)
+
+    def testConcurrentDirectives(self):
+
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(self.collect()))
+            for x in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(UncachedTracker.calls, 50)
+        self.assertEqual(len(results), 4)
+
+
+class TestParallelRendering(unittest.TestCase):
+    '''test rendering of groups in parallel.'''
+
+    def render(self, renderer, **kwargs):
+        dispatcher = Dispatcher(SafePathTracker(), renderer, [])
+        return dispatcher(nocache=True, groupby="track", **kwargs)
+
+    def testOrderIsPreserved(self):
+
+        serial = self.render(PathRenderer())
+        parallel = self.render(PathRenderer(),
+                               **{"parallel-render": "",
+                                  "render-jobs": 4})
+        self.assertEqual([x.title for x in parallel],
+                         [x.title for x in serial])
+        self.assertTrue(all([x.text != str(os.getpid()) for x in parallel]))
+
+    def testSerialFallback(self):
+
+        # results that can not be returned are rendered serially
+        result = self.render(UnpicklableRenderer(),
+                             **{"parallel-render": ""})
+        self.assertEqual(len(result), 10)
+        self.assertTrue(all([x.text == str(os.getpid()) for x in result]))
+
+        # without collectors, images are collected after rendering
+        renderer = PathRenderer()
+        renderer.collectors = None
+        result = self.render(renderer, **{"parallel-render": ""})
+        self.assertTrue(all([x.text == str(os.getpid()) for x in result]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+'''unit testing code for the CGATReport manifest
+'''
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from CGATReport import Manifest
+
+
+class TestManifest(unittest.TestCase):
+    '''test recording directives in the manifest.'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmpdir, "plot.png")
+        with open(self.output, "w") as outf:
+            outf.write("png")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testOutdatedReason(self):
+
+        manifest = Manifest.Manifest(self.tmpdir)
+        self.assertEqual(manifest.getOutdatedReason("plot", "a"),
+                         "not in manifest")
+
+        manifest.update("plot", "index.rst", 10, "Trackers.Data", "a",
+                        [("csvdb", 1, 2)], [self.output])
+        # changes are visible in other connections
+        manifest = Manifest.Manifest(self.tmpdir)
+        record = manifest.get("plot")
+        self.assertEqual(record["sources"], [["csvdb", 1, 2]])
+        self.assertEqual(manifest.getOutdatedReason("plot", "a"), None)
+        self.assertEqual(manifest.getOutdatedReason("plot", "b"),
+                         "tracker, options or data sources changed")
+
+        os.unlink(self.output)
+        self.assertEqual(manifest.getOutdatedReason("plot", "a"),
+                         "file %s is missing" % self.output)
+
+    def testArtifacts(self):
+
+        manifest = Manifest.Manifest(self.tmpdir)
+        manifest.update("plot", "index.rst", 10, "Trackers.Data", "a",
+                        [], [self.output], options_hash="1234",
+                        text="text\nelement")
+        manifest.update("table", "index.rst", 20, "Trackers.Other", "a",
+                        [], [])
+
+        record = manifest.get("plot")
+        self.assertEqual(record["options_hash"], "1234")
+        self.assertEqual(record["text"], "text\nelement")
+        self.assertEqual(record["artifacts"],
+                         [{"path": self.output,
+                           "size": 3,
+                           "md5": Manifest.get_md5(self.output)}])
+        self.assertEqual(manifest.get("table")["artifacts"], [])
+
+        with open(self.output, "w") as outf:
+            outf.write("changed")
+        self.assertEqual(manifest.getOutdatedReason("plot"),
+                         "file %s has changed" % self.output)
+
+        self.assertEqual([x["name"] for x in manifest.find("Data")],
+                         ["plot"])
+        manifest.remove(["plot"])
+        self.assertEqual([x["name"] for x in manifest.find()], ["table"])
+
+    def testPendingDocuments(self):
+
+        manifest = Manifest.Manifest(self.tmpdir)
+        manifest.update("plot", "index.rst", 10, "Trackers.Data", "a",
+                        [], [], pending=True)
+        manifest.update("table", "other.rst", 10, "Trackers.Data", "a",
+                        [], [], pending=False)
+        self.assertEqual(manifest.getPendingDocuments(), set(["index.rst"]))
+        manifest.clearPending()
+        self.assertEqual(manifest.getPendingDocuments(), set())
+
+    def testManifestIsShared(self):
+
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir)
+        try:
+            manifest = Manifest.get_manifest()
+            self.assertTrue(Manifest.get_manifest() is manifest)
+            db = manifest.connect()
+            self.assertTrue(manifest.connect() is db)
+        finally:
+            os.chdir(cwd)
+
+        # the manifest of a different directory is not shared
+        self.assertFalse(Manifest.get_manifest() is manifest)
+
+        # threads use separate connections
+        connections = []
+        thread = threading.Thread(
+            target=lambda: connections.append(manifest.connect()))
+        thread.start()
+        thread.join()
+        self.assertFalse(connections[0] is db)
+
+        # the database is re-created if it has been removed
+        db.close()
+        os.unlink(manifest.filename)
+        manifest.update("plot", "index.rst", 10, "Trackers.Data", "a",
+                        [], [])
+        self.assertEqual(manifest.get("plot")["document"], "index.rst")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,431 @@
+'''unit testing code for CGATReport SQL trackers
+'''
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import numpy
+import sqlalchemy
+
+from CGATReport import Tracker
+from CGATReport.Dispatcher import Dispatcher
+
+
+class DatabaseTestCase(unittest.TestCase):
+    '''set up sqlite databases for SQL trackers.'''
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfile = os.path.join(self.tmpdir, "csvdb")
+        self.attachfile = os.path.join(self.tmpdir, "other.db")
+        for filename, table in ((self.dbfile, "main_data"),
+                                (self.attachfile, "other_data")):
+            self.createDatabase(filename, table)
+        self.backend = "sqlite:///%s" % self.dbfile
+        Tracker.disposeEngines()
+
+    def tearDown(self):
+        Tracker.disposeEngines()
+        shutil.rmtree(self.tmpdir)
+
+    def createDatabase(self, filename, table):
+        db = sqlite3.connect(filename)
+        db.execute("CREATE TABLE %s (value INT)" % table)
+        db.execute("INSERT INTO %s VALUES (1)" % table)
+        db.commit()
+        db.close()
+
+    def connect(self, **kwargs):
+        tracker = Tracker.TrackerSQL(backend=self.backend, **kwargs)
+        tracker.connect()
+        return tracker
+
+
+class TestEngineRegistry(DatabaseTestCase):
+    '''test sharing of engines between trackers.'''
+
+    def testEngineIsShared(self):
+
+        trackers = [self.connect() for x in range(3)]
+        self.assertTrue(trackers[1].db is trackers[0].db)
+        self.assertTrue(trackers[2].db is trackers[0].db)
+
+        for tracker in trackers:
+            conn = tracker.db.raw_connection()
+            conn.cursor().execute("SELECT * FROM main_data")
+            conn.close()
+
+        statistics = Tracker.getEngineStatistics()
+        self.assertEqual(len(statistics), 1)
+        self.assertEqual(statistics[0]["trackers"], 3)
+        self.assertEqual(statistics[0]["connections"], 1)
+        self.assertEqual(statistics[0]["checkouts"], 3)
+
+    def testAttachedDatabases(self):
+
+        plain = self.connect()
+        attached = self.connect(attach=[(self.attachfile, "other")])
+        self.assertFalse(plain.db is attached.db)
+        self.assertTrue(
+            self.connect(attach=[(self.attachfile, "other")]).db is
+            attached.db)
+
+        for x in range(2):
+            conn = attached.db.raw_connection()
+            self.assertEqual(
+                conn.cursor().execute(
+                    "SELECT value FROM other.other_data").fetchall(),
+                [(1,)])
+            conn.close()
+
+        statistics = dict([(x["attach"], x)
+                           for x in Tracker.getEngineStatistics()])
+        self.assertEqual(
+            statistics[((self.attachfile, "other"),)]["connections"], 1)
+
+    def testParallelCollection(self):
+
+        # more threads than the default size of sqlalchemy pools
+        # hold connections at the same time
+        tracker = ConcurrentTracker(backend=self.backend)
+        tracker.barrier = threading.Barrier(8, timeout=10)
+        dispatcher = Dispatcher(tracker, None, [])
+        dispatcher.parseArguments(nocache=True,
+                                  **{"parallel-collect": "threads",
+                                     "collect-jobs": 8})
+        tree = dispatcher.collect()
+        self.assertEqual(len(tree), 8)
+        self.assertTrue(all([x == [(1,)] for x in tree.values()]))
+
+    def testReplacedDatabase(self):
+
+        tracker = self.connect()
+        conn = tracker.db.raw_connection()
+        conn.cursor().execute("SELECT * FROM main_data")
+        conn.close()
+
+        os.unlink(self.dbfile)
+        self.createDatabase(self.dbfile, "new_data")
+        self.assertFalse(self.connect().db is tracker.db)
+
+
+class ConcurrentTracker(Tracker.TrackerSQL):
+
+    tracks = ["track%i" % x for x in range(8)]
+
+    def __call__(self, track):
+        self.connect()
+        conn = self.db.raw_connection()
+        try:
+            self.barrier.wait()
+            return conn.cursor().execute(
+                "SELECT value FROM main_data").fetchall()
+        finally:
+            conn.close()
+
+
+class TestSchemaCache(DatabaseTestCase):
+    '''test caching of table names and columns.'''
+
+    def testTablesAreCached(self):
+
+        tracker = self.connect()
+        schema = Tracker.getSchemaCache(tracker.db)
+        self.assertTrue(self.connect().hasTable("main_data"))
+        self.assertFalse(tracker.hasTable("new_data"))
+        self.assertEqual(tracker.getColumns("main_data"), ["value"])
+
+        tables = schema.tables
+        self.assertEqual(tables, set(["main_data"]))
+        self.assertTrue(tracker.hasTable("main_data"))
+        self.assertTrue(schema.tables is tables)
+
+        # cache is updated after schema changes
+        db = sqlite3.connect(self.dbfile)
+        db.execute("ALTER TABLE main_data ADD COLUMN name TEXT")
+        db.execute("CREATE TABLE new_data (value INT)")
+        db.commit()
+        db.close()
+
+        self.assertTrue(tracker.hasTable("new_data"))
+        self.assertEqual(tracker.getTables(), ["main_data", "new_data"])
+        self.assertEqual(tracker.getColumns("main_data"),
+                         ["value", "name"])
+
+    def testExpiry(self):
+
+        tracker = self.connect()
+        schema = Tracker.SchemaCache(tracker.db, ttl=1)
+        schema.is_sqlite = False
+        tables = schema.getTableNames()
+        self.assertTrue(schema.getTableNames() is tables)
+        schema.version -= 1
+        self.assertFalse(schema.getTableNames() is tables)
+
+
+class StatementTracker(Tracker.TrackerSQL):
+
+    table = "main_data"
+    column = "value"
+
+    @property
+    def tracks(self):
+        raise AssertionError("tracks should not be accessed")
+
+    def __call__(self, track, slice=None):
+        return self.prepareStatement(
+            "SELECT %(column)s FROM %(table)s WHERE name = '%(slice)s'")
+
+
+class TestStatement(unittest.TestCase):
+    '''test parsing and binding of SQL statements.'''
+
+    def testBind(self):
+
+        statement = Tracker.Statement(
+            "SELECT value FROM %(track)s_data WHERE name = '%(slice)s' "
+            "AND x > %(min)i AND y LIKE '%%%(pattern)s' AND z < %(max)5.2f")
+        self.assertEqual(statement.names,
+                         ["track", "slice", "min", "pattern", "max"])
+
+        values = {"track": "main", "slice": "a'b", "min": 2.5,
+                  "pattern": "c", "max": 3.0, "unused": None}
+        self.assertEqual(
+            statement.bind(values),
+            ("SELECT value FROM main_data WHERE name = :slice "
+             "AND x > :min AND y LIKE '%c' AND z <  3.00",
+             {"slice": "a'b", "min": 2}))
+        self.assertEqual(
+            statement.interpolate(values),
+            "SELECT value FROM main_data WHERE name = 'a'b' "
+            "AND x > 2 AND y LIKE '%c' AND z <  3.00")
+
+    def testValuePositions(self):
+
+        statement = Tracker.Statement(
+            "SELECT * FROM t WHERE x BETWEEN %(lo)i AND %(hi)i "
+            "AND name IN ('%(a)s', '%(b)s') LIMIT %(limit)i")
+        self.assertEqual(
+            statement.bind({"lo": 1, "hi": 2, "a": "x", "b": "y",
+                            "limit": 10}),
+            ("SELECT * FROM t WHERE x BETWEEN :lo AND :hi "
+             "AND name IN (:a, :b) LIMIT :limit",
+             {"lo": 1, "hi": 2, "a": "x", "b": "y", "limit": 10}))
+
+    def testIdentifiers(self):
+
+        # placeholders that are not values are interpolated
+        statement = Tracker.Statement(
+            "SELECT '%(track)s' AS track, value FROM '%(table)s' "
+            "WHERE x = %(x)i ORDER BY %(n)i")
+        self.assertEqual(
+            statement.bind({"track": "a", "table": "main_data",
+                            "x": 1, "n": 2}),
+            ("SELECT 'a' AS track, value FROM 'main_data' "
+             "WHERE x = :x ORDER BY 2",
+             {"x": 1}))
+
+        statement = Tracker.Statement(
+            "SELECT value FROM '%(table)s' ORDER BY %(n)i")
+        self.assertFalse(statement.has_params)
+
+    def testWithoutParameters(self):
+
+        statement = Tracker.Statement(
+            "SELECT strftime('%%H:%%M', t) FROM %(track)s")
+        self.assertEqual(statement.bind({"track": "x"}),
+                         ("SELECT strftime('%H:%M', t) FROM x", {}))
+
+    def testEscapeColons(self):
+
+        statement = Tracker.Statement(
+            "SELECT '12:00' FROM %(track)s WHERE x = %(x)i")
+        self.assertEqual(statement.bind({"track": "t", "x": 1}),
+                         ("SELECT '12\\:00' FROM t WHERE x = :x",
+                          {"x": 1}))
+
+    def testStatementsAreShared(self):
+
+        self.assertTrue(Tracker.getStatement("SELECT %(x)i") is
+                        Tracker.getStatement("SELECT %(x)i"))
+
+    def testValues(self):
+
+        tracker = StatementTracker(backend="sqlite:///csvdb")
+        self.assertEqual(
+            tracker("track", "slice"),
+            ("SELECT value FROM main_data WHERE name = :slice",
+             {"slice": "slice"}))
+        self.assertRaises(KeyError, tracker.prepareStatement, "%(missing)s")
+
+
+class TestFetchArrays(unittest.TestCase):
+    '''test conversion of SQL results to arrays.'''
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine("sqlite://")
+        self.conn = self.engine.connect()
+        self.conn.exec_driver_sql(
+            "CREATE TABLE data (name TEXT, count INT, value REAL)")
+        self.conn.exec_driver_sql(
+            "INSERT INTO data VALUES (?, ?, ?)",
+            [("a%i" % x, x, None if x == 3 else x / 2.0)
+             for x in range(10)])
+
+    def tearDown(self):
+        self.conn.close()
+        self.engine.dispose()
+
+    def testArrays(self):
+
+        data = Tracker.fetchArrays(
+            self.conn.exec_driver_sql("SELECT * FROM data"), size=3)
+        self.assertEqual(list(data.keys()), ["name", "count", "value"])
+        self.assertEqual(data["name"].dtype, object)
+        self.assertEqual(list(data["name"]), ["a%i" % x for x in range(10)])
+        self.assertEqual(data["count"].dtype.kind, "i")
+        self.assertEqual(list(data["count"]), list(range(10)))
+        self.assertEqual(data["value"].dtype, float)
+        self.assertTrue(numpy.isnan(data["value"][3]))
+        self.assertEqual(data["value"][4], 2.0)
+
+    def testEmpty(self):
+
+        self.assertEqual(
+            Tracker.fetchArrays(self.conn.exec_driver_sql(
+                "SELECT * FROM data WHERE count > 10")), {})
+
+    def testMixedTypes(self):
+
+        self.assertEqual(Tracker.toArray(("a", 1)).dtype, object)
+        self.assertEqual(list(Tracker.toArray(("a", 1))), ["a", 1])
+        self.assertEqual(Tracker.toArray((1, None)).dtype, float)
+
+
+class RowsTracker(Tracker.SingleTableTrackerRows):
+
+    table = "rows_data"
+
+    def execute(self, stmt, params=None):
+        self.connect()
+        if not hasattr(self, "conn"):
+            self.conn = self.db.connect()
+        return self.conn.exec_driver_sql(stmt)
+
+
+class LegacyRowsTracker(RowsTracker):
+
+    def _load(self):
+        self._tracks = [("x",)]
+        self._slices = ["a"]
+        self.data = {("x",): {"a": 10}}
+        self.loaded = True
+
+
+class TestRowsTracker(DatabaseTestCase):
+    '''test trackers with a track in each row of a table.'''
+
+    def setUp(self):
+        DatabaseTestCase.setUp(self)
+        db = sqlite3.connect(self.dbfile)
+        db.execute("CREATE TABLE rows_data "
+                   "(track TEXT, rep TEXT, a INT, b INT, c REAL)")
+        db.executemany("INSERT INTO rows_data VALUES (?, ?, ?, ?, ?)",
+                       [("x", "1", 1, None, 1.5),
+                        ("y", "1", 2, 3, None)])
+        db.commit()
+        db.close()
+        self.trackers = []
+
+    def tearDown(self):
+        for tracker in self.trackers:
+            if hasattr(tracker, "conn"):
+                tracker.conn.close()
+        DatabaseTestCase.tearDown(self)
+
+    def createTracker(self, tracker_class):
+        tracker = tracker_class(backend=self.backend)
+        self.trackers.append(tracker)
+        return tracker
+
+    def testValues(self):
+
+        tracker = self.createTracker(RowsTracker)
+        tracker.exclude_columns = ("rep",)
+        self.assertEqual(tracker("x", "a"), 1)
+        self.assertTrue(type(tracker("x", "a")) is int)
+        self.assertEqual(tracker("x", "b"), None)
+        self.assertEqual(tracker("y", "b"), 3.0)
+        self.assertEqual(tracker("y", "c"), None)
+        self.assertEqual(tracker.data[("x",)],
+                         {"a": 1, "b": None, "c": 1.5})
+
+        # values are taken from the dictionary once it has been used
+        tracker.data[("x",)]["a"] = 5
+        self.assertEqual(tracker("x", "a"), 5)
+        self.assertEqual(tracker.getBatchFrame([("x", "a")]), None)
+
+    def testLegacyData(self):
+
+        tracker = self.createTracker(LegacyRowsTracker)
+        self.assertEqual(tracker("x", "a"), 10)
+        self.assertEqual(tracker.getBatchFrame([("x", "a")]), None)
+
+    def testLevelNames(self):
+
+        tracker = self.createTracker(RowsTracker)
+        tracker.fields = ("track", "rep")
+        frame = tracker.getBatchFrame(
+            [(track, slice) for track in tracker.tracks
+             for slice in ("a", "b")])
+        self.assertEqual(list(frame.index.names), ["track", "slice"])
+        self.assertEqual(list(frame.index), [("x", "1"), ("y", "1")])
+
+
+class ColumnsTracker(Tracker.SingleTableTrackerColumns):
+
+    table = "data"
+    column = "bin"
+
+    def __init__(self, conn):
+        Tracker.SingleTableTrackerColumns.__init__(
+            self, backend="sqlite://")
+        self.conn = conn
+
+    def execute(self, stmt, params=None):
+        return self.conn.exec_driver_sql(stmt)
+
+
+class TestBatchFrame(unittest.TestCase):
+    '''test collection of single-table trackers as dataframes.'''
+
+    def setUp(self):
+        self.engine = sqlalchemy.create_engine("sqlite://")
+        self.conn = self.engine.connect()
+        self.conn.exec_driver_sql(
+            "CREATE TABLE data (bin INT, a REAL, b REAL)")
+        self.conn.exec_driver_sql(
+            "INSERT INTO data VALUES (?, ?, ?)",
+            [(100, 1.0, None), (200, 2.0, None), (300, None, None)])
+
+    def tearDown(self):
+        self.conn.close()
+        self.engine.dispose()
+
+    def testMissingValues(self):
+
+        # track b and slice 300 have no values and are removed
+        frame = ColumnsTracker(self.conn).getBatchFrame(
+            [(track, slice) for track in ("a", "b")
+             for slice in (100, 200, 300)])
+        self.assertEqual(list(frame.index), ["a"])
+        self.assertEqual(list(frame.columns), [100, 200])
+        self.assertEqual(list(frame.loc["a"]), [1.0, 2.0])
+
+
+if __name__ == "__main__":
+    unittest.main()